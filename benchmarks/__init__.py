@@ -0,0 +1 @@
+"""Offline benchmarks for the survey intake pipeline; run with `python -m benchmarks.<name>`."""
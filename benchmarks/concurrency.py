@@ -0,0 +1,139 @@
+"""Load benchmark of concurrent survey turns: one thread per session against the shared event loop.
+
+Every session sends the intake turn to its own Conversation backed by the fake
+model provider. The threaded baseline calls `Conversation.__call__` from one
+thread per session, as Streamlit script threads do; the async run schedules
+`Conversation.acall` for every session on one event loop. Reports wall time,
+p50/p95 turn latency, throughput and peak thread count per session count, and
+the most sessions whose p95 stays within `--slo` times the single-session
+latency:
+
+    python -m benchmarks.concurrency --sessions 10 50 200
+"""
+import argparse
+import asyncio
+import logging
+import threading
+import time
+
+from langchain_core.messages import HumanMessage
+
+import main as app
+from benchmarks.pipeline import NEIGHBOURHOOD, NullContainer, percentile
+from llm_utils.conversation import Conversation
+from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
+
+
+class ThreadCounter:
+    """Samples the number of live threads from a daemon thread."""
+
+    def __init__(self, interval=0.01):
+        self.interval = interval
+        self.peak = threading.active_count()
+        self.stopped = threading.Event()
+
+    def __enter__(self):
+        threading.Thread(target=self.run, daemon=True).start()
+        return self
+
+    def __exit__(self, *exc_info):
+        self.stopped.set()
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            self.peak = max(self.peak, threading.active_count())
+
+
+def create_conversations(count, latencies):
+    return [Conversation({}, "fake", "fake", fake_model_options=latencies)
+            for _ in range(count)]
+
+
+def new_turn():
+    return (HumanMessage(content=app.get_offence_risk(NEIGHBOURHOOD)),
+            StreamUntilSpecialTokenHandler(NullContainer(), flush_interval=0.1, flush_tokens=20))
+
+
+def run_threaded(conversations):
+    """Run one turn per conversation, each on its own thread; return the turn latencies."""
+    latencies = []
+    lock = threading.Lock()
+
+    def session(conversation):
+        start = time.perf_counter()
+        conversation(*new_turn())
+        with lock:
+            latencies.append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=session, args=(conversation,))
+               for conversation in conversations]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return latencies
+
+
+def run_async(conversations):
+    """Run one turn per conversation as tasks on one event loop; return the turn latencies."""
+
+    async def session(conversation):
+        start = time.perf_counter()
+        await conversation.acall(*new_turn())
+        return time.perf_counter() - start
+
+    async def sessions():
+        return await asyncio.gather(*(session(conversation) for conversation in conversations))
+
+    return asyncio.run(sessions())
+
+
+def measure(runner, count, latencies):
+    """Return wall time, latency percentiles, throughput and peak threads of one load level."""
+    conversations = create_conversations(count, latencies)
+    with ThreadCounter() as threads:
+        start = time.perf_counter()
+        turn_latencies = sorted(runner(conversations))
+        wall = time.perf_counter() - start
+    return {
+        "sessions": count,
+        "wall_s": wall,
+        "p50_s": percentile(turn_latencies, 0.50),
+        "p95_s": percentile(turn_latencies, 0.95),
+        "turns_per_s": count / wall,
+        "peak_threads": threads.peak,
+    }
+
+
+def main():
+    """Print the load figures of the threaded and async runs at each session count."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, nargs="*", default=[10, 50, 200])
+    parser.add_argument("--first-token-latency", type=float, default=0.2)
+    parser.add_argument("--token-latency", type=float, default=0.005)
+    parser.add_argument("--slo", type=float, default=2.0,
+                        help="Allowed p95 as a multiple of the single-session latency")
+    args = parser.parse_args()
+
+    logging.getLogger("llm_utils").setLevel(logging.ERROR)
+    latencies = {"first_token_latency": args.first_token_latency,
+                 "token_latency": args.token_latency}
+    print(f"{'mode':<9} {'sessions':>8} {'wall s':>8} {'p50 s':>8} {'p95 s':>8} "
+          f"{'turns/s':>8} {'threads':>8}")
+    for mode, runner in (("threaded", run_threaded), ("async", run_async)):
+        baseline = measure(runner, 1, latencies)["p95_s"]
+        served = 0
+        for count in args.sessions:
+            stats = measure(runner, count, latencies)
+            if stats["p95_s"] <= baseline * args.slo:
+                served = max(served, count)
+            print(f"{mode:<9} {count:>8} {stats['wall_s']:>8.2f} {stats['p50_s']:>8.2f} "
+                  f"{stats['p95_s']:>8.2f} {stats['turns_per_s']:>8.1f} "
+                  f"{stats['peak_threads']:>8}")
+        print(f"{mode}: single-session turn {baseline:.2f} s; most sessions with p95 within "
+              f"{args.slo:g}x: {served or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
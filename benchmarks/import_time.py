@@ -0,0 +1,71 @@
+"""Measure cold import time of the app modules with `python -X importtime` and flag regressions.
+
+Exits non-zero if an import exceeds its threshold or eagerly loads one of the
+heavy geo, plotting or LLM provider modules that should only load on first use.
+"""
+import argparse
+import subprocess
+import sys
+from pathlib import Path
+
+ROOT = Path(__file__).resolve().parent.parent
+
+# Cumulative import time budget in milliseconds per module.
+THRESHOLDS_MS = {
+    "main": 4000,
+    "llm_utils.conversation": 2500,
+    "llm_utils.maps": 1500,
+    "llm_utils.risk_maps": 300,
+    "llm_utils.neighbourhood_resolver": 300,
+}
+
+HEAVY_MODULES = (
+    "geopandas",
+    "matplotlib",
+    "seaborn",
+    "shapely",
+    "langchain_openai",
+    "langchain_google_genai",
+)
+
+
+def import_profile(module):
+    """Import a module in a fresh interpreter and return {module: cumulative microseconds}."""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=ROOT, capture_output=True, text=True, check=True)
+    profile = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        profile[name.strip()] = int(cumulative)
+    return profile
+
+
+def main():
+    """Print import times and heavy modules per app module, failing on regressions."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--scale", type=float, default=1.0,
+                        help="Multiply every threshold, e.g. on slower machines")
+    args = parser.parse_args()
+
+    failures = []
+    for module, threshold in THRESHOLDS_MS.items():
+        profile = import_profile(module)
+        elapsed = profile[module] / 1000
+        heavy = [name for name in HEAVY_MODULES if name in profile]
+        print(f"{module}: {elapsed:.1f} ms (threshold {threshold * args.scale:.0f} ms), "
+              f"heavy modules loaded: {', '.join(heavy) or 'none'}")
+        if elapsed > threshold * args.scale:
+            failures.append(f"{module} took {elapsed:.1f} ms")
+        if heavy:
+            failures.append(f"{module} eagerly imported {', '.join(heavy)}")
+
+    for failure in failures:
+        print(f"REGRESSION: {failure}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,213 @@
+"""End-to-end benchmark of the survey turn pipeline, stage by stage, with the fake model provider.
+
+Reports p50/p95/p99 latency, throughput and tracemalloc allocations per stage
+and saves them as JSON so runs can be compared between commits:
+
+    python -m benchmarks.pipeline --output before.json
+    python -m benchmarks.pipeline --compare before.json
+"""
+import argparse
+import json
+import logging
+import statistics
+import subprocess
+import time
+import tracemalloc
+from pathlib import Path
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+import main as app
+from llm_utils.agents import UIAgent
+from llm_utils.conversation import Conversation
+from llm_utils.fake_models import FakeChatModel, canned_responses, tokenize_response
+from llm_utils.prompt_assembly import prompt_assembly
+from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
+from llm_utils.survey_record import SurveyRecord
+from streamlit_utils.ui_creator import display_ui_from_response, parse_ui_spec
+
+ROOT = Path(__file__).resolve().parent.parent
+RESULTS_DIR = ROOT / "benchmarks" / "results"
+NEIGHBOURHOOD = "Annex (95)"
+ANSWERS = {"Transportation Method": "Car", "Safety Apps": "No",
+           "Crime Types": ["Assault", "Robbery"]}
+# Missing its title, so it fails validation and the title is re-queried.
+INVALID_UI_RESPONSE = json.dumps({"ui_elements": [
+    {"type": "Checkbox", "label": "Do you walk home at night?"}]})
+
+
+class NullContainer:
+    """Stands in for the Streamlit placeholder the stream handler renders into."""
+
+    def markdown(self, text):
+        pass
+
+
+def percentile(samples, fraction):
+    """Return a percentile of sorted samples by linear interpolation."""
+    position = (len(samples) - 1) * fraction
+    lower = int(position)
+    upper = min(lower + 1, len(samples) - 1)
+    return samples[lower] + (samples[upper] - samples[lower]) * (position - lower)
+
+
+def measure(function, iterations, warmup):
+    """Time each call, then repeat the calls under tracemalloc to count allocations."""
+    for _ in range(warmup):
+        function()
+    durations = []
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call_start = time.perf_counter()
+        function()
+        durations.append(time.perf_counter() - call_start)
+    elapsed = time.perf_counter() - start
+
+    allocation_iterations = max(1, iterations // 10)
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    tracemalloc.reset_peak()
+    for _ in range(allocation_iterations):
+        function()
+    _, peak = tracemalloc.get_traced_memory()
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    allocated = sum(stat.size_diff for stat in after.compare_to(before, "filename")
+                    if stat.size_diff > 0)
+
+    durations.sort()
+    return {
+        "iterations": iterations,
+        "p50_ms": percentile(durations, 0.50) * 1000,
+        "p95_ms": percentile(durations, 0.95) * 1000,
+        "p99_ms": percentile(durations, 0.99) * 1000,
+        "mean_ms": statistics.fmean(durations) * 1000,
+        "throughput_per_s": iterations / elapsed,
+        "allocated_bytes_per_call": allocated / allocation_iterations,
+        "peak_bytes": peak,
+    }
+
+
+def build_stages():
+    """Return {stage name: zero-argument callable} for every pipeline stage."""
+    conversational_texts = canned_responses("conversational")
+    ui_texts = canned_responses("ui")
+    conversation = Conversation({}, "fake", "fake", fake_model_options={
+        "first_token_latency": 0.0, "token_latency": 0.0})
+
+    def conversation_turn():
+        if len(conversation.conversational_agent.memory) > 20:
+            conversation.conversational_agent.memory.clear()
+        conversation(HumanMessage(content=app.get_offence_risk(NEIGHBOURHOOD)),
+                     StreamUntilSpecialTokenHandler(NullContainer()))
+
+    tokens = tokenize_response(conversational_texts[0])
+
+    def stream_handler():
+        handler = StreamUntilSpecialTokenHandler(NullContainer(), flush_tokens=20)
+        for token in tokens:
+            handler.on_llm_new_token(token)
+        handler.on_llm_end(None)
+        handler.get_split_response()
+
+    ui_agent = UIAgent(FakeChatModel(responses=ui_texts))
+    retrying_ui_agent = UIAgent(FakeChatModel(responses=[INVALID_UI_RESPONSE, ui_texts[0]]))
+    # Cut off before the closing brackets, so it is repaired without a re-query.
+    repairing_ui_agent = UIAgent(FakeChatModel(responses=[ui_texts[0][:-2]]))
+    suffix = "␃" + conversational_texts[0].split("␃", 1)[1]
+
+    def survey_turn():
+        record = SurveyRecord()
+        prompt_assembly(ANSWERS, "", record)
+        record.to_json()
+
+    json_response = json.dumps(dict(json.loads(ui_texts[0]), text=conversational_texts[0]))
+    message = AIMessage(content=json_response,
+                        additional_kwargs={"ui_spec": parse_ui_spec(json_response)})
+    unparsed_message = AIMessage(content=json_response)
+
+    def render_unparsed():
+        parse_ui_spec.cache_clear()
+        display_ui_from_response(unparsed_message, 0, -1)
+
+    return {
+        "conversation_turn": conversation_turn,
+        "stream_handler": stream_handler,
+        "ui_agent_parse": lambda: ui_agent(suffix),
+        "ui_agent_invalid_response": lambda: retrying_ui_agent(suffix),
+        "ui_agent_truncated_response": lambda: repairing_ui_agent(suffix),
+        "prompt_assembly": survey_turn,
+        "get_offence_risk": lambda: app.get_offence_risk(NEIGHBOURHOOD),
+        "display_ui_from_response": lambda: display_ui_from_response(message, 0, -1),
+        "display_ui_from_response_unparsed": render_unparsed,
+    }
+
+
+def git_commit():
+    """Return the current commit hash, or None outside a git checkout."""
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                              capture_output=True, text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(results, baseline_path, tolerance):
+    """Print p95 changes against a saved run and return the stages that regressed."""
+    baseline = json.loads(Path(baseline_path).read_text(encoding="utf-8"))
+    regressions = []
+    for stage, stats in results["stages"].items():
+        before = baseline["stages"].get(stage)
+        if before is None:
+            continue
+        change = stats["p95_ms"] / before["p95_ms"] - 1 if before["p95_ms"] else 0.0
+        print(f"{stage}: p95 {before['p95_ms']:.3f} -> {stats['p95_ms']:.3f} ms "
+              f"({change:+.0%}) vs {baseline.get('commit')}")
+        if change > tolerance:
+            regressions.append(stage)
+    return regressions
+
+
+def main():
+    """Benchmark every stage, print a summary and save the results as JSON."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--iterations", type=int, default=200)
+    parser.add_argument("--warmup", type=int, default=10)
+    parser.add_argument("--stages", nargs="*", help="Only run these stages")
+    parser.add_argument("--output", default=None,
+                        help="JSON file to write, by default results/pipeline-<commit>.json")
+    parser.add_argument("--compare", help="Earlier results to compare p95 latencies against")
+    parser.add_argument("--tolerance", type=float, default=0.2,
+                        help="Relative p95 increase reported as a regression")
+    args = parser.parse_args()
+
+    # The invalid-response stage logs a validation warning on every call.
+    logging.getLogger("llm_utils").setLevel(logging.ERROR)
+    stages = build_stages()
+    results = {"commit": git_commit(), "timestamp": time.time(), "stages": {}}
+    print(f"{'stage':<36} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} "
+          f"{'ops/s':>10} {'alloc KiB':>10}")
+    for name, function in stages.items():
+        if args.stages and name not in args.stages:
+            continue
+        stats = measure(function, args.iterations, args.warmup)
+        results["stages"][name] = stats
+        print(f"{name:<36} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+              f"{stats['p99_ms']:>9.3f} {stats['throughput_per_s']:>10.0f} "
+              f"{stats['allocated_bytes_per_call'] / 1024:>10.1f}")
+
+    output = Path(args.output or RESULTS_DIR / f"pipeline-{results['commit'] or 'local'}.json")
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(results, indent=2), encoding="utf-8")
+    print(f"Saved {output}")
+
+    if args.compare:
+        regressions = compare(results, args.compare, args.tolerance)
+        if regressions:
+            print(f"REGRESSION: {', '.join(regressions)}")
+            raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,90 @@
+"""Compare per-turn prompt construction overhead before and after caching the static templates."""
+import time
+
+from langchain.output_parsers import PydanticOutputParser
+from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate, PromptTemplate
+from langchain.schema import StrOutputParser
+from langchain_core.messages import AIMessage, HumanMessage
+from langchain_core.runnables import RunnableLambda
+
+from llm_utils.agents import ConversationalAgent, UIAgent
+from llm_utils.pydantic_models import Output
+
+TURNS = 100
+
+
+def legacy_conversational_turn(agent, memory):
+    """Rebuild the conversational prompt and chain as every turn used to."""
+    few_shot_prompt = FewShotChatMessagePromptTemplate(
+        example_prompt=agent.example_prompt,
+        examples=list(agent.few_shot_examples),
+    )
+    prompt = ChatPromptTemplate.from_messages(
+        [("system", agent.system_prompt), few_shot_prompt] + memory)
+    chain = prompt | agent.model | StrOutputParser()
+    return chain, prompt.format_messages()
+
+
+def cached_conversational_turn(agent, memory):
+    """Reuse the agent's prebuilt prompt and chain, only filling in the memory."""
+    return agent.chain, agent.prompt.format_messages(history=memory)
+
+
+def legacy_ui_turn(agent, message):
+    """Rebuild the parser, format instructions and prompt as every call used to."""
+    parser = PydanticOutputParser(pydantic_object=Output)
+    prompt = PromptTemplate(
+        template="{system_prompt}\n{format_instructions}\n{message}",
+        input_variables=["message"],
+        partial_variables={"system_prompt": agent.system_prompt,
+                           "format_instructions": parser.get_format_instructions()},
+    )
+    chain = prompt | agent.model | parser
+    return chain, prompt.format(message=message)
+
+
+def cached_ui_turn(agent, message):
+    """Reuse the agent's prebuilt parser, prompt and chain."""
+    return agent.chain, agent.prompt.format(message=message)
+
+
+def run(turn, agent, make_input, memory=None):
+    """Time `TURNS` simulated turns and return the total in milliseconds."""
+    if memory is not None:
+        memory.clear()
+    start = time.perf_counter()
+    for index in range(TURNS):
+        turn(agent, make_input(index))
+    return (time.perf_counter() - start) * 1000
+
+
+def main():
+    """Print the construction overhead of both agents before and after caching."""
+    model = RunnableLambda(lambda _: "")
+    conversational_agent = ConversationalAgent(model)
+    ui_agent = UIAgent(model)
+
+    memory = []
+
+    def grow_memory(index):
+        memory.extend([HumanMessage(content=f"Question {index}: Yes;"),
+                       AIMessage(content=f"Answer {index} ␃ Next question?")])
+        return list(memory)
+
+    def ui_message(index):
+        return f"␃ Question {index}? Options: Yes, No"
+
+    results = {
+        "conversational": (
+            run(legacy_conversational_turn, conversational_agent, grow_memory, memory),
+            run(cached_conversational_turn, conversational_agent, grow_memory, memory)),
+        "ui": (run(legacy_ui_turn, ui_agent, ui_message),
+               run(cached_ui_turn, ui_agent, ui_message)),
+    }
+    for name, (before, after) in results.items():
+        print(f"{name}: {TURNS} turns, before {before:.1f} ms, after {after:.1f} ms, "
+              f"speedup {before / after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,45 @@
+"""Measure neighbourhood resolution throughput for a batch of random points over Toronto."""
+import time
+
+import numpy as np
+import shapely
+
+from llm_utils.neighbourhood_resolver import NeighbourhoodResolver
+
+POINTS = 100_000
+
+
+def main():
+    """Print load time, batch throughput and single-point latency of the resolver."""
+    start = time.perf_counter()
+    NeighbourhoodResolver.from_shapefile()
+    shapefile_load_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    resolver = NeighbourhoodResolver.from_geometry_cache()
+    load_time = time.perf_counter() - start
+
+    xmin, ymin, xmax, ymax = shapely.total_bounds(resolver.geometries)
+    rng = np.random.default_rng(0)
+    lons = rng.uniform(xmin, xmax, POINTS)
+    lats = rng.uniform(ymin, ymax, POINTS)
+
+    start = time.perf_counter()
+    names, _ = resolver.resolve_many(lats, lons)
+    batch_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    for lat, lon in zip(lats[:1000], lons[:1000]):
+        resolver.resolve(lat, lon)
+    single_time = (time.perf_counter() - start) / 1000
+
+    inside = sum(name is not None for name in names)
+    print(f"load: {shapefile_load_time * 1000:.1f} ms from the shapefile, "
+          f"{load_time * 1000:.1f} ms from the geometry cache")
+    print(f"batch: {POINTS} points in {batch_time * 1000:.1f} ms "
+          f"({POINTS / batch_time:,.0f} points/s, {inside} inside a neighbourhood)")
+    print(f"single: {single_time * 1e6:.1f} us per point")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,151 @@
+"""Simulate the model call scheduler under a burst of sessions, on a fake clock and a stub model.
+
+The simulation replays a burst of survey turns against the configured limits
+of one model without sleeping: each session makes an interactive
+conversational call and then a background UI agent call, and the clock jumps
+from one completion or bucket refill to the next. It runs once with
+priorities and once with every call queued first come first served, and
+reports the wait percentiles per priority, the peak queue depth and the
+busiest minute against the limits. It exits with an error if the busiest
+minute exceeds a limit.
+
+The stub run then sends interactive and background calls at the same time
+through ScheduledChatModel wrapping the fake model, with one slot, and reports
+the order in which they finished:
+
+    python -m benchmarks.scheduler --sessions 100 --model gpt-4-turbo
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import logging
+
+from langchain_core.messages import HumanMessage
+
+from benchmarks.pipeline import percentile
+from llm_utils.config_loader import shared_config
+from llm_utils.fake_models import FakeChatModel
+from llm_utils.scheduler import (BACKGROUND, INTERACTIVE, MODEL_PROVIDERS, PRIORITY_NAMES,
+                                 FakeClock, RequestScheduler, ScheduledChatModel,
+                                 busiest_minute)
+
+# Tokens charged and seconds taken by each call of a survey turn.
+CONVERSATIONAL_CALL = {"tokens": 2000, "seconds": 8.0}
+UI_CALL = {"tokens": 1200, "seconds": 3.0}
+
+
+def simulate(model_name, sessions, arrival_spread, prioritised):
+    """Runs the burst on a fake clock; returns wait figures, queue depth and the busiest minute."""
+    config = shared_config()
+    clock = FakeClock()
+    scheduler = RequestScheduler(config.get("rate_limits", {}),
+                                 config.get("provider_concurrency", {}), clock)
+    provider = MODEL_PROVIDERS.get(model_name, model_name)
+    sequence = itertools.count()
+    events = [(index * arrival_spread / sessions, next(sequence), "arrive", None)
+              for index in range(sessions)]
+    heapq.heapify(events)
+    waiting = []
+    waits = {INTERACTIVE: [], BACKGROUND: []}
+    starts = []
+
+    def submit(call, priority):
+        queued = priority if prioritised else INTERACTIVE
+        ticket = scheduler.submit(model_name, call["tokens"], queued)
+        waiting.append((ticket, call, priority))
+
+    while events or waiting:
+        retries = [ticket.retry_after for ticket, _, _ in waiting
+                   if ticket.retry_after is not None]
+        next_refill = clock.now + min(retries) if retries else float("inf")
+        clock.now = min(events[0][0] if events else float("inf"), next_refill)
+        while events and events[0][0] <= clock.now:
+            _, _, kind, payload = heapq.heappop(events)
+            if kind == "arrive":
+                submit(CONVERSATIONAL_CALL, INTERACTIVE)
+            else:
+                ticket, priority = payload
+                scheduler.release(ticket)
+                if priority == INTERACTIVE:
+                    submit(UI_CALL, BACKGROUND)
+        scheduler.dispatch(provider)
+        for entry in [entry for entry in waiting if entry[0].granted is not None]:
+            ticket, call, priority = entry
+            waiting.remove(entry)
+            waits[priority].append(ticket.wait_time)
+            starts.append((ticket.granted, call["tokens"]))
+            heapq.heappush(events, (clock.now + call["seconds"], next(sequence), "done",
+                                    (ticket, priority)))
+
+    peak_requests, peak_tokens = busiest_minute(starts)
+    result = {"makespan_s": clock.now,
+              "peak_queue_depth": scheduler.snapshot()["providers"][provider]["peak_queue_depth"],
+              "busiest_minute_requests": peak_requests,
+              "busiest_minute_tokens": peak_tokens}
+    for priority, samples in waits.items():
+        samples.sort()
+        name = PRIORITY_NAMES[priority]
+        result[f"{name}_wait_p50_s"] = percentile(samples, 0.50)
+        result[f"{name}_wait_p95_s"] = percentile(samples, 0.95)
+    return result
+
+
+def limits_exceeded(result, limits):
+    """Returns the names of the limits the busiest minute of a simulation went over."""
+    peaks = {"requests_per_minute": result["busiest_minute_requests"],
+             "tokens_per_minute": result["busiest_minute_tokens"]}
+    return [name for name, peak in peaks.items() if limits.get(name) and peak > limits[name]]
+
+
+async def stub_run(calls):
+    """Sends interactive and background calls at once through one slot; returns the finish order."""
+    scheduler = RequestScheduler(concurrency={"fake": 1})
+    stub = FakeChatModel(responses=["ok"], first_token_latency=0.01)
+    models = {priority: ScheduledChatModel(model=stub, model_name="fake", priority=priority,
+                                           scheduler=scheduler)
+              for priority in (INTERACTIVE, BACKGROUND)}
+    finished = []
+
+    async def call(priority):
+        await models[priority].ainvoke([HumanMessage(content="hi")])
+        finished.append(PRIORITY_NAMES[priority][0])
+
+    # Background calls are sent first, so they only finish first without priorities.
+    await asyncio.gather(*[call(BACKGROUND) for _ in range(calls)],
+                         *[call(INTERACTIVE) for _ in range(calls)])
+    return "".join(finished), scheduler.snapshot()["waits"]
+
+
+def main():
+    """Print the simulated waits with and without priorities, then the stub model run."""
+    parser = argparse.ArgumentParser(description=__doc__,
+                                     formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sessions", type=int, default=100)
+    parser.add_argument("--arrival-spread", type=float, default=60.0,
+                        help="Seconds over which the sessions arrive")
+    parser.add_argument("--model", default="gpt-4-turbo")
+    parser.add_argument("--stub-calls", type=int, default=5)
+    args = parser.parse_args()
+
+    logging.getLogger("llm_utils").setLevel(logging.ERROR)
+    limits = shared_config().get("rate_limits", {}).get(args.model, {})
+    print(f"{args.model}: {args.sessions} sessions over {args.arrival_spread:g} s, "
+          f"limits {limits or 'none'}")
+    exceeded = []
+    for mode, prioritised in (("priority", True), ("fifo", False)):
+        result = simulate(args.model, args.sessions, args.arrival_spread, prioritised)
+        print(f"  {mode}: {result}")
+        exceeded.extend(f"{mode} {name}" for name in limits_exceeded(result, limits))
+
+    order, waits = asyncio.run(stub_run(args.stub_calls))
+    print(f"stub model finish order (i=interactive, b=background): {order}")
+    print(f"stub model waits: {waits}")
+
+    if exceeded:
+        print(f"LIMIT EXCEEDED: {', '.join(exceeded)}")
+        raise SystemExit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,56 @@
+"""Compare survey payload cost of re-parsing rendered messages against structured records."""
+import json
+import time
+
+from langchain_core.messages import AIMessage, HumanMessage
+
+from llm_utils.prompt_assembly import prompt_assembly
+from llm_utils.survey_record import SurveyRecord
+
+INTAKE = ("Neighbourhood: Annex (95) - Assault: High, Break and Enter: High, "
+          "Robbery: High, Auto Theft: Low")
+ANSWERS = {"Transportation Method": "Car", "Safety Apps": "No", "Crime Types": ["Assault", "Robbery"]}
+AI_RESPONSE = json.dumps({"title": "Next questions", "text": "x" * 2000, "ui_elements": []})
+REPEATS = 200
+
+
+def legacy_parse(messages):
+    """Rebuild the payload by re-splitting every rendered user message, as main.py used to."""
+    response = {"Neighbourhood": "", "Crime Type": [], "user-context": []}
+    neighbourhood_part, crime_part = messages[0].content.splitlines()[0].split(" - ")
+    response["Neighbourhood"] = neighbourhood_part.replace("Neighbourhood: ", "")
+    response["Crime Type"] = [item.strip() for item in crime_part.split(", ")]
+    for message in messages[2::2]:
+        for selection in message.content.strip().split(";\n"):
+            if selection:
+                question, answer = selection.split(": ", 1)
+                response["user-context"].extend([f"Q: {question}", f"A: {answer.rstrip(';')}"])
+    return json.dumps(response)
+
+
+def timed(function, *args):
+    """Return the mean time of a call in microseconds."""
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        function(*args)
+    return (time.perf_counter() - start) / REPEATS * 1e6
+
+
+def main():
+    """Print per-turn recording cost and submission serialisation cost by conversation length."""
+    print(f"{'turns':>6} {'record/turn us':>15} {'records to_json us':>19} {'legacy parse us':>16}")
+    for turns in (3, 10, 30, 100, 300):
+        record = SurveyRecord()
+        record.record_intake("Annex (95)", [("Assault", "High"), ("Robbery", "High")])
+        messages = [HumanMessage(content=INTAKE), AIMessage(content=AI_RESPONSE)]
+        start = time.perf_counter()
+        for _ in range(turns):
+            messages.append(HumanMessage(content=prompt_assembly(ANSWERS, "", record)))
+            messages.append(AIMessage(content=AI_RESPONSE))
+        record_time = (time.perf_counter() - start) / turns * 1e6
+        print(f"{turns:>6} {record_time:>15.1f} {timed(record.to_json):>19.1f} "
+              f"{timed(legacy_parse, messages):>16.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -1,14 +1,26 @@
 """Module for defining agents that interact with LLMs for conversational and UI responses."""
 from typing import Callable
+import logging
 import traceback
-from langchain.schema import StrOutputParser
-from langchain.prompts import ChatPromptTemplate, FewShotChatMessagePromptTemplate, PromptTemplate
+from langchain.schema import OutputParserException, StrOutputParser
+from langchain.prompts import (ChatPromptTemplate, FewShotChatMessagePromptTemplate,
+                               MessagesPlaceholder, PromptTemplate)
 from langchain.output_parsers import PydanticOutputParser
 from langchain_core.messages import HumanMessage, AIMessage
 from pydantic import ValidationError
 from llm_utils.pydantic_models import Output
-from llm_utils.config_loader import load_few_shot_examples, load_config
+from llm_utils.config_loader import shared_config, shared_example_index, shared_examples
+from llm_utils.example_selector import TfidfExampleSelector
+from llm_utils.memory import MemoryManager, count_tokens
 from llm_utils.stream_handler import DebugHandler
+from llm_utils.tracing import current_turn
+from llm_utils.ui_repair import salvage_output, tolerant_loads
+
+logger = logging.getLogger(__name__)
+
+FEW_SHOT_EXAMPLE_FILES = ('configs/few_shot_examples.json',
+                          'configs/acting_examples.json',
+                          'configs/reasoning_examples.json')
 
 
 class Agent:
@@ -16,7 +28,7 @@ class Agent:
 
     def __init__(self, model):
         self.model = model
-        self.config = load_config()
+        self.config = shared_config()
 
         self.example_prompt = ChatPromptTemplate.from_messages(
             [
@@ -25,10 +37,14 @@ class Agent:
             ]
         )
 
+    def build_chain(self):
+        """Builds the static prompt and chain; called on init and on model update."""
+
     def update_model(self, model):
         """Updates the agent's model."""
         self.model = model
-        print(model)
+        self.build_chain()
+        logger.debug("Updated %s model to %s", type(self).__name__, model)
 
     def get_model(self):
         """Returns the agent's model."""
@@ -41,77 +57,255 @@ class ConversationalAgent(Agent):
     def __init__(self, model):
         super().__init__(model)
         self.memory = []
+        self.memory_manager = MemoryManager(
+            token_budget=self.config.get("memory_token_budget", 2000))
         self.system_prompt = self.config["conversational_prompt"]
-        self.few_shot_examples = load_few_shot_examples(
-            'configs/few_shot_examples.json') + load_few_shot_examples(
-            'configs/acting_examples.json') + load_few_shot_examples(
-            'configs/reasoning_examples.json')
-
-    def __call__(self, message: HumanMessage, stream_handler: Callable) -> str:
-        self.memory.append(message)
+        self.few_shot_examples = shared_examples(*FEW_SHOT_EXAMPLE_FILES)
+        self.example_selector = TfidfExampleSelector(
+            index=shared_example_index(*FEW_SHOT_EXAMPLE_FILES), k=self.config.get("few_shot_k"))
+        self.build_chain()
 
+    def build_chain(self):
+        """Builds the system and few-shot prompt once, leaving a placeholder for the memory."""
         few_shot_prompt = FewShotChatMessagePromptTemplate(
             example_prompt=self.example_prompt,
-            examples=self.few_shot_examples,
+            example_selector=self.example_selector,
+            input_variables=["history"],
         )
 
-        prompt = ChatPromptTemplate.from_messages(
+        self.prompt = ChatPromptTemplate.from_messages(
             [
                 ("system", self.system_prompt),
                 few_shot_prompt,
+                MessagesPlaceholder(variable_name="history"),
             ]
-            + self.memory
         )
 
-        chain = (
-            prompt
+        self.chain = (
+            self.prompt
             | self.model
             | StrOutputParser()
         )
+        self.system_prompt_tokens = count_tokens(self.system_prompt)
+
+    def __call__(self, message: HumanMessage, stream_handler: Callable) -> str:
+        history, config = self.prepare(message, stream_handler)
+        response = self.chain.invoke(input={"history": history}, config=config)
+        return self.finish(response)
+
+    async def astream(self, message: HumanMessage, stream_handler: Callable):
+        """Streams the response chunks; a cancelled turn is dropped from the memory."""
+        history, config = self.prepare(message, stream_handler)
+        chunks = []
+        try:
+            async for chunk in self.chain.astream(input={"history": history}, config=config):
+                chunks.append(chunk)
+                yield chunk
+        except BaseException:
+            self.forget(message)
+            raise
+        self.finish("".join(chunks))
 
-        config = {"callbacks": [stream_handler]}
-        response = chain.invoke(input={}, config=config)
+    async def ainvoke(self, message: HumanMessage, stream_handler: Callable) -> str:
+        """Returns the whole response, streaming it to the handler on the way."""
+        return "".join([chunk async for chunk in self.astream(message, stream_handler)])
+
+    def forget(self, message):
+        """Drops a message and the responses after it from the memory, e.g. for a cancelled turn."""
+        for index in range(len(self.memory) - 1, -1, -1):
+            if self.memory[index] is message:
+                del self.memory[index:]
+                return
+
+    def prepare(self, message, stream_handler):
+        """Adds the message to the memory and returns the compacted history and call config."""
+        self.memory.append(message)
+        history = self.memory_manager.compact(self.memory)
+        config = {"callbacks": [stream_handler] + current_turn().callbacks("conversational")}
+        return history, config
+
+    def finish(self, response):
+        """Records the prompt statistics and adds the response to the memory."""
+        trace = current_turn()
+        memory_stats = self.memory_manager.last_stats
+        example_stats = self.example_selector.last_stats
+        tokens_before = (self.system_prompt_tokens + example_stats['tokens_all']
+                         + memory_stats['before'])
+        tokens_after = (self.system_prompt_tokens + example_stats['tokens_selected']
+                        + memory_stats['after'])
+        trace.record("prompt_tokens_before_compaction", tokens_before)
+        trace.record("prompt_tokens_after_compaction", tokens_after)
+        trace.record("example_selection_latency", example_stats['latency_ms'] / 1000)
+        logger.debug("Prompt tokens: before compaction %d, after compaction %d; "
+                     "examples %d/%d selected in %.2f ms", tokens_before, tokens_after,
+                     example_stats['selected'], example_stats['total'],
+                     example_stats['latency_ms'])
         self.memory.append(AIMessage(role="assistant", content=response))
         return response
 
 
 class UIAgent(Agent):
-    """Agent for generating UI responses based on model outputs."""
+    """
+    Agent for generating UI responses based on model outputs.
+
+    A response that fails validation is repaired before anything is re-queried:
+    the valid title and UI elements are salvaged locally, and the model is only
+    asked again for the pieces that are still missing, with a short title or
+    elements prompt. A full retry is left for responses with nothing to salvage.
+    """
+
+    max_requeries = 2
 
     def __init__(self, model):
         super().__init__(model)
         self.system_prompt = self.config["ui_prompt"]
+        self.last_stats = {}
+        self.build_chain()
 
-    def __call__(self, message) -> str:
-        parser = PydanticOutputParser(pydantic_object=Output)
+    def build_chain(self):
+        """Builds the output parser, format instructions and prompts once."""
+        self.parser = PydanticOutputParser(pydantic_object=Output)
 
-        prompt = PromptTemplate(
+        self.prompt = PromptTemplate(
             template="{system_prompt}\n{format_instructions}\n{message}",
             input_variables=["message"],
             partial_variables={"system_prompt": self.system_prompt,
-                               "format_instructions": parser.get_format_instructions()},
+                               "format_instructions": self.parser.get_format_instructions()},
         )
 
-        chain = (
-            prompt
+        # Parsed separately so the trace can tell model time from parse time.
+        self.chain = (
+            self.prompt
+            | self.model
+            | StrOutputParser()
+        )
+        self.title_chain = (
+            PromptTemplate.from_template(self.config["ui_title_prompt"] + "\n{message}")
             | self.model
-            | parser
+            | StrOutputParser()
+        )
+        self.elements_chain = (
+            PromptTemplate.from_template(self.config["ui_elements_prompt"] + "\n{message}")
+            | self.model
+            | StrOutputParser()
         )
 
-        handler = DebugHandler()
-        config = {"callbacks": [handler]}
+    def __call__(self, message) -> dict:
+        """Returns the UI output for a message, blocking on the model calls."""
+        steps = self.steps(message)
+        try:
+            request = next(steps)
+            while True:
+                chain, inputs, config = request
+                try:
+                    text = chain.invoke(input=inputs, config=config)
+                except Exception as error:
+                    request = steps.throw(error)
+                else:
+                    request = steps.send(text)
+        except StopIteration as done:
+            return done.value
+
+    async def ainvoke(self, message) -> dict:
+        """Returns the UI output for a message, awaiting the model calls."""
+        steps = self.steps(message)
+        try:
+            request = next(steps)
+            while True:
+                chain, inputs, config = request
+                try:
+                    text = await chain.ainvoke(input=inputs, config=config)
+                except Exception as error:
+                    request = steps.throw(error)
+                else:
+                    request = steps.send(text)
+        except StopIteration as done:
+            return done.value
+
+    def steps(self, message):
+        """
+        Generates the UI output, shared by the blocking and async entry points.
+
+        Yields each model request as (chain, inputs, config), receives the
+        response text (or the call's exception) and returns the output dict.
+        """
+        trace = current_turn()
+        callbacks = trace.callbacks("ui")
+        if logger.isEnabledFor(logging.DEBUG):
+            callbacks.append(DebugHandler())
+        config = {"callbacks": callbacks}
+        stats = {"strict_parse_failed": False, "partial_requeries": 0,
+                 "full_retries": 0, "round_trips_saved": 0}
+        self.last_stats = stats
+
+        try:
+            text = yield self.chain, {"message": message}, config
+        except Exception as e:
+            logger.error("Unexpected error: %s - %s", traceback.format_exc(), e)
+            return {"title": "", "ui_elements": []}
 
-        retries = 3  # Number of retries
-        for attempt in range(retries):
+        with trace.span("ui_parse"):
             try:
-                validated_data = chain.invoke(
-                    input={"message": message}, config=config)
-                return validated_data.dict()
-            except ValidationError as e:
-                print(f"Validation error on attempt {attempt+1}: {e}")
-                if attempt == retries - 1:
-                    return None
-                print("Retrying...")
+                return self.parser.parse(text).dict()
+            except (ValidationError, OutputParserException) as e:
+                logger.warning("Validation error, repairing the response: %s", e)
+                stats["strict_parse_failed"] = True
+                output, missing = salvage_output(text)
+
+        for _ in range(self.max_requeries):
+            if not missing:
+                break
+            try:
+                output, missing = yield from self.requery(message, output, missing, config, stats)
             except Exception as e:
-                print(f"Unexpected error: {traceback.format_exc()} - {e}")
-                return None
+                logger.error("Unexpected error: %s - %s", traceback.format_exc(), e)
+                break
+
+        # Every parse failure used to cost at least one full retry; partial
+        # re-queries are cheaper round trips and are counted separately.
+        if not missing and not stats["full_retries"] and not stats["partial_requeries"]:
+            stats["round_trips_saved"] = 1
+        trace.increment("ui_strict_parse_failures")
+        trace.increment("ui_partial_requeries", stats["partial_requeries"])
+        trace.increment("ui_retries", stats["full_retries"])
+        trace.increment("ui_round_trips_saved", stats["round_trips_saved"])
+        if missing:
+            logger.warning("UI response still missing %s after repair", ", ".join(missing))
+        return output
+
+    def requery(self, message, output, missing, config, stats):
+        """Asks the model again for the missing pieces and merges them into the output."""
+        if len(missing) == 2 and not output["ui_elements"]:
+            stats["full_retries"] += 1
+            text = yield self.chain, {"message": message}, config
+            with current_turn().span("ui_parse"):
+                return salvage_output(text)
+
+        stats["partial_requeries"] += 1
+        if "ui_elements" in missing:
+            existing = ", ".join(f'{element["type"]} "{element["label"]}"'
+                                 for element in output["ui_elements"]) or "none"
+            text = yield self.elements_chain, {"message": message, "existing": existing}, config
+            with current_turn().span("ui_parse"):
+                requeried, _ = salvage_output(text)
+            labels = {element["label"] for element in output["ui_elements"]}
+            output["ui_elements"].extend(element for element in requeried["ui_elements"]
+                                         if element["label"] not in labels)
+            if "title" in missing:
+                # The title is cosmetic; use the first question rather than a further query.
+                output["title"] = requeried["title"] or (
+                    output["ui_elements"][0]["label"] if output["ui_elements"] else "")
+            return output, [] if output["ui_elements"] else ["ui_elements"]
+
+        text = yield self.title_chain, {"message": message}, config
+        output["title"] = title_from_response(text)
+        return output, [] if output["title"] else ["title"]
+
+
+def title_from_response(text):
+    """Extracts a title from a title re-query, which models sometimes answer in JSON."""
+    data = tolerant_loads(text)
+    if isinstance(data, dict) and isinstance(data.get("title"), str):
+        return data["title"].strip()
+    lines = [line.strip().strip('"#*') for line in text.splitlines() if line.strip()]
+    return lines[0] if lines else ""
@@ -0,0 +1,55 @@
+"""Shared asyncio event loop for model calls.
+
+All sessions schedule their conversation turns as tasks on one loop running in
+a daemon thread, so waiting on the providers costs no thread per call. The
+calls in flight per provider are bounded by llm_utils.scheduler.
+"""
+import asyncio
+import concurrent.futures
+import contextvars
+import threading
+
+_loop = None
+_loop_lock = threading.Lock()
+
+
+def get_event_loop():
+    """Returns the shared event loop, starting its thread on first use."""
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="model-event-loop",
+                             daemon=True).start()
+        return _loop
+
+
+def run_coroutine(coroutine):
+    """
+    Schedules a coroutine on the shared loop and returns a concurrent.futures.Future.
+
+    The task runs in a copy of the caller's context, so it joins the caller's
+    turn trace. Cancel the task through the coroutine's owner, e.g.
+    `Conversation.cancel()`; cancelling the returned future does not stop it.
+    """
+    loop = get_event_loop()
+    context = contextvars.copy_context()
+    future = concurrent.futures.Future()
+
+    def copy_result(task):
+        if future.cancelled():
+            return
+        if task.cancelled():
+            future.cancel()
+        elif task.exception() is not None:
+            future.set_exception(task.exception())
+        else:
+            future.set_result(task.result())
+
+    def start():
+        # Tasks copy the context current at creation, here the caller's.
+        task = context.run(loop.create_task, coroutine)
+        task.add_done_callback(copy_result)
+
+    loop.call_soon_threadsafe(start)
+    return future
@@ -1,7 +1,12 @@
 """module to load few-shot examples and configuration files."""
 import json
+import os
+import threading
 from pathlib import Path
 
+ROOT = Path(__file__).resolve().parent.parent
+FILE_READS = {"count": 0}
+
 
 def load_few_shot_examples(examples_file):
     """
@@ -35,6 +40,7 @@ def load_json(path):
     """
     Load JSON data from a given file path.
     """
+    FILE_READS["count"] += 1
     try:
         with path.open("r", encoding="utf-8") as file:
             return json.load(file)
@@ -53,3 +59,147 @@ def load_config(config_file='configs/config.json'):
 
     config = load_json(config_path)
     return config
+
+
+def file_read_count():
+    """
+    Return how many JSON files have been read from disk in this process.
+    """
+    return FILE_READS["count"]
+
+
+class FrozenDict(dict):
+    """
+    Dict that rejects mutation, so config shared across sessions cannot leak between them.
+
+    It is still a dict, so it formats into prompts and serialises to JSON
+    exactly like the loaded data. Copies are plain, mutable dicts.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("shared config is read-only; copy it before changing it")
+
+    __setitem__ = __delitem__ = __ior__ = _readonly
+    clear = pop = popitem = setdefault = update = _readonly
+
+    def __reduce__(self):
+        return dict, (dict(self),)
+
+
+class FrozenList(list):
+    """
+    List that rejects mutation, the counterpart of FrozenDict for JSON arrays.
+    """
+
+    def _readonly(self, *args, **kwargs):
+        raise TypeError("shared config is read-only; copy it before changing it")
+
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _readonly
+    append = extend = insert = pop = remove = clear = sort = reverse = _readonly
+
+    def __reduce__(self):
+        return list, (list(self),)
+
+
+def freeze(value):
+    """
+    Return a read-only copy of loaded JSON data, frozen at every level.
+    """
+    if isinstance(value, dict):
+        return FrozenDict((key, freeze(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return FrozenList(freeze(item) for item in value)
+    return value
+
+
+class SharedRegistry:
+    """
+    Process-wide, read-only cache of config files and example sets.
+
+    Every session shares the same objects by reference, so creating a new
+    Conversation does no disk I/O once the registry is warm. With `hot_reload`
+    enabled, a file is re-read when its mtime changes.
+    """
+
+    def __init__(self, hot_reload=False):
+        self.hot_reload = hot_reload
+        self.entries = {}
+        self.lock = threading.Lock()
+
+    def get(self, relative_path, freeze):
+        """
+        Return the frozen contents of a file, loading it on first use.
+        """
+        path = ROOT / relative_path
+        entry = self.entries.get(path)
+        if entry is not None and not self.hot_reload:
+            return entry[1]
+        mtime = os.stat(path).st_mtime if path.exists() else None
+        if entry is not None and entry[0] == mtime:
+            return entry[1]
+        with self.lock:
+            entry = self.entries.get(path)
+            if entry is None or entry[0] != mtime:
+                entry = (mtime, freeze(load_json(path)))
+                self.entries[path] = entry
+        return entry[1]
+
+    def derived(self, key, inputs, build):
+        """
+        Return an object built from shared inputs, rebuilding it only when they change.
+
+        `inputs` is compared by identity, so an object built from registry
+        entries is rebuilt exactly when one of them is reloaded.
+        """
+        entry = self.entries.get(key)
+        if entry is None or not _same_objects(entry[0], inputs):
+            with self.lock:
+                entry = self.entries.get(key)
+                if entry is None or not _same_objects(entry[0], inputs):
+                    entry = (tuple(inputs), build(inputs))
+                    self.entries[key] = entry
+        return entry[1]
+
+    def clear(self):
+        """
+        Drop all cached files so they are re-read on next use.
+        """
+        with self.lock:
+            self.entries.clear()
+
+
+def _same_objects(first, second):
+    return len(first) == len(second) and all(a is b for a, b in zip(first, second))
+
+
+REGISTRY = SharedRegistry(hot_reload=os.environ.get("CONFIG_HOT_RELOAD") == "1")
+
+
+def shared_config(config_file='configs/config.json'):
+    """
+    Return the main configuration, frozen at every level and shared across sessions.
+    """
+    return REGISTRY.get(config_file, lambda config: freeze(config or {}))
+
+
+def shared_examples(*examples_files):
+    """
+    Return the concatenated few-shot examples of the given files as a shared tuple.
+
+    The example dicts are shared by reference and frozen at every level.
+    """
+    examples = []
+    for examples_file in examples_files:
+        examples.extend(REGISTRY.get(examples_file, lambda items: tuple(freeze(items or []))))
+    return tuple(examples)
+
+
+def shared_example_index(*examples_files):
+    """
+    Return the TF-IDF index of the given example files, built once and shared across sessions.
+    """
+    # Imported here so loading configs does not pull in the langchain selector.
+    from llm_utils.example_selector import TfidfExampleIndex
+
+    return REGISTRY.derived(("tfidf_index",) + examples_files,
+                            shared_examples(*examples_files), TfidfExampleIndex)
@@ -1,12 +1,32 @@
 """Defines the Conversation class for managing chat interactions using different language models."""
+import asyncio
+import hashlib
 import json
-from typing import Callable
+import logging
+import time
 
-from langchain_core.messages import HumanMessage
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_openai import ChatOpenAI
+from langchain_core.messages import AIMessage, HumanMessage
 
 from llm_utils.agents import ConversationalAgent, UIAgent
+from llm_utils.async_runtime import run_coroutine
+from llm_utils.config_loader import shared_config
+from llm_utils.lazy_imports import load_attribute
+from llm_utils.response_cache import make_cache_key
+from llm_utils.scheduler import BACKGROUND, INTERACTIVE, ScheduledChatModel
+from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
+from llm_utils.tracing import get_tracer
+
+logger = logging.getLogger(__name__)
+
+# Provider chat model classes, imported only when a model of that provider is created.
+PROVIDER_CLASSES = {
+    "openai": "langchain_openai:ChatOpenAI",
+    "google": "langchain_google_genai:ChatGoogleGenerativeAI",
+    "fake": "llm_utils.fake_models:create_fake_model",
+}
+
+# Hermetic providers for offline load testing; "replay" needs a recording file.
+FAKE_MODELS = ("fake", "replay")
 
 
 class Conversation:
@@ -16,49 +36,263 @@ class Conversation:
             self,
             api_keys: dict,
             model_name_conv="gpt-4-turbo",
-            model_name_ui="gpt-4-turbo") -> None:
-        """Initialize conversation and UI agents using given API keys and model names."""
+            model_name_ui="gpt-4-turbo",
+            response_cache=None,
+            fake_model_options=None,
+            pipeline_ui=None) -> None:
+        """
+        Initialize conversation and UI agents using given API keys and model names.
+
+        `pipeline_ui` defaults to the "pipeline_ui" setting of configs/config.json.
+        """
         self.api_keys = api_keys
+        if pipeline_ui is None:
+            pipeline_ui = shared_config().get("pipeline_ui", False)
+        self.pipeline_ui = pipeline_ui
+        self.fake_model_options = dict(shared_config().get("fake_model", {}))
+        self.fake_model_options.update(fake_model_options or {})
+        self.response_cache = response_cache
+        self.model_names = (model_name_conv, model_name_ui)
+        self.last_timings = {}
+        self.tasks = set()
 
         conv_model = self.create_model(model_name_conv, streaming=True)
-        ui_model = self.create_model(model_name_ui, streaming=False)
+        ui_model = self.create_model(model_name_ui, streaming=False, priority=BACKGROUND)
 
         self.conversational_agent = ConversationalAgent(conv_model)
         self.ui_agent = UIAgent(ui_model)
+        self.prompt_hash = self.compute_prompt_hash()
+
+    def __call__(self, message: HumanMessage,
+                 stream_handler: StreamUntilSpecialTokenHandler) -> str:
+        """
+        Process a chat message through the conversational agent and generate UI response.
+
+        The UI agent is given only the text after the special token, or the full
+        text when the special token never appears. With `pipeline_ui` enabled, it
+        is started on the shared event loop as soon as the stream ends, instead of
+        after the conversational chain returns, and `last_timings["saved"]` holds
+        the wall-clock time the overlap saved. The intake turn is served from
+        `response_cache` when one is configured and holds a matching response.
+        """
+        with get_tracer().turn("survey", models="/".join(self.model_names)) as trace:
+            return self.traced_call(message, stream_handler, trace)
+
+    def traced_call(self, message, stream_handler, trace):
+        """Run one turn, recording its timings on the turn trace."""
+        start = time.perf_counter()
+        cache_key, cached = self.lookup_first_turn(message, trace)
+        if cached is not None:
+            self.last_timings = {"total": time.perf_counter() - start, "cached": True}
+            return self.replay_cached_turn(message, stream_handler, *cached)
+
+        ui_future = None
+
+        def start_ui_agent(suffix):
+            nonlocal ui_future
+            # The shared loop waits on the provider, so no thread is held per turn.
+            ui_future = run_coroutine(
+                self.timed_ui_acall(f"{stream_handler.special_token}{suffix}"))
+
+        if self.pipeline_ui:
+            stream_handler.on_suffix_ready = start_ui_agent
 
-    def __call__(self, message: HumanMessage, stream_handler: Callable) -> str:
-        """Process a chat message through the conversational agent and generate UI response."""
         textual_response = self.conversational_agent(message, stream_handler)
-        json_response = self.ui_agent(textual_response)
+        conversational_time = time.perf_counter() - start
+
+        if ui_future is None:
+            json_response, ui_time = self.timed_ui_call(
+                self.ui_agent_input(stream_handler, textual_response))
+        else:
+            json_response, ui_time = ui_future.result()
+
+        return self.finish_turn(stream_handler, trace, cache_key, start, textual_response,
+                                conversational_time, json_response, ui_time,
+                                ui_future is not None)
+
+    async def acall(self, message: HumanMessage,
+                    stream_handler: StreamUntilSpecialTokenHandler):
+        """
+        Async version of `__call__`, for running on the shared event loop.
+
+        The turn and its UI agent task are cancelled by `cancel()`, e.g. when
+        the session restarts.
+        """
+        task = asyncio.current_task()
+        self.tasks.add(task)
+        try:
+            with get_tracer().turn("survey", models="/".join(self.model_names)) as trace:
+                return await self.traced_acall(message, stream_handler, trace)
+        finally:
+            self.tasks.discard(task)
+
+    async def traced_acall(self, message, stream_handler, trace):
+        """Run one turn on the event loop, recording its timings on the turn trace."""
+        start = time.perf_counter()
+        cache_key, cached = self.lookup_first_turn(message, trace)
+        if cached is not None:
+            self.last_timings = {"total": time.perf_counter() - start, "cached": True}
+            return self.replay_cached_turn(message, stream_handler, *cached)
+
+        ui_task = None
+
+        def start_ui_agent(suffix):
+            nonlocal ui_task
+            ui_task = asyncio.get_running_loop().create_task(
+                self.timed_ui_acall(f"{stream_handler.special_token}{suffix}"))
+            self.tasks.add(ui_task)
+            ui_task.add_done_callback(self.tasks.discard)
+
+        if self.pipeline_ui:
+            stream_handler.on_suffix_ready = start_ui_agent
 
-        json_response["text"] = textual_response.split("␃")[0]
+        try:
+            textual_response = await self.conversational_agent.ainvoke(message, stream_handler)
+            conversational_time = time.perf_counter() - start
+
+            if ui_task is None:
+                json_response, ui_time = await self.timed_ui_acall(
+                    self.ui_agent_input(stream_handler, textual_response))
+            else:
+                json_response, ui_time = await ui_task
+        except asyncio.CancelledError:
+            if ui_task is not None:
+                ui_task.cancel()
+            # The session never shows a cancelled turn, so the agent must not remember it.
+            self.conversational_agent.forget(message)
+            trace.record("cancelled", True)
+            raise
+
+        return self.finish_turn(stream_handler, trace, cache_key, start, textual_response,
+                                conversational_time, json_response, ui_time,
+                                ui_task is not None)
+
+    def cancel(self):
+        """Cancel the turns in flight on the event loop; safe to call from any thread."""
+        for task in list(self.tasks):
+            task.get_loop().call_soon_threadsafe(task.cancel)
+
+    def reset(self):
+        """Cancel the turns in flight and forget the conversation, for a restarted session."""
+        self.cancel()
+        self.conversational_agent.memory.clear()
+
+    def lookup_first_turn(self, message, trace):
+        """Return the intake turn's cache key and cached response; either may be None."""
+        cache_key = self.first_turn_cache_key(message)
+        if cache_key is None:
+            return None, None
+        cached = self.response_cache.get(cache_key)
+        trace.record("cache_hit", cached is not None)
+        return cache_key, cached
+
+    def finish_turn(self, stream_handler, trace, cache_key, start, textual_response,
+                    conversational_time, json_response, ui_time, pipelined):
+        """Record the turn timings, attach the display text and cache the intake turn."""
+        total_time = time.perf_counter() - start
+        self.last_timings = {
+            "conversational": conversational_time,
+            "ui": ui_time,
+            "total": total_time,
+            "pipelined": pipelined,
+            # Time the UI agent ran while the conversational chain was still returning.
+            "saved": conversational_time + ui_time - total_time,
+        }
+        trace.record("conversational_time", conversational_time)
+        trace.record("ui_time", ui_time)
+        trace.record("pipelined", pipelined)
+        trace.record("pipeline_saved_time", self.last_timings["saved"])
+        logger.debug("Turn timings: %s", self.last_timings)
+
+        display_text, _ = stream_handler.get_split_response()
+        if not display_text and not stream_handler.scanner.found:
+            # The provider returned the response without streaming any tokens.
+            display_text = textual_response.split(stream_handler.special_token)[0]
+        json_response["text"] = display_text
         json_response = json.dumps(json_response)
 
+        if cache_key is not None:
+            self.response_cache.set(cache_key, [textual_response, json_response])
+
         return textual_response, json_response
 
+    def compute_prompt_hash(self):
+        """Hash the prompts and few-shot examples that determine the agents' responses."""
+        prompts = [self.conversational_agent.system_prompt,
+                   list(self.conversational_agent.few_shot_examples),
+                   self.ui_agent.system_prompt]
+        return hashlib.sha256(
+            json.dumps(prompts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def first_turn_cache_key(self, message: HumanMessage):
+        """Return the response cache key for the intake turn, or None if it is not cacheable."""
+        if self.response_cache is None or self.conversational_agent.memory:
+            return None
+        return make_cache_key("/".join(self.model_names), self.prompt_hash, message.content)
+
+    def replay_cached_turn(self, message, stream_handler, textual_response, json_response):
+        """Render a cached intake response and record it in the conversational memory."""
+        stream_handler.on_llm_new_token(textual_response)
+        stream_handler.on_llm_end(None)
+        self.conversational_agent.memory.extend(
+            [message, AIMessage(role="assistant", content=textual_response)])
+        return textual_response, json_response
+
+    @staticmethod
+    def ui_agent_input(stream_handler, textual_response):
+        """Return the text after the special token for the UI agent, or the full response."""
+        if stream_handler.scanner.found:
+            return f"{stream_handler.special_token}{stream_handler.scanner.suffix_text}"
+        return textual_response
+
+    def timed_ui_call(self, message):
+        """Run the UI agent and return its response with the elapsed time."""
+        start = time.perf_counter()
+        json_response = self.ui_agent(message)
+        return json_response, time.perf_counter() - start
+
+    async def timed_ui_acall(self, message):
+        """Await the UI agent and return its response with the elapsed time."""
+        start = time.perf_counter()
+        json_response = await self.ui_agent.ainvoke(message)
+        return json_response, time.perf_counter() - start
+
     def update_agents(self, model_name_conv: str, model_name_ui: str):
         """Update conversational and UI agents with new models."""
-        print(
-            f"Updating agents with models {model_name_conv} and {model_name_ui}")
+        logger.debug("Updating agents with models %s and %s", model_name_conv, model_name_ui)
         conv_agent_model = self.create_model(
             model_name=model_name_conv, streaming=True)
         ui_agent_model = self.create_model(
-            model_name=model_name_ui, streaming=False)
+            model_name=model_name_ui, streaming=False, priority=BACKGROUND)
 
         self.conversational_agent.update_model(conv_agent_model)
         self.ui_agent.update_model(ui_agent_model)
+        self.model_names = (model_name_conv, model_name_ui)
 
-    def create_model(self, model_name: str, streaming=False):
-        """Create a model instance based on model name and streaming capability."""
+    def create_model(self, model_name: str, streaming=False, priority=INTERACTIVE):
+        """
+        Create a model instance based on model name and streaming capability.
+
+        The model is wrapped so its calls go through the process-wide scheduler
+        at `priority`: INTERACTIVE for the conversational agent, BACKGROUND for
+        the UI agent.
+        """
         if model_name in ("gpt-3.5-turbo", "gpt-4-turbo"):
             api_key = self.api_keys["openai"]
-            return ChatOpenAI(openai_api_key=api_key, model_name=model_name, streaming=streaming)
-
-        if model_name == "gemini-pro":
+            ChatOpenAI = load_attribute(PROVIDER_CLASSES["openai"])
+            model = ChatOpenAI(openai_api_key=api_key, model_name=model_name, streaming=streaming)
+        elif model_name == "gemini-pro":
             api_key = self.api_keys["google"]
-            return ChatGoogleGenerativeAI(
+            ChatGoogleGenerativeAI = load_attribute(PROVIDER_CLASSES["google"])
+            model = ChatGoogleGenerativeAI(
                 model="gemini-pro",
                 stream=streaming,
                 convert_system_message_to_human=True
             )
-        return None
+        elif model_name in FAKE_MODELS:
+            create_fake_model = load_attribute(PROVIDER_CLASSES["fake"])
+            model = create_fake_model(
+                replay=model_name == "replay", streaming=streaming, **self.fake_model_options)
+        else:
+            return None
+        return ScheduledChatModel(model=model, model_name=model_name, priority=priority)
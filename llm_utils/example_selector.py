@@ -0,0 +1,104 @@
+"""TF-IDF few-shot example selector that sends only the examples relevant to the current turn."""
+import math
+import re
+import time
+from collections import Counter
+from typing import Dict, List, Optional
+
+from langchain_core.example_selectors import BaseExampleSelector
+
+from llm_utils.memory import count_tokens
+
+WORD_PATTERN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split a text into lowercase word tokens."""
+    return WORD_PATTERN.findall(text.lower())
+
+
+class TfidfExampleIndex:
+    """
+    Sparse TF-IDF matrix over the inputs of a set of few-shot examples.
+
+    The index is read-only once built, so one instance is shared by every
+    session through `config_loader.shared_example_index`.
+    """
+
+    def __init__(self, examples):
+        self.examples = tuple(examples)
+        self.example_tokens = [
+            count_tokens(str(example["input"])) + count_tokens(str(example["output"]))
+            for example in self.examples]
+        documents = [Counter(tokenize(str(example["input"]))) for example in self.examples]
+        document_frequency = Counter(term for document in documents for term in document)
+        total = len(documents)
+        self.idf = {term: math.log((1 + total) / (1 + frequency)) + 1
+                    for term, frequency in document_frequency.items()}
+        self.vectors = [self.vectorize(document) for document in documents]
+
+    def vectorize(self, term_counts: Dict[str, int]) -> Dict[str, float]:
+        """Returns the normalised TF-IDF vector of a term count."""
+        vector = {term: count * self.idf[term]
+                  for term, count in term_counts.items() if term in self.idf}
+        norm = math.sqrt(sum(weight * weight for weight in vector.values()))
+        return {term: weight / norm for term, weight in vector.items()} if norm else {}
+
+    def top_k(self, text: str, k: Optional[int]) -> List[int]:
+        """Returns the indices of the k examples most similar to a text, in example order."""
+        if k is None or k >= len(self.examples):
+            return list(range(len(self.examples)))
+        query = self.vectorize(Counter(tokenize(text)))
+        scores = [sum(weight * vector.get(term, 0.0) for term, weight in query.items())
+                  for vector in self.vectors]
+        ranked = sorted(range(len(scores)), key=lambda index: -scores[index])
+        return sorted(ranked[:k])
+
+
+class TfidfExampleSelector(BaseExampleSelector):
+    """
+    Selects the top-k few-shot examples most similar to the latest user message.
+
+    Selection runs against a TfidfExampleIndex, either the shared one passed as
+    `index` or one built from `examples`. Selected examples keep their original
+    order, since the example files are consecutive turns of a conversation.
+    With `k` unset, or not smaller than the number of examples, every example
+    is returned. The selector itself only holds the per-session `last_stats`.
+    """
+
+    def __init__(self, examples=(), k: Optional[int] = None,
+                 index: Optional[TfidfExampleIndex] = None):
+        self.index = TfidfExampleIndex(examples) if index is None else index
+        self.k = k
+        self.last_stats = {}
+
+    @property
+    def examples(self):
+        """Returns the examples of the index."""
+        return self.index.examples
+
+    def add_example(self, example: Dict[str, str]) -> None:
+        """Adds an example to a private copy of the index, leaving a shared index unchanged."""
+        self.index = TfidfExampleIndex(self.index.examples + (example,))
+
+    def select_examples(self, input_variables: Dict[str, object]) -> List[dict]:
+        """Returns the examples most similar to the latest message in `history` or `input`."""
+        start = time.perf_counter()
+        indices = self.index.top_k(self._query_text(input_variables), self.k)
+
+        selected = [self.index.examples[index] for index in indices]
+        self.last_stats = {
+            "selected": len(selected),
+            "total": len(self.index.examples),
+            "tokens_selected": sum(self.index.example_tokens[index] for index in indices),
+            "tokens_all": sum(self.index.example_tokens),
+            "latency_ms": (time.perf_counter() - start) * 1000,
+        }
+        return selected
+
+    @staticmethod
+    def _query_text(input_variables: Dict[str, object]) -> str:
+        history = input_variables.get("history")
+        if history:
+            return history[-1].content
+        return str(input_variables.get("input", ""))
@@ -0,0 +1,139 @@
+"""Hermetic chat models that stream canned or recorded responses, for offline load testing.
+
+The "fake" provider cycles through responses built from the few-shot examples
+in configs/. The "replay" provider reads a JSON Lines recording where each line
+holds one turn as returned by `Conversation`:
+`{"textual_response": "... ␃ ...", "json_response": "{\"title\": ...}"}`.
+"""
+import asyncio
+import itertools
+import json
+import re
+import time
+from pathlib import Path
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatGenerationChunk, ChatResult
+from langchain_core.pydantic_v1 import PrivateAttr
+
+from llm_utils.config_loader import shared_examples
+
+TOKEN_PATTERN = re.compile(r"\s*\S+|\s+$")
+
+
+def tokenize_response(text: str) -> List[str]:
+    """Split a response into word-sized tokens that join back to the original text."""
+    return TOKEN_PATTERN.findall(text) or [text]
+
+
+def canned_responses(agent: str) -> List[str]:
+    """Return the conversational texts or the UI agent JSON of the few-shot examples."""
+    if agent == "conversational":
+        return [example["output"] for example
+                in shared_examples("configs/reasoning_examples.json")]
+    return [json.dumps({"title": example["output"]["title"],
+                        "ui_elements": example["output"]["ui_elements"]})
+            for example in shared_examples("configs/few_shot_examples.json")]
+
+
+def recorded_responses(path, agent: str) -> List[str]:
+    """Return the conversational or UI agent responses of a JSON Lines recording."""
+    field = "textual_response" if agent == "conversational" else "json_response"
+    with open(Path(path), encoding="utf-8") as recording:
+        return [json.loads(line)[field] for line in recording if line.strip()]
+
+
+class FakeChatModel(BaseChatModel):
+    """
+    Chat model that returns its responses in turn, with simulated provider latency.
+
+    Each call waits `first_token_latency` seconds, then emits the response one
+    word at a time, waiting `token_latency` seconds per token. Tokens are passed
+    to the callbacks when `streaming` is set, as the provider models do.
+    """
+
+    responses: List[str]
+    streaming: bool = False
+    first_token_latency: float = 0.0
+    token_latency: float = 0.0
+    _turns: Any = PrivateAttr(default=None)
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self._turns = itertools.count()
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-chat-model"
+
+    def next_response(self) -> str:
+        """Return the next response, cycling through them; safe across threads."""
+        return self.responses[next(self._turns) % len(self.responses)]
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        time.sleep(self.first_token_latency)
+        for index, token in enumerate(tokenize_response(self.next_response())):
+            if index:
+                time.sleep(self.token_latency)
+            if run_manager:
+                run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    async def _astream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        await asyncio.sleep(self.first_token_latency)
+        for index, token in enumerate(tokenize_response(self.next_response())):
+            if index:
+                await asyncio.sleep(self.token_latency)
+            if run_manager:
+                await run_manager.on_llm_new_token(token)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=token))
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> ChatResult:
+        chunks = self._stream(messages, stop, run_manager if self.streaming else None)
+        return ChatResult(generations=[ChatGeneration(
+            message=AIMessage(content="".join(chunk.text for chunk in chunks)))])
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> ChatResult:
+        tokens = [chunk.text async for chunk in self._astream(
+            messages, stop, run_manager if self.streaming else None)]
+        return ChatResult(generations=[ChatGeneration(
+            message=AIMessage(content="".join(tokens)))])
+
+
+def create_fake_model(replay=False, streaming=False, recording=None, **latencies):
+    """
+    Create the fake model of an agent: the streaming conversational agent or the UI agent.
+
+    With `replay`, responses come from the `recording` file instead of the examples.
+    """
+    agent = "conversational" if streaming else "ui"
+    if replay:
+        if recording is None:
+            raise ValueError("The replay model needs a recording file")
+        responses = recorded_responses(recording, agent)
+    else:
+        responses = canned_responses(agent)
+    return FakeChatModel(responses=responses, streaming=streaming, **latencies)
@@ -0,0 +1,135 @@
+"""Offline-built, memory-mappable cache of the neighbourhood geometries.
+
+Build it with `python -m llm_utils.geometry_cache`, and again whenever the
+shapefile changes; the app never builds it. The cache is a directory of .npy
+arrays (coordinates plus ragged offsets per simplification level, names and
+area ids) so each array can be opened with `np.load(mmap_mode="r")` without
+parsing the shapefile or GeoJSON.
+"""
+import hashlib
+import json
+import logging
+import threading
+from pathlib import Path
+from typing import Optional
+
+from llm_utils.lazy_imports import lazy_import
+from llm_utils.offline_store import StoreUnavailable, source_is_current, source_stamp
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import("numpy")
+shapely = lazy_import("shapely")
+NEIGHBOURHOODS_SHP = (Path(__file__).resolve().parent.parent / "Assets"
+                      / "Neighbourhoods - 4326" / "Neighbourhoods - 4326.shp")
+GEOMETRY_CACHE_DIR = Path(__file__).resolve().parent.parent / "Assets" / "geometry_cache"
+
+# Simplification tolerance in degrees per level; "full" keeps the exact geometry.
+SIMPLIFY_LEVELS = {"full": 0.0, "z12": 0.0001, "z10": 0.0005}
+
+
+def source_files(source=NEIGHBOURHOODS_SHP):
+    """Return the shapefile geometry and attribute files the cache is built from."""
+    return [Path(source).with_suffix(suffix) for suffix in (".shp", ".dbf")]
+
+
+def source_hash(source=NEIGHBOURHOODS_SHP):
+    """Hash the shapefile geometry and attribute files the cache is built from."""
+    digest = hashlib.sha256()
+    for path in source_files(source):
+        digest.update(path.read_bytes())
+    return digest.hexdigest()
+
+
+def build_geometry_cache(source=NEIGHBOURHOODS_SHP, cache_dir=GEOMETRY_CACHE_DIR,
+                         levels=None):
+    """Convert the neighbourhood shapefile into the compact array cache."""
+    # Imported here so loading the cache never needs geopandas.
+    import geopandas as gpd
+
+    levels = SIMPLIFY_LEVELS if levels is None else levels
+    regions = gpd.read_file(source)
+    cache_dir = Path(cache_dir)
+    cache_dir.mkdir(parents=True, exist_ok=True)
+
+    geometry_types = {}
+    for level, tolerance in levels.items():
+        geometries = regions.geometry.values
+        if tolerance:
+            geometries = shapely.simplify(geometries, tolerance, preserve_topology=True)
+        geometry_type, coords, offsets = shapely.to_ragged_array(geometries)
+        geometry_types[level] = [int(geometry_type), len(offsets)]
+        np.save(cache_dir / f"coords_{level}.npy", coords)
+        for depth, level_offsets in enumerate(offsets):
+            np.save(cache_dir / f"offsets_{level}_{depth}.npy", level_offsets)
+
+    np.save(cache_dir / "names.npy", regions["AREA_DE8"].to_numpy(dtype=str))
+    np.save(cache_dir / "area_ids.npy", regions["AREA_ID2"].to_numpy(dtype=np.int64))
+    meta = {"source": str(source), "source_hash": source_hash(source),
+            "source_stamp": source_stamp(source_files(source)), "levels": geometry_types}
+    (cache_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    return meta
+
+
+class GeometryCache:
+    """Memory-mapped view of the geometry cache, building shapely polygons on demand."""
+
+    def __init__(self, cache_dir=GEOMETRY_CACHE_DIR):
+        self.cache_dir = Path(cache_dir)
+        if not (self.cache_dir / "meta.json").exists():
+            raise StoreUnavailable(
+                f"{self.cache_dir} is missing; build it with `python -m llm_utils.geometry_cache`")
+        self.meta = json.loads((self.cache_dir / "meta.json").read_text(encoding="utf-8"))
+        self.names = np.load(self.cache_dir / "names.npy", mmap_mode="r")
+        self.area_ids = np.load(self.cache_dir / "area_ids.npy", mmap_mode="r")
+
+    def arrays(self, level="full"):
+        """Return the memory-mapped coordinates and offset arrays of a level."""
+        _, depth = self.meta["levels"][level]
+        coords = np.load(self.cache_dir / f"coords_{level}.npy", mmap_mode="r")
+        offsets = tuple(np.load(self.cache_dir / f"offsets_{level}_{index}.npy", mmap_mode="r")
+                        for index in range(depth))
+        return coords, offsets
+
+    def geometries(self, level="full"):
+        """Return the polygons of a simplification level as a shapely geometry array."""
+        geometry_type, _ = self.meta["levels"][level]
+        coords, offsets = self.arrays(level)
+        return shapely.from_ragged_array(
+            shapely.GeometryType(geometry_type), np.asarray(coords),
+            tuple(np.asarray(level_offsets) for level_offsets in offsets))
+
+    def is_stale(self, source=NEIGHBOURHOODS_SHP):
+        """Return True if the source shapefile changed after the cache was built."""
+        return not source_is_current(self.meta, source_files(source),
+                                     lambda: source_hash(source))
+
+
+_cache = None
+_cache_error = None
+_cache_lock = threading.Lock()
+
+
+def get_geometry_cache(cache_dir=GEOMETRY_CACHE_DIR) -> Optional[GeometryCache]:
+    """
+    Return the process-wide geometry cache, or None if it is missing, stale or unreadable.
+
+    The failure is logged once and remembered, so callers degrade without retrying.
+    """
+    global _cache, _cache_error
+    with _cache_lock:
+        if _cache is None and _cache_error is None:
+            try:
+                cache = GeometryCache(cache_dir)
+                if cache.is_stale():
+                    raise StoreUnavailable(
+                        f"{cache_dir} is stale; rebuild it with `python -m llm_utils.geometry_cache`")
+                _cache = cache
+            except Exception as error:
+                _cache_error = error
+                logger.warning("Neighbourhood geometry unavailable: %s", error)
+        return _cache
+
+
+if __name__ == "__main__":
+    print(build_geometry_cache())
@@ -0,0 +1,47 @@
+"""Lazy loading of heavy modules and provider classes, imported only on first use."""
+import importlib
+import threading
+import types
+
+_attribute_cache = {}
+_attribute_lock = threading.Lock()
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that imports the real module the first time an attribute is read."""
+
+    def __init__(self, name):
+        super().__init__(name)
+        self._module = None
+        self._lock = threading.Lock()
+
+    def _load(self):
+        if self._module is None:
+            with self._lock:
+                if self._module is None:
+                    self._module = importlib.import_module(self.__name__)
+        return self._module
+
+    def __getattr__(self, attribute):
+        return getattr(self._load(), attribute)
+
+    def __dir__(self):
+        return dir(self._load())
+
+
+def lazy_import(name):
+    """Return a proxy for a module that is imported on first attribute access."""
+    return LazyModule(name)
+
+
+def load_attribute(path):
+    """Import and return `module:attribute`, caching the result for later calls."""
+    attribute = _attribute_cache.get(path)
+    if attribute is None:
+        with _attribute_lock:
+            attribute = _attribute_cache.get(path)
+            if attribute is None:
+                module_name, _, attribute_name = path.partition(":")
+                attribute = getattr(importlib.import_module(module_name), attribute_name)
+                _attribute_cache[path] = attribute
+    return attribute
@@ -1,9 +1,11 @@
-import pandas as pd
 import streamlit as st
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import seaborn as sns
+from llm_utils.lazy_imports import lazy_import
+
+pd = lazy_import("pandas")
+gpd = lazy_import("geopandas")
+plt = lazy_import("matplotlib.pyplot")
+sns = lazy_import("seaborn")
  
 def neighbourhood_select():
     nb = './Assets/Neighbourhoods - 4326/Neighbourhoods - 4326.shp'
@@ -0,0 +1,94 @@
+"""Token-budgeted conversation memory that compacts older turns into a summary."""
+from functools import lru_cache
+
+from langchain_core.messages import HumanMessage
+
+
+@lru_cache(maxsize=1)
+def get_encoding():
+    """Load the tiktoken encoding once, or return None if tiktoken or its data is unavailable."""
+    try:
+        import tiktoken
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception:  # tiktoken is optional and downloads its encoding on first use
+        return None
+
+
+@lru_cache(maxsize=4096)
+def count_tokens(text: str) -> int:
+    """Count the tokens in a text, estimating 4 characters per token without tiktoken."""
+    encoding = get_encoding()
+    if encoding is not None:
+        return len(encoding.encode(text))
+    return len(text) // 4 + 1
+
+
+def count_message_tokens(messages) -> int:
+    """Count the tokens of a list of messages."""
+    return sum(count_tokens(message.content) for message in messages)
+
+
+class MemoryManager:
+    """
+    Keeps the conversation history sent to the model within a token budget.
+
+    The first message (the neighbourhood intake) is always kept. When the
+    history exceeds the budget, the most recent turns are kept as a sliding
+    window and the user's answers from the older turns are folded into the
+    pinned message as a short summary, so roles keep alternating.
+    """
+
+    def __init__(self, token_budget=2000, summary_token_limit=300):
+        self.token_budget = token_budget
+        self.summary_token_limit = summary_token_limit
+        self.last_stats = {}
+
+    def compact(self, messages):
+        """Return the messages to send, compacted to fit the token budget."""
+        before = count_message_tokens(messages)
+        compacted = messages
+        if before > self.token_budget and len(messages) > 2:
+            compacted = self._compact(messages)
+        after = count_message_tokens(compacted)
+        self.last_stats = {"before": before, "after": after,
+                           "messages_before": len(messages), "messages_after": len(compacted)}
+        return compacted
+
+    def _compact(self, messages):
+        pinned = messages[0]
+        available = self.token_budget - count_tokens(pinned.content) - self.summary_token_limit
+
+        # The window starts on an AI message (odd index) so it follows the pinned human message.
+        start = len(messages) - 1
+        used = count_tokens(messages[start].content)
+        while start - 1 > 0:
+            candidate = count_tokens(messages[start - 1].content)
+            if used + candidate > available:
+                break
+            start -= 1
+            used += candidate
+        if start % 2 == 0:
+            start += 1
+        if start >= len(messages):
+            start = len(messages) - 1 if len(messages) % 2 == 0 else len(messages) - 2
+
+        summary = self._summarise(messages[1:start])
+        if summary:
+            pinned = HumanMessage(
+                content=f"{pinned.content}\n\nEarlier answers:\n{summary}")
+        return [pinned] + messages[start:]
+
+    def _summarise(self, dropped):
+        """Keep the user's most recent answers from the dropped turns within the summary limit."""
+        lines = []
+        used = 0
+        for message in reversed(dropped):
+            if not isinstance(message, HumanMessage):
+                continue
+            text = message.content.strip()
+            tokens = count_tokens(text)
+            if used + tokens > self.summary_token_limit:
+                break
+            lines.append(text)
+            used += tokens
+        return "\n".join(reversed(lines))
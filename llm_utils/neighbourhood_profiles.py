@@ -0,0 +1,189 @@
+"""Columnar store of the 2021 neighbourhood profiles, converted once from the Excel workbook.
+
+Build it with `python -m llm_utils.neighbourhood_profiles`, and again whenever
+the workbook changes; the app never opens the workbook. The workbook's
+indicator rows become columns of a neighbourhood x indicator float32 matrix
+saved as .npy (memory-mapped on load), with the indicator keys and the
+neighbourhood numbers and names saved alongside as JSON.
+"""
+import hashlib
+import json
+import logging
+import re
+import threading
+from pathlib import Path
+from typing import Optional
+
+from llm_utils.lazy_imports import lazy_import
+from llm_utils.offline_store import StoreUnavailable, source_is_current, source_stamp
+
+logger = logging.getLogger(__name__)
+
+np = lazy_import("numpy")
+
+ASSETS = Path(__file__).resolve().parent.parent / "Assets"
+PROFILES_XLSX = ASSETS / "neighbourhood-profiles-2021-158-model.xlsx"
+PROFILE_STORE_DIR = ASSETS / "profile_store"
+PROFILE_SHEET = "hd2021_census_profile"
+
+# Indicators added to the intake prompt, as (key, label, format).
+CONTEXT_INDICATORS = (
+    ("Total - Age groups of the population - 25% sample data", "population", "{:,.0f}"),
+    ("Average age of the population", "average age", "{:.1f}"),
+    ("Total - Income statistics for private households - 25% sample data > "
+     "Median total income of household in 2020 ($)", "median household income", "${:,.0f}"),
+    ("Prevalence of low income based on the Low-income measure, after tax (LIM-AT) (%)",
+     "low income rate", "{:.1f}%"),
+    ("Unemployment rate", "unemployment rate", "{:.1f}%"),
+)
+
+NUMBER_PATTERN = re.compile(r"\((\d+)\)\s*$")
+
+
+def source_hash(source=PROFILES_XLSX):
+    """Hash the workbook the store is built from."""
+    return hashlib.sha256(Path(source).read_bytes()).hexdigest()
+
+
+def indicator_keys(labels):
+    """
+    Turn the workbook's indented row labels into unique indicator keys.
+
+    Labels repeat under different sections (e.g. "65 years and over"), so each
+    key is the path of its indentation ancestors joined with " > ", with a
+    "#n" suffix for the few paths that still repeat.
+    """
+    keys = []
+    seen = {}
+    stack = []
+    for label in labels:
+        label = str(label)
+        depth = len(label) - len(label.lstrip(" "))
+        while stack and stack[-1][0] >= depth:
+            stack.pop()
+        stack.append((depth, label.strip()))
+        key = " > ".join(part for _, part in stack)
+        seen[key] = seen.get(key, 0) + 1
+        keys.append(key if seen[key] == 1 else f"{key} #{seen[key]}")
+    return keys
+
+
+def build_profile_store(source=PROFILES_XLSX, store_dir=PROFILE_STORE_DIR):
+    """Convert the profiles workbook into the columnar store."""
+    # Imported here so the app only needs openpyxl when building the store.
+    import openpyxl
+
+    workbook = openpyxl.load_workbook(source, read_only=True, data_only=True)
+    rows = list(workbook[PROFILE_SHEET].iter_rows(values_only=True))
+    workbook.close()
+
+    names = [str(name) for name in rows[0][1:]]
+    numbers = [int(number) for number in rows[1][1:]]
+    designations = [str(designation) for designation in rows[2][1:]]
+    indicator_rows = rows[3:]
+
+    values = np.full((len(numbers), len(indicator_rows)), np.nan, dtype=np.float32)
+    for column, row in enumerate(indicator_rows):
+        for index, value in enumerate(row[1:]):
+            if isinstance(value, (int, float)):
+                values[index, column] = value
+
+    store_dir = Path(store_dir)
+    store_dir.mkdir(parents=True, exist_ok=True)
+    np.save(store_dir / "values.npy", values)
+    (store_dir / "indicators.json").write_text(
+        json.dumps(indicator_keys(row[0] for row in indicator_rows)), encoding="utf-8")
+    (store_dir / "neighbourhoods.json").write_text(json.dumps(
+        {"numbers": numbers, "names": names, "designations": designations}), encoding="utf-8")
+    meta = {"source_hash": source_hash(source), "source_stamp": source_stamp([source]),
+            "shape": list(values.shape)}
+    (store_dir / "meta.json").write_text(json.dumps(meta), encoding="utf-8")
+    return meta
+
+
+class NeighbourhoodProfiles:
+    """Read-only neighbourhood x indicator lookups with O(1) access per neighbourhood."""
+
+    def __init__(self, store_dir=PROFILE_STORE_DIR):
+        store_dir = Path(store_dir)
+        if not (store_dir / "meta.json").exists():
+            raise StoreUnavailable(
+                f"{store_dir} is missing; build it with `python -m llm_utils.neighbourhood_profiles`")
+        self.meta = json.loads((store_dir / "meta.json").read_text(encoding="utf-8"))
+        self.values = np.load(store_dir / "values.npy", mmap_mode="r")
+        self.indicators = json.loads((store_dir / "indicators.json").read_text(encoding="utf-8"))
+        neighbourhoods = json.loads(
+            (store_dir / "neighbourhoods.json").read_text(encoding="utf-8"))
+        self.names = neighbourhoods["names"]
+        self.designations = neighbourhoods["designations"]
+        self.rows = {number: row for row, number in enumerate(neighbourhoods["numbers"])}
+        self.columns = {key: column for column, key in enumerate(self.indicators)}
+
+    def is_stale(self, source=PROFILES_XLSX):
+        """Return True if the workbook changed after the store was built."""
+        return not source_is_current(self.meta, [source], lambda: source_hash(source))
+
+    def row(self, neighbourhood):
+        """Return the row of a neighbourhood number or an "Name (number)" label, or None."""
+        if isinstance(neighbourhood, str):
+            match = NUMBER_PATTERN.search(neighbourhood)
+            if match is None:
+                return None
+            neighbourhood = int(match.group(1))
+        return self.rows.get(neighbourhood)
+
+    def profile(self, neighbourhood):
+        """Return every indicator of a neighbourhood as a vector, or None if unknown."""
+        row = self.row(neighbourhood)
+        return None if row is None else self.values[row]
+
+    def value(self, neighbourhood, indicator):
+        """Return a single indicator of a neighbourhood, or None if unknown or missing."""
+        row = self.row(neighbourhood)
+        column = self.columns.get(indicator)
+        if row is None or column is None:
+            return None
+        value = float(self.values[row, column])
+        return None if value != value else value
+
+    def context(self, neighbourhood):
+        """Format the context indicators of a neighbourhood for the intake prompt."""
+        parts = []
+        for key, label, value_format in CONTEXT_INDICATORS:
+            value = self.value(neighbourhood, key)
+            if value is not None:
+                parts.append(f"{label} {value_format.format(value)}")
+        row = self.row(neighbourhood)
+        if row is not None:
+            parts.append(self.designations[row])
+        return ", ".join(parts)
+
+
+_profiles = None
+_profiles_error = None
+_profiles_lock = threading.Lock()
+
+
+def get_profiles(store_dir=PROFILE_STORE_DIR) -> Optional[NeighbourhoodProfiles]:
+    """
+    Return the process-wide profile store, or None if it is missing, stale or unreadable.
+
+    The failure is logged once and remembered, so callers degrade without retrying.
+    """
+    global _profiles, _profiles_error
+    with _profiles_lock:
+        if _profiles is None and _profiles_error is None:
+            try:
+                profiles = NeighbourhoodProfiles(store_dir)
+                if profiles.is_stale():
+                    raise StoreUnavailable(f"{store_dir} is stale; rebuild it with "
+                                           "`python -m llm_utils.neighbourhood_profiles`")
+                _profiles = profiles
+            except Exception as error:
+                _profiles_error = error
+                logger.warning("Neighbourhood profiles unavailable: %s", error)
+        return _profiles
+
+
+if __name__ == "__main__":
+    print(build_profile_store())
@@ -0,0 +1,88 @@
+"""Point-in-polygon resolution of coordinates to Toronto neighbourhoods."""
+import threading
+from typing import Optional
+
+from llm_utils.geometry_cache import NEIGHBOURHOODS_SHP, get_geometry_cache
+from llm_utils.lazy_imports import lazy_import
+from llm_utils.offline_store import StoreUnavailable
+
+np = lazy_import("numpy")
+shapely = lazy_import("shapely")
+
+
+class NeighbourhoodResolver:
+    """
+    Resolves latitude/longitude points to the neighbourhood polygon containing them.
+
+    The geometries are loaded once and indexed with an STRtree, so a query only
+    runs exact point-in-polygon tests against the few polygons whose bounding
+    boxes contain the point. Batches are resolved in a single vectorised query.
+    """
+
+    def __init__(self, geometries, names, area_ids):
+        self.geometries = np.asarray(geometries)
+        self.names = np.asarray(names, dtype=object)
+        self.area_ids = np.asarray(area_ids)
+        shapely.prepare(self.geometries)
+        self.tree = shapely.STRtree(self.geometries)
+
+    @classmethod
+    def from_shapefile(cls, path=NEIGHBOURHOODS_SHP):
+        """Build the resolver from the EPSG:4326 neighbourhood shapefile."""
+        # Imported here so the resolver only needs geopandas when reading the shapefile.
+        import geopandas as gpd
+
+        regions = gpd.read_file(path)
+        return cls(regions.geometry.values, regions["AREA_DE8"].values,
+                   regions["AREA_ID2"].values)
+
+    @classmethod
+    def from_geometry_cache(cls, cache=None):
+        """Build the resolver from the pre-converted geometry cache."""
+        cache = get_geometry_cache() if cache is None else cache
+        if cache is None:
+            raise StoreUnavailable("The neighbourhood geometry cache is unavailable")
+        return cls(cache.geometries(), cache.names, cache.area_ids)
+
+    def resolve(self, lat, lon):
+        """Return {"AREA_DE8": ..., "AREA_ID": ...} for a point, or None outside Toronto."""
+        indices = self.resolve_indices([lat], [lon])
+        if indices[0] < 0:
+            return None
+        return {"AREA_DE8": self.names[indices[0]], "AREA_ID": int(self.area_ids[indices[0]])}
+
+    def resolve_many(self, lats, lons):
+        """Return arrays of AREA_DE8 names (None outside) and AREA_IDs (-1 outside) for a batch."""
+        indices = self.resolve_indices(lats, lons)
+        inside = indices >= 0
+        names = np.full(len(indices), None, dtype=object)
+        area_ids = np.full(len(indices), -1, dtype=np.int64)
+        names[inside] = self.names[indices[inside]]
+        area_ids[inside] = self.area_ids[indices[inside]]
+        return names, area_ids
+
+    def resolve_indices(self, lats, lons):
+        """Return the index of the containing polygon for each point, or -1 if none contains it."""
+        points = shapely.points(np.asarray(lons, dtype=float), np.asarray(lats, dtype=float))
+        point_index, polygon_index = self.tree.query(points, predicate="intersects")
+        indices = np.full(len(points), -1, dtype=np.int64)
+        # Points on a shared border match several polygons; keep the lowest polygon index.
+        order = np.lexsort((polygon_index, point_index))
+        matched, first = np.unique(point_index[order], return_index=True)
+        indices[matched] = polygon_index[order][first]
+        return indices
+
+
+_resolver = None
+_resolver_lock = threading.Lock()
+
+
+def get_resolver() -> Optional[NeighbourhoodResolver]:
+    """Return the process-wide neighbourhood resolver, or None if the geometry is unavailable."""
+    global _resolver
+    with _resolver_lock:
+        if _resolver is None:
+            cache = get_geometry_cache()
+            if cache is not None:
+                _resolver = NeighbourhoodResolver.from_geometry_cache(cache)
+        return _resolver
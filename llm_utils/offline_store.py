@@ -0,0 +1,36 @@
+"""Helpers for the stores that are built offline from the source data files.
+
+The app never builds a store on the request path. A missing, stale or
+unreadable store is reported as StoreUnavailable and the feature that needs
+it degrades instead of failing the page.
+"""
+from pathlib import Path
+
+
+class StoreUnavailable(RuntimeError):
+    """An offline-built store is missing, stale or unreadable."""
+
+
+def source_stamp(paths):
+    """Return the size and modification time of each source file, keyed by file name."""
+    stamp = {}
+    for path in paths:
+        stat = Path(path).stat()
+        stamp[Path(path).name] = [stat.st_size, stat.st_mtime_ns]
+    return stamp
+
+
+def source_is_current(meta, paths, compute_hash):
+    """
+    Return True if a store's metadata still matches its source files.
+
+    The size and mtime stamp is compared first, so an unchanged source is not
+    re-hashed on every start; the content hash settles the stamp mismatches,
+    e.g. after a fresh checkout. A store deployed without its sources is
+    trusted as built.
+    """
+    if not all(Path(path).exists() for path in paths):
+        return True
+    if meta.get("source_stamp") == source_stamp(paths):
+        return True
+    return compute_hash() == meta.get("source_hash")
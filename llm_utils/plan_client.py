@@ -0,0 +1,134 @@
+"""Pooled, retrying HTTP client for the plan generation service."""
+import os
+import random
+import threading
+import time
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.exceptions import NewConnectionError
+
+from llm_utils.tracing import LatencyHistogram, current_turn
+
+PLAN_SERVICE_URL = os.environ.get("PLAN_SERVICE_URL", "https://api.ai-fundamentals.live/api2")
+
+RETRY_STATUSES = {429, 500, 502, 503, 504}
+# Statuses that mean the service did not accept the request, safe to retry for any call.
+REJECTED_STATUSES = {429, 503}
+
+
+class PlanServiceClient:
+    """
+    Client for the plan service built on a shared, pooled requests.Session.
+
+    Connections are kept alive between calls, every request has connect and
+    read timeouts, and connection errors, timeouts and retryable status codes
+    are retried a bounded number of times with full-jitter exponential backoff.
+    A call given a `deadline` (a time.monotonic() value) shortens its timeouts
+    and backoff to the time left, so the whole call, retries included, ends by
+    the deadline. Non-idempotent calls are only retried when the service cannot
+    have acted on the request: a failed connection or a 429/503 response.
+    Latencies are recorded per endpoint, including failed attempts.
+    """
+
+    def __init__(self, base_url=PLAN_SERVICE_URL, connect_timeout=5.0, read_timeout=120.0,
+                 retries=2, backoff=0.5, max_backoff=8.0, pool_size=20):
+        self.base_url = base_url.rstrip("/")
+        self.connect_timeout = connect_timeout
+        self.read_timeout = read_timeout
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+        self.session.headers.update({"Content-Type": "application/json"})
+        self.latencies = {}
+        self.latencies_lock = threading.Lock()
+
+    def post(self, endpoint, payload, deadline=None, idempotent=True):
+        """
+        POSTs a JSON payload to an endpoint, retrying transient failures, and returns the JSON.
+
+        Raises requests.exceptions.Timeout when the deadline passes before a
+        response arrives.
+        """
+        url = f"{self.base_url}/{endpoint}"
+        retry_statuses = RETRY_STATUSES if idempotent else REJECTED_STATUSES
+        for attempt in range(self.retries + 1):
+            timeout = self.attempt_timeout(endpoint, deadline)
+            delay = random.uniform(0, min(self.max_backoff, self.backoff * 2 ** attempt))
+            can_retry = attempt < self.retries and (
+                deadline is None or time.monotonic() + delay < deadline)
+            start = time.perf_counter()
+            try:
+                response = self.session.post(url, json=payload, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as error:
+                if not can_retry or not (idempotent or request_not_sent(error)):
+                    raise
+            else:
+                if not can_retry or response.status_code not in retry_statuses:
+                    response.raise_for_status()
+                    return response.json()
+            finally:
+                elapsed = time.perf_counter() - start
+                self.histogram(endpoint).observe(elapsed)
+                trace = current_turn()
+                trace.increment(f"plan_{endpoint}_latency", elapsed)
+                trace.increment(f"plan_{endpoint}_attempts")
+            time.sleep(delay)
+        return None
+
+    def attempt_timeout(self, endpoint, deadline):
+        """Returns the (connect, read) timeout of an attempt, capped by the time left."""
+        if deadline is None:
+            return self.connect_timeout, self.read_timeout
+        remaining = deadline - time.monotonic()
+        if remaining <= 0:
+            raise requests.exceptions.Timeout(f"Deadline passed before calling {endpoint}")
+        return min(self.connect_timeout, remaining), min(self.read_timeout, remaining)
+
+    def send_plan(self, input_data, id, deadline=None):
+        """Requests a safety plan for the given survey input; not retried once it may have arrived."""
+        return self.post("plan", {"inputData": input_data, "id": id}, deadline, idempotent=False)
+
+    def get_plan(self, id, deadline=None):
+        """Retrieves the generated plan for an id."""
+        return self.post("getPlan", {"id": id}, deadline)
+
+    def histogram(self, endpoint):
+        """Returns the latency histogram of an endpoint, creating it on first use."""
+        with self.latencies_lock:
+            if endpoint not in self.latencies:
+                self.latencies[endpoint] = LatencyHistogram()
+            return self.latencies[endpoint]
+
+    def latency_stats(self):
+        """Returns a snapshot of the latency histograms of all endpoints."""
+        with self.latencies_lock:
+            histograms = dict(self.latencies)
+        return {endpoint: histogram.snapshot() for endpoint, histogram in histograms.items()}
+
+
+def request_not_sent(error):
+    """Returns True if a requests exception means the request never reached the service."""
+    if isinstance(error, requests.exceptions.ConnectTimeout):
+        return True
+    if isinstance(error, requests.exceptions.ReadTimeout):
+        return False
+    reason = getattr(error.args[0], "reason", None) if error.args else None
+    return isinstance(reason, NewConnectionError)
+
+
+_client = None
+_client_lock = threading.Lock()
+
+
+def get_plan_client():
+    """Return the process-wide plan service client."""
+    global _client
+    with _client_lock:
+        if _client is None:
+            _client = PlanServiceClient()
+        return _client
@@ -1,13 +1,16 @@
 """assemble prompt string based on user input"""
+from llm_utils.neighbourhood_profiles import get_profiles
+from llm_utils.risk_index import get_risk_index
 
 
-def prompt_assembly(user_ui_inputs: dict, user_text_input: str) -> str:
+def prompt_assembly(user_ui_inputs: dict, user_text_input: str, survey_record=None) -> str:
     """
     Assembles a prompt string based on the user's UI inputs and text input.
 
     Args:
         user_ui_inputs (dict): A dictionary containing the user's UI inputs.
         user_text_input: The user's text input.
+        survey_record (SurveyRecord, optional): Records each answered UI input.
 
     Returns:
         str: The assembled prompt string.
@@ -16,8 +19,28 @@ def prompt_assembly(user_ui_inputs: dict, user_text_input: str) -> str:
     for key, value in user_ui_inputs.items():
         if value != "None":
             prompt += f"{key}: {value};\n"
+            if survey_record is not None:
+                survey_record.record_answer(key, value)
 
     if user_text_input:
         prompt += f"{user_text_input}; "
 
     return prompt
+
+
+def intake_prompt(region: str) -> str:
+    """
+    Assembles the intake prompt for a neighbourhood from its offence risks and profile.
+
+    Args:
+        region (str): The neighbourhood label, e.g. "Agincourt North (129)".
+
+    Returns:
+        str: The offence risks, followed by a profile line when the profile store is available.
+    """
+    prompt = get_risk_index().describe(region)
+    profiles = get_profiles()
+    context = profiles.context(region) if profiles is not None else ""
+    if context:
+        prompt += f"\nNeighbourhood profile: {context}"
+    return prompt
@@ -0,0 +1,179 @@
+"""Response cache for the deterministic first turn, with in-memory and SQLite backends."""
+import argparse
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+from abc import ABC, abstractmethod
+from collections import OrderedDict
+
+
+def make_cache_key(model_name: str, prompt_hash: str, risk_profile: str) -> str:
+    """Build a cache key from the model name, the prompt hash and the intake risk profile."""
+    return hashlib.sha256(
+        "\x1f".join((model_name, prompt_hash, risk_profile)).encode("utf-8")).hexdigest()
+
+
+class ResponseCache(ABC):
+    """Base class for response caches, counting hits and misses under the backend's lock."""
+
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Returns the cached value for a key, or None on a miss."""
+        value = self._get(key)
+        with self.lock:
+            if value is None:
+                self.misses += 1
+            else:
+                self.hits += 1
+        return value
+
+    def set(self, key, value):
+        """Stores a JSON-serialisable value under a key."""
+        self._set(key, value)
+
+    def stats(self):
+        """Returns the hit and miss counters."""
+        with self.lock:
+            return {"hits": self.hits, "misses": self.misses}
+
+    @abstractmethod
+    def _get(self, key):
+        """Returns the stored value for a key, or None if it is missing or expired."""
+
+    @abstractmethod
+    def _set(self, key, value):
+        """Stores a JSON-serialisable value under a key."""
+
+
+class InMemoryResponseCache(ResponseCache):
+    """Process-local LRU cache with an optional time-to-live in seconds."""
+
+    def __init__(self, maxsize=512, ttl=None, clock=time.time):
+        super().__init__()
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.clock = clock
+        self.entries = OrderedDict()
+
+    def _get(self, key):
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            created, value = entry
+            if self.ttl is not None and self.clock() - created > self.ttl:
+                del self.entries[key]
+                return None
+            self.entries.move_to_end(key)
+            return value
+
+    def _set(self, key, value):
+        with self.lock:
+            self.entries[key] = (self.clock(), value)
+            self.entries.move_to_end(key)
+            while len(self.entries) > self.maxsize:
+                self.entries.popitem(last=False)
+
+
+class SQLiteResponseCache(ResponseCache):
+    """Cache persisted in a local SQLite file, shared across processes and restarts."""
+
+    def __init__(self, path, ttl=None, clock=time.time):
+        super().__init__()
+        self.ttl = ttl
+        self.clock = clock
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        with self.lock, self.connection:
+            self.connection.execute(
+                "CREATE TABLE IF NOT EXISTS responses "
+                "(key TEXT PRIMARY KEY, value TEXT NOT NULL, created REAL NOT NULL)")
+
+    def _get(self, key):
+        with self.lock:
+            row = self.connection.execute(
+                "SELECT value, created FROM responses WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if self.ttl is not None and self.clock() - created > self.ttl:
+            return None
+        return json.loads(value)
+
+    def _set(self, key, value):
+        with self.lock, self.connection:
+            self.connection.execute(
+                "INSERT OR REPLACE INTO responses (key, value, created) VALUES (?, ?, ?)",
+                (key, json.dumps(value), self.clock()))
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def default_response_cache():
+    """
+    Return the process-wide response cache selected by the environment.
+
+    RESPONSE_CACHE_DB points to a SQLite file; RESPONSE_CACHE=off disables
+    caching; otherwise an in-memory LRU with a one day TTL is used.
+    """
+    global _default_cache
+    if os.environ.get("RESPONSE_CACHE") == "off":
+        return None
+    with _default_cache_lock:
+        if _default_cache is None:
+            if os.environ.get("RESPONSE_CACHE_DB"):
+                _default_cache = SQLiteResponseCache(os.environ["RESPONSE_CACHE_DB"])
+            else:
+                _default_cache = InMemoryResponseCache(ttl=24 * 60 * 60)
+        return _default_cache
+
+
+class _NullContainer:
+    """Container that discards rendered markdown during pre-warming."""
+
+    def markdown(self, _text):
+        """Ignores the rendered text."""
+
+
+def prewarm(cache, api_keys, model_name_conv="gpt-4-turbo", model_name_ui="gpt-4-turbo"):
+    """Fill the cache with the first-turn response of every neighbourhood."""
+    # Imported here so the cache module does not depend on the agents.
+    from langchain_core.messages import HumanMessage
+
+    from llm_utils.conversation import Conversation
+    from llm_utils.prompt_assembly import intake_prompt, prompt_assembly
+    from llm_utils.risk_index import get_risk_index
+    from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
+
+    index = get_risk_index()
+    for name in index.names:
+        conversation = Conversation(api_keys, model_name_conv, model_name_ui,
+                                    response_cache=cache)
+        message = HumanMessage(role="user", content=prompt_assembly({}, intake_prompt(name)))
+        conversation(message, StreamUntilSpecialTokenHandler(_NullContainer()))
+        print(f"Pre-warmed {name}: {cache.stats()}")
+
+
+def main():
+    """Command line entry point for pre-warming a SQLite response cache."""
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("db", help="Path of the SQLite cache file")
+    parser.add_argument("--model-conv", default="gpt-4-turbo")
+    parser.add_argument("--model-ui", default="gpt-4-turbo")
+    args = parser.parse_args()
+
+    api_keys = {"openai": os.environ.get("OPENAI_API_KEY"),
+                "google": os.environ.get("GOOGLE_API_KEY")}
+    prewarm(SQLiteResponseCache(args.db), api_keys, args.model_conv, args.model_ui)
+
+
+if __name__ == "__main__":
+    main()
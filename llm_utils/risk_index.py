@@ -0,0 +1,61 @@
+"""Process-wide, load-once index of safety risks by neighbourhood and offence."""
+import csv
+import os
+import threading
+from pathlib import Path
+
+RISK_CSV = Path(__file__).resolve().parent.parent / "Assets" / "Safety Risks by Neighbourhood & Offence.csv"
+
+
+class RiskIndex:
+    """Immutable neighbourhood -> [(offence, risk), ...] mapping built from the risk CSV."""
+
+    def __init__(self, risks: dict, mtime: float):
+        self.risks = risks
+        self.names = sorted(risks)
+        self.mtime = mtime
+
+    @classmethod
+    def from_csv(cls, path=RISK_CSV):
+        """Build the index from the CSV file, keeping the file's row order per neighbourhood."""
+        mtime = os.stat(path).st_mtime
+        risks = {}
+        with open(path, "r", encoding="utf-8-sig", newline="") as file:
+            for row in csv.DictReader(file):
+                risks.setdefault(row["Neighbourhood"], []).append(
+                    (row["Offence Group"], row["Safety Risk"]))
+        risks = {name: tuple(offences) for name, offences in risks.items()}
+        return cls(risks, mtime)
+
+    def get(self, neighbourhood):
+        """Return the (offence, risk) pairs for a neighbourhood, or an empty tuple."""
+        return self.risks.get(neighbourhood, ())
+
+    def describe(self, neighbourhood):
+        """Format the offence risks of a neighbourhood as the intake prompt."""
+        offences_str = ', '.join(f"{offence}: {risk}" for offence, risk in self.get(neighbourhood))
+        return f"Neighbourhood: {neighbourhood} - {offences_str}"
+
+
+_indexes = {}
+_index_lock = threading.Lock()
+
+
+def get_risk_index(path=RISK_CSV) -> RiskIndex:
+    """
+    Return the shared risk index of a CSV file, rebuilding it only when the file's mtime changes.
+
+    The index is shared by every session in the process, so a rerun costs one
+    stat call and a dict lookup instead of a CSV read and a DataFrame filter.
+    Indexes are kept per path, so files with the same mtime never share one.
+    """
+    key = os.path.abspath(path)
+    mtime = os.stat(key).st_mtime
+    index = _indexes.get(key)
+    if index is not None and index.mtime == mtime:
+        return index
+    with _index_lock:
+        index = _indexes.get(key)
+        if index is None or index.mtime != mtime:
+            index = _indexes[key] = RiskIndex.from_csv(key)
+        return index
@@ -0,0 +1,160 @@
+"""Pre-rendered choropleth maps of safety risk per offence group, cached on disk.
+
+Maps are rendered offline with `python -m llm_utils.risk_maps`, or once in a
+background thread, into a directory named after a hash of the geometry, the
+risk data and the map style. The request path only looks up existing images.
+A render that fails, or a missing geometry cache, shows a fallback image;
+a failed render is retried with an exponential back-off.
+"""
+import hashlib
+import logging
+import os
+import threading
+import time
+from pathlib import Path
+
+from llm_utils.geometry_cache import get_geometry_cache
+from llm_utils.offline_store import StoreUnavailable
+from llm_utils.risk_index import RISK_CSV, get_risk_index
+
+logger = logging.getLogger(__name__)
+
+ASSETS = Path(__file__).resolve().parent.parent / "Assets"
+MAP_CACHE_DIR = ASSETS / "map_cache"
+FALLBACK_MAP = ASSETS / "risk_map_unavailable.png"
+
+# Seconds before a failed render is retried, doubling per consecutive failure.
+RENDER_RETRY_SECONDS = 60
+RENDER_RETRY_MAX_SECONDS = 60 * 60
+
+# Bump when the rendering below changes so cached images are invalidated.
+MAP_STYLE_VERSION = "1"
+RISK_COLOURS = {"Low": "#4caf50", "Medium": "#ff9800", "High": "#f44336"}
+NO_DATA_COLOUR = "#bdbdbd"
+
+
+def data_version(geometry):
+    """Hash the geometry, the risk CSV and the map style the images depend on."""
+    digest = hashlib.sha256()
+    digest.update(geometry.meta["source_hash"].encode("utf-8"))
+    digest.update(Path(RISK_CSV).read_bytes())
+    digest.update(MAP_STYLE_VERSION.encode("utf-8"))
+    return digest.hexdigest()[:16]
+
+
+def offence_groups():
+    """Return the offence groups present in the risk data, in file order."""
+    groups = []
+    for offences in get_risk_index().risks.values():
+        for offence, _ in offences:
+            if offence not in groups:
+                groups.append(offence)
+    return groups
+
+
+def map_filename(offence):
+    """Return the image file name of an offence group."""
+    return offence.lower().replace(" ", "_") + ".png"
+
+
+def render_risk_maps(cache_dir=MAP_CACHE_DIR, version=None, level="z12"):
+    """Render one choropleth PNG per offence group into the versioned cache directory."""
+    # Imported here so the app never loads matplotlib on the request path.
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+    import shapely
+    from matplotlib.collections import PolyCollection
+    from matplotlib.patches import Patch
+
+    geometry = get_geometry_cache()
+    if geometry is None:
+        raise StoreUnavailable("Build the geometry cache with `python -m llm_utils.geometry_cache`")
+    version = data_version(geometry) if version is None else version
+    output_dir = Path(cache_dir) / version
+    output_dir.mkdir(parents=True, exist_ok=True)
+
+    exteriors = [shapely.get_coordinates(ring)
+                 for ring in shapely.get_exterior_ring(geometry.geometries(level))]
+    index = get_risk_index()
+
+    for offence in offence_groups():
+        colours = []
+        for name in geometry.names:
+            risks = dict(index.get(str(name)))
+            colours.append(RISK_COLOURS.get(risks.get(offence), NO_DATA_COLOUR))
+
+        figure, axes = plt.subplots(figsize=(8, 5), dpi=120)
+        axes.add_collection(PolyCollection(
+            exteriors, facecolors=colours, edgecolors="white", linewidths=0.3))
+        axes.autoscale_view()
+        axes.set_aspect(1 / 0.72)  # roughly equal-area at Toronto's latitude
+        axes.set_axis_off()
+        axes.set_title(f"{offence} risk by neighbourhood")
+        axes.legend(handles=[Patch(color=colour, label=risk)
+                             for risk, colour in RISK_COLOURS.items()],
+                    loc="lower right", frameon=False)
+
+        target = output_dir / map_filename(offence)
+        temporary = target.with_suffix(".tmp.png")
+        figure.savefig(temporary, bbox_inches="tight", transparent=True)
+        plt.close(figure)
+        os.replace(temporary, target)
+    return output_dir
+
+
+_version = None
+_version_mtime = None
+_render_thread = None
+_render_failures = 0
+_render_retry_at = 0.0
+_render_lock = threading.Lock()
+
+
+def render_in_background(cache_dir, version):
+    """Render the maps, recording a failure so the next render waits for the back-off."""
+    global _render_failures, _render_retry_at
+    try:
+        render_risk_maps(cache_dir, version)
+    except Exception:
+        logger.exception("Rendering the risk maps failed")
+        with _render_lock:
+            _render_failures += 1
+            _render_retry_at = time.monotonic() + min(
+                RENDER_RETRY_MAX_SECONDS, RENDER_RETRY_SECONDS * 2 ** (_render_failures - 1))
+    else:
+        with _render_lock:
+            _render_failures = 0
+
+
+def risk_map_path(offence, cache_dir=MAP_CACHE_DIR):
+    """
+    Return the cached map image of an offence group, or None if it is not rendered yet.
+
+    A missing image starts a single background render instead of drawing on the
+    request path. While the last render's back-off lasts, or without the
+    geometry cache, the fallback image is returned instead.
+    """
+    global _version, _version_mtime, _render_thread
+    geometry = get_geometry_cache()
+    if geometry is None:
+        return FALLBACK_MAP
+    risk_mtime = get_risk_index().mtime
+    with _render_lock:
+        if _version is None or _version_mtime != risk_mtime:
+            _version = data_version(geometry)
+            _version_mtime = risk_mtime
+        path = Path(cache_dir) / _version / map_filename(offence)
+        if path.exists():
+            return path
+        if _render_failures and time.monotonic() < _render_retry_at:
+            return FALLBACK_MAP
+        if _render_thread is None or not _render_thread.is_alive():
+            _render_thread = threading.Thread(
+                target=render_in_background, args=(cache_dir, _version), daemon=True)
+            _render_thread.start()
+    return None
+
+
+if __name__ == "__main__":
+    print(render_risk_maps())
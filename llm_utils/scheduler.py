@@ -0,0 +1,450 @@
+"""Process-wide scheduler of model calls, with per-model rate limits and per-provider concurrency.
+
+Every model returned by `Conversation.create_model` is wrapped in a
+ScheduledChatModel, which waits for the scheduler's go-ahead before calling
+the provider. A call needs a free slot of its provider ("provider_concurrency"
+in configs/config.json) and room in its model's request and token buckets
+("rate_limits", per minute). Waiting calls are granted in priority order,
+interactive conversational calls before background UI agent calls, first come
+first served within a priority.
+
+`submit`, `dispatch`, `release` and `cancel` never block and the clock is
+injectable, so scheduling decisions can be stepped through with a fake clock.
+"""
+import asyncio
+import itertools
+import threading
+import time
+from typing import Any, AsyncIterator, Iterator, List, Optional
+
+from langchain_core.callbacks import AsyncCallbackManagerForLLMRun, CallbackManagerForLLMRun
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessageChunk, BaseMessage
+from langchain_core.outputs import ChatGenerationChunk, ChatResult
+
+from llm_utils.config_loader import shared_config
+from llm_utils.memory import count_message_tokens, count_tokens
+from llm_utils.tracing import current_turn
+
+INTERACTIVE = 0
+BACKGROUND = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BACKGROUND: "background"}
+
+# Provider of each model name offered by Conversation.create_model.
+MODEL_PROVIDERS = {
+    "gpt-3.5-turbo": "openai",
+    "gpt-4-turbo": "openai",
+    "gemini-pro": "google",
+    "fake": "fake",
+    "replay": "fake",
+}
+DEFAULT_CONCURRENCY = 16
+# Charged up front for the completion when a call does not set max_tokens.
+DEFAULT_COMPLETION_TOKENS = 500
+# Providers enforce per-minute limits over shorter periods, so bursts are capped
+# at this many seconds' worth of the limit.
+BURST_SECONDS = 10.0
+
+
+class TokenBucket:
+    """
+    Admits at most `per_minute` units in any 60 second window.
+
+    The bucket holds up to `burst_seconds` worth of the limit and refills at
+    the rest of the limit over a minute, so a full bucket plus a minute of
+    refill is exactly `per_minute`. The guarantee holds for amounts up to the
+    bucket's capacity; a larger amount runs the bucket into debt.
+    """
+
+    def __init__(self, per_minute, clock, burst_seconds=BURST_SECONDS):
+        if not 0 < burst_seconds < 60:
+            raise ValueError("burst_seconds must be between 0 and 60")
+        self.capacity = per_minute * burst_seconds / 60.0
+        self.rate = (per_minute - self.capacity) / 60.0
+        self.level = self.capacity
+        self.clock = clock
+        self.updated = clock()
+
+    def refill(self):
+        now = self.clock()
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount):
+        """Returns the seconds until `amount` units are available, 0 if they are now."""
+        self.refill()
+        # A request larger than the bucket waits for a full bucket and runs into debt.
+        shortfall = min(amount, self.capacity) - self.level
+        # Rounding can leave a vanishing shortfall right after the computed wait.
+        return shortfall / self.rate if shortfall > 1e-9 else 0.0
+
+    def take(self, amount):
+        self.refill()
+        self.level -= amount
+
+    def give(self, amount):
+        """Returns units, or takes more when `amount` is negative."""
+        self.refill()
+        self.level = min(self.capacity, self.level + amount)
+
+
+class FakeClock:
+    """A clock that only moves when told to, for stepping through scheduling decisions."""
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def busiest_minute(starts):
+    """Returns the most (requests, tokens) started within any 60 second window."""
+    starts = sorted(starts)
+    peak_requests = peak_tokens = tokens = first = 0
+    for last, (start, amount) in enumerate(starts):
+        tokens += amount
+        while starts[first][0] <= start - 60:
+            tokens -= starts[first][1]
+            first += 1
+        peak_requests = max(peak_requests, last - first + 1)
+        peak_tokens = max(peak_tokens, tokens)
+    return peak_requests, peak_tokens
+
+
+class Ticket:
+    """A model call waiting for, or holding, the scheduler's go-ahead."""
+
+    def __init__(self, model_name, provider, tokens, priority, sequence, enqueued):
+        self.model_name = model_name
+        self.provider = provider
+        self.tokens = tokens
+        self.priority = priority
+        self.sequence = sequence
+        self.enqueued = enqueued
+        self.queue_depth = 0
+        self.granted = None
+        # Seconds until the rate limits may allow the call; None while it waits for a slot.
+        self.retry_after = None
+        self.event = threading.Event()
+        self.loop = None
+        self.async_event = None
+
+    def __lt__(self, other):
+        return (self.priority, self.sequence) < (other.priority, other.sequence)
+
+    @property
+    def wait_time(self):
+        return None if self.granted is None else self.granted - self.enqueued
+
+    def wake(self):
+        """Wakes the caller waiting on the ticket, from any thread."""
+        self.event.set()
+        if self.loop is not None:
+            self.loop.call_soon_threadsafe(self.async_event.set)
+
+
+class SchedulerStats:
+    """Queue depth and wait time figures of the scheduler; guarded by the scheduler's lock."""
+
+    def __init__(self):
+        self.peak_queue_depth = {}
+        self.waits = {name: {"count": 0, "total": 0.0, "max": 0.0}
+                      for name in PRIORITY_NAMES.values()}
+
+    def observe_depth(self, provider, depth):
+        self.peak_queue_depth[provider] = max(self.peak_queue_depth.get(provider, 0), depth)
+
+    def observe_wait(self, priority, seconds):
+        waits = self.waits[PRIORITY_NAMES[priority]]
+        waits["count"] += 1
+        waits["total"] += seconds
+        waits["max"] = max(waits["max"], seconds)
+
+
+class RequestScheduler:
+    """Grants model calls in priority order within per-provider slots and per-model rate limits."""
+
+    def __init__(self, rate_limits=None, concurrency=None, clock=time.monotonic):
+        self.rate_limits = rate_limits or {}
+        self.concurrency = concurrency or {}
+        self.clock = clock
+        self.lock = threading.Lock()
+        self.queues = {}
+        self.running = {}
+        self.buckets = {}
+        self.sequence = itertools.count()
+        self.stats = SchedulerStats()
+
+    def model_buckets(self, model_name):
+        """Returns the request and token buckets of a model; either is None when unlimited."""
+        buckets = self.buckets.get(model_name)
+        if buckets is None:
+            limits = self.rate_limits.get(model_name, {})
+            buckets = self.buckets[model_name] = tuple(
+                TokenBucket(limits[name], self.clock) if limits.get(name) else None
+                for name in ("requests_per_minute", "tokens_per_minute"))
+        return buckets
+
+    def submit(self, model_name, tokens, priority=INTERACTIVE):
+        """Queues a call and grants it if it can start now; returns its ticket."""
+        provider = MODEL_PROVIDERS.get(model_name, model_name)
+        with self.lock:
+            ticket = Ticket(model_name, provider, tokens, priority, next(self.sequence),
+                            self.clock())
+            queue = self.queues.setdefault(provider, [])
+            queue.append(ticket)
+            ticket.queue_depth = len(queue)
+            self.stats.observe_depth(provider, len(queue))
+            self._dispatch(provider)
+        return ticket
+
+    def dispatch(self, provider=None):
+        """Grants the waiting calls that can start now, for one provider or all of them."""
+        with self.lock:
+            for name in [provider] if provider else list(self.queues):
+                self._dispatch(name)
+
+    def _dispatch(self, provider):
+        queue = self.queues.get(provider, [])
+        limit = self.concurrency.get(provider, DEFAULT_CONCURRENCY)
+        blocked = set()
+        granted = []
+        for ticket in sorted(queue):
+            if self.running.get(provider, 0) >= limit:
+                ticket.retry_after = None
+                continue
+            if ticket.model_name in blocked:
+                # Lower priority calls of a model never overtake its waiting head.
+                ticket.retry_after = None
+                continue
+            buckets = self.model_buckets(ticket.model_name)
+            amounts = (1, ticket.tokens)
+            wait = max([bucket.wait_time(amount)
+                        for bucket, amount in zip(buckets, amounts) if bucket] or [0.0])
+            if wait > 0:
+                blocked.add(ticket.model_name)
+                was_waiting_for_slot = ticket.retry_after is None
+                ticket.retry_after = wait
+                if was_waiting_for_slot:
+                    # It may be waiting without a timeout; wake it to wait for the refill.
+                    ticket.wake()
+                continue
+            for bucket, amount in zip(buckets, amounts):
+                if bucket:
+                    bucket.take(amount)
+            self.running[provider] = self.running.get(provider, 0) + 1
+            ticket.granted = self.clock()
+            self.stats.observe_wait(ticket.priority, ticket.wait_time)
+            granted.append(ticket)
+        if granted:
+            queue[:] = [ticket for ticket in queue if ticket.granted is None]
+            for ticket in granted:
+                ticket.wake()
+
+    def release(self, ticket, used_tokens=None):
+        """Frees a granted call's slot, charging its actual tokens when known."""
+        with self.lock:
+            self.running[ticket.provider] -= 1
+            token_bucket = self.model_buckets(ticket.model_name)[1]
+            if token_bucket and used_tokens is not None:
+                token_bucket.give(ticket.tokens - used_tokens)
+            self._dispatch(ticket.provider)
+
+    def cancel(self, ticket):
+        """Withdraws a waiting call, or releases it if it was already granted."""
+        with self.lock:
+            if ticket.granted is None:
+                queue = self.queues.get(ticket.provider, [])
+                if ticket in queue:
+                    queue.remove(ticket)
+                self._dispatch(ticket.provider)
+                return
+        self.release(ticket)
+
+    def poll(self, ticket):
+        """Dispatches, then returns None if the ticket was granted, else the seconds to wait."""
+        with self.lock:
+            self._dispatch(ticket.provider)
+            if ticket.granted is not None:
+                return None
+            ticket.event.clear()
+            if ticket.async_event is not None:
+                ticket.async_event.clear()
+            return ticket.retry_after if ticket.retry_after is not None else float("inf")
+
+    def acquire(self, model_name, tokens, priority=INTERACTIVE):
+        """Blocks until a call may start; returns its ticket for `release`."""
+        ticket = self.submit(model_name, tokens, priority)
+        try:
+            while True:
+                timeout = self.poll(ticket)
+                if timeout is None:
+                    break
+                ticket.event.wait(None if timeout == float("inf") else timeout)
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        self.record(ticket)
+        return ticket
+
+    async def aacquire(self, model_name, tokens, priority=INTERACTIVE):
+        """Waits on the running event loop until a call may start; returns its ticket."""
+        ticket = self.submit(model_name, tokens, priority)
+        ticket.async_event = asyncio.Event()
+        ticket.loop = asyncio.get_running_loop()
+        try:
+            while True:
+                timeout = self.poll(ticket)
+                if timeout is None:
+                    break
+                try:
+                    await asyncio.wait_for(ticket.async_event.wait(),
+                                           None if timeout == float("inf") else timeout)
+                except asyncio.TimeoutError:
+                    pass
+        except BaseException:
+            self.cancel(ticket)
+            raise
+        self.record(ticket)
+        return ticket
+
+    def record(self, ticket):
+        """Adds a granted call's wait to the active turn trace."""
+        trace = current_turn()
+        trace.increment(f"scheduler_{PRIORITY_NAMES[ticket.priority]}_wait_time",
+                        ticket.wait_time)
+        trace.record("scheduler_queue_depth", ticket.queue_depth)
+
+    def snapshot(self):
+        """Returns the queue depth, running calls and wait times in milliseconds."""
+        with self.lock:
+            providers = {provider: {"queue_depth": len(self.queues.get(provider, [])),
+                                    "peak_queue_depth": peak,
+                                    "running": self.running.get(provider, 0)}
+                         for provider, peak in self.stats.peak_queue_depth.items()}
+            waits = {name: {"count": waits["count"],
+                            "mean_ms": waits["total"] / waits["count"] * 1000
+                            if waits["count"] else 0.0,
+                            "max_ms": waits["max"] * 1000}
+                     for name, waits in self.stats.waits.items()}
+        return {"providers": providers, "waits": waits}
+
+
+class ScheduledChatModel(BaseChatModel):
+    """Chat model that waits for the scheduler's go-ahead before each call to the wrapped model."""
+
+    # Typed Any so pydantic wraps the model itself rather than a validated copy.
+    model: Any
+    model_name: str
+    priority: int = INTERACTIVE
+    scheduler: Any = None
+
+    @property
+    def _llm_type(self) -> str:
+        return f"scheduled-{self.model._llm_type}"
+
+    def get_scheduler(self):
+        return self.scheduler or get_scheduler()
+
+    def estimate_tokens(self, messages, kwargs):
+        """Returns the prompt tokens plus the most the completion may use."""
+        completion_tokens = (kwargs.get("max_tokens") or getattr(self.model, "max_tokens", None)
+                             or DEFAULT_COMPLETION_TOKENS)
+        return count_message_tokens(messages) + completion_tokens
+
+    @staticmethod
+    def used_tokens(messages, text, result=None):
+        usage = ((result.llm_output or {}).get("token_usage") or {}) if result else {}
+        return usage.get("total_tokens") or count_message_tokens(messages) + count_tokens(text)
+
+    def _generate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> ChatResult:
+        scheduler = self.get_scheduler()
+        ticket = scheduler.acquire(
+            self.model_name, self.estimate_tokens(messages, kwargs), self.priority)
+        used = None
+        try:
+            result = self.model._generate(messages, stop, run_manager, **kwargs)
+            used = self.used_tokens(messages, result.generations[0].text, result)
+            return result
+        finally:
+            scheduler.release(ticket, used)
+
+    async def _agenerate(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> ChatResult:
+        scheduler = self.get_scheduler()
+        ticket = await scheduler.aacquire(
+            self.model_name, self.estimate_tokens(messages, kwargs), self.priority)
+        used = None
+        try:
+            result = await self.model._agenerate(messages, stop, run_manager, **kwargs)
+            used = self.used_tokens(messages, result.generations[0].text, result)
+            return result
+        finally:
+            scheduler.release(ticket, used)
+
+    def _stream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[CallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> Iterator[ChatGenerationChunk]:
+        if type(self.model)._stream == BaseChatModel._stream:
+            result = self._generate(messages, stop, run_manager, **kwargs)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=result.generations[0].text))
+            return
+        scheduler = self.get_scheduler()
+        ticket = scheduler.acquire(
+            self.model_name, self.estimate_tokens(messages, kwargs), self.priority)
+        chunks = []
+        try:
+            for chunk in self.model._stream(messages, stop, run_manager, **kwargs):
+                chunks.append(chunk.text)
+                yield chunk
+        finally:
+            scheduler.release(ticket, self.used_tokens(messages, "".join(chunks)))
+
+    async def _astream(
+            self,
+            messages: List[BaseMessage],
+            stop: Optional[List[str]] = None,
+            run_manager: Optional[AsyncCallbackManagerForLLMRun] = None,
+            **kwargs: Any) -> AsyncIterator[ChatGenerationChunk]:
+        if type(self.model)._astream == BaseChatModel._astream:
+            result = await self._agenerate(messages, stop, run_manager, **kwargs)
+            yield ChatGenerationChunk(message=AIMessageChunk(content=result.generations[0].text))
+            return
+        scheduler = self.get_scheduler()
+        ticket = await scheduler.aacquire(
+            self.model_name, self.estimate_tokens(messages, kwargs), self.priority)
+        chunks = []
+        try:
+            async for chunk in self.model._astream(messages, stop, run_manager, **kwargs):
+                chunks.append(chunk.text)
+                yield chunk
+        finally:
+            scheduler.release(ticket, self.used_tokens(messages, "".join(chunks)))
+
+
+_scheduler = None
+_scheduler_lock = threading.Lock()
+
+
+def get_scheduler():
+    """Returns the process-wide scheduler configured from configs/config.json."""
+    global _scheduler
+    with _scheduler_lock:
+        if _scheduler is None:
+            config = shared_config()
+            _scheduler = RequestScheduler(config.get("rate_limits", {}),
+                                          config.get("provider_concurrency", {}))
+        return _scheduler
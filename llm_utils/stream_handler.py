@@ -1,28 +1,88 @@
 """Module for handling streaming and debugging of llm outputs with custom callback handlers."""
+import logging
+import time
 from typing import Any, Dict, List
 
 from langchain.callbacks.base import BaseCallbackHandler
 
+logger = logging.getLogger(__name__)
 
-class StreamHandler(BaseCallbackHandler):
-    """Handles real-time streaming of LLM output tokens to a Streamlit container."""
 
-    def __init__(self, container, initial_text=""):
+class BufferedStreamHandler(BaseCallbackHandler):
+    """
+    Base handler that coalesces streamed tokens into periodic container renders.
+
+    Each render re-sends the whole text, so rendering every token costs O(n^2)
+    in the response length. Tokens are buffered in a list and the container is
+    only re-rendered once `flush_tokens` tokens are pending or `flush_interval`
+    seconds have passed since the last render. The defaults render every token.
+    """
+
+    # Called directly on the event loop in async runs, keeping tokens in order.
+    run_inline = True
+
+    def __init__(self, container, initial_text="", flush_interval=0.0, flush_tokens=1):
         self.container = container
-        self.text = initial_text
+        self.flush_interval = flush_interval
+        self.flush_tokens = flush_tokens
+        self.chunks = [initial_text] if initial_text else []
+        self.pending_tokens = 0
+        self.last_flush = time.monotonic()
+        self.render_count = 0
+        self.skipped_renders = 0
 
-    def on_llm_new_token(self, token: str, **kwargs) -> None:
-        """Streams tokens to the container."""
-        self.text += token
+    @property
+    def text(self):
+        """Returns the buffered text, collapsing the chunk list into one string."""
+        if len(self.chunks) > 1:
+            self.chunks = ["".join(self.chunks)]
+        return self.chunks[0] if self.chunks else ""
+
+    def append_token(self, token: str) -> None:
+        """Buffers a token and renders if the token count or time interval is reached."""
+        self.chunks.append(token)
+        self.pending_tokens += 1
+        now = time.monotonic()
+        if (self.pending_tokens >= self.flush_tokens
+                or now - self.last_flush >= self.flush_interval):
+            self.flush()
+        else:
+            self.skipped_renders += 1
+
+    def flush(self) -> None:
+        """Renders the buffered text to the container if any tokens are pending."""
+        if not self.pending_tokens:
+            return
         self.container.markdown(self.text)
+        self.render_count += 1
+        self.pending_tokens = 0
+        self.last_flush = time.monotonic()
+
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        """Always renders the remaining buffered tokens when the stream ends."""
+        self.flush()
+
+    def get_render_stats(self):
+        """Returns how many renders were done and how many were skipped."""
+        return {"renders": self.render_count, "skipped": self.skipped_renders}
 
     def get_accumulated_response(self):
         """Returns the accumulated text from LLM output."""
         return self.text
 
 
+class StreamHandler(BufferedStreamHandler):
+    """Handles real-time streaming of LLM output tokens to a Streamlit container."""
+
+    def on_llm_new_token(self, token: str, **kwargs) -> None:
+        """Streams tokens to the container."""
+        self.append_token(token)
+
+
 class DebugHandler(BaseCallbackHandler):
-    """Debug handler for printing out the prompts used in LLM requests."""
+    """Debug handler for logging the prompts used in LLM requests."""
+
+    run_inline = True
 
     def __init__(self, initial_text=""):
         pass
@@ -30,29 +90,115 @@ class DebugHandler(BaseCallbackHandler):
     def on_llm_start(
         self, serialized: Dict[str, Any], prompts: List[str], **kwargs: Any
     ) -> None:
-        """Print out the prompts."""
-        print("\n\n\n", "Startprompt \n",prompts,"\nnext prompt")
+        """Log the prompts."""
+        logger.debug("Prompts: %s", prompts)
 
 
-class StreamUntilSpecialTokenHandler(BaseCallbackHandler):
+class SpecialTokenScanner:
+    """
+    Incrementally splits a stream of chunks on a special token.
+
+    The token may arrive merged with surrounding text or split across chunks,
+    so a possible partial match at the end of a chunk is held back until the
+    next chunk confirms or rules it out. Text before and after the token is
+    kept in separate buffers.
+    """
+
+    def __init__(self, special_token="␃"):
+        self.special_token = special_token
+        self.prefix = []
+        self.suffix = []
+        self.found = False
+        self.carry = ""
+
+    def feed(self, chunk: str) -> str:
+        """Consumes a chunk and returns the newly confirmed pre-token text."""
+        if self.found:
+            self.suffix.append(chunk)
+            return ""
+        data = self.carry + chunk
+        index = data.find(self.special_token)
+        if index != -1:
+            self.found = True
+            self.carry = ""
+            before = data[:index]
+            after = data[index + len(self.special_token):]
+            if after:
+                self.suffix.append(after)
+            if before:
+                self.prefix.append(before)
+            return before
+        keep = self._partial_match_length(data)
+        emit = data[:len(data) - keep]
+        self.carry = data[len(data) - keep:]
+        if emit:
+            self.prefix.append(emit)
+        return emit
+
+    def finish(self) -> str:
+        """Releases any held-back text once the stream has ended."""
+        emit = self.carry
+        self.carry = ""
+        if emit:
+            self.prefix.append(emit)
+        return emit
+
+    def _partial_match_length(self, data: str) -> int:
+        """Returns the length of the longest token prefix that ends the data."""
+        for length in range(min(len(self.special_token) - 1, len(data)), 0, -1):
+            if data.endswith(self.special_token[:length]):
+                return length
+        return 0
+
+    @property
+    def prefix_text(self):
+        """Returns the text before the special token."""
+        return "".join(self.prefix)
+
+    @property
+    def suffix_text(self):
+        """Returns the text after the special token."""
+        return "".join(self.suffix)
+
+
+class StreamUntilSpecialTokenHandler(BufferedStreamHandler):
     """Handles streaming LLM outputs to a container until a special token is encountered."""
 
-    def __init__(self, container, initial_text="", special_token="␃"):
-        self.container = container
-        self.text = initial_text
+    def __init__(self, container, initial_text="", special_token="␃",
+                 flush_interval=0.0, flush_tokens=1):
+        super().__init__(container, initial_text, flush_interval, flush_tokens)
         self.special_token = special_token
         self.special_token_reached = False
+        self.scanner = SpecialTokenScanner(special_token)
+        self.on_suffix_ready = None
 
     def on_llm_new_token(self, token: str, **kwargs) -> None:
         """Streams tokens to the container, stopping if the special token is reached."""
         if self.special_token_reached:
+            self.scanner.feed(token)
             return
-        if token.strip() == self.special_token:
+        emitted = self.scanner.feed(token)
+        if emitted:
+            self.append_token(emitted)
+        if self.scanner.found:
             self.special_token_reached = True
-            return
-        self.text += token
-        self.container.markdown(self.text)
+            self.flush()
 
-    def get_accumulated_response(self):
-        """Returns the accumulated text from LLM output."""
-        return self.text
+    def on_llm_end(self, response: Any, **kwargs: Any) -> None:
+        """
+        Releases held-back text and renders the remaining buffered tokens.
+
+        If the special token was seen, the complete post-token text is handed to
+        `on_suffix_ready`, once, so it can be processed before the chain returns.
+        """
+        emitted = self.scanner.finish()
+        if emitted:
+            self.append_token(emitted)
+        self.flush()
+        if self.scanner.found and self.on_suffix_ready is not None:
+            on_suffix_ready, self.on_suffix_ready = self.on_suffix_ready, None
+            on_suffix_ready(self.scanner.suffix_text)
+
+    def get_split_response(self):
+        """Returns the text before and after the special token as separate strings."""
+        return self.scanner.prefix_text, self.scanner.suffix_text
@@ -0,0 +1,45 @@
+"""Structured record of the survey answers, captured as the user submits each turn."""
+import json
+
+
+def format_answer(value) -> str:
+    """Formats a UI element value as an answer string."""
+    if isinstance(value, (list, tuple)):
+        return ", ".join(str(item) for item in value)
+    if isinstance(value, bool):
+        return "Yes" if value else "No"
+    return str(value)
+
+
+class SurveyRecord:
+    """
+    Accumulates the neighbourhood, its offence risks and every question/answer pair.
+
+    The submission payload is built up as answers are recorded, so serialising it
+    never re-parses the rendered conversation.
+    """
+
+    def __init__(self):
+        self.respond = {
+            "Neighbourhood": "",
+            "Crime Type": [],
+            "user-context": [],
+        }
+
+    def record_intake(self, neighbourhood: str, risks) -> None:
+        """Records the selected neighbourhood and its (offence, risk) pairs."""
+        self.respond["Neighbourhood"] = neighbourhood
+        self.respond["Crime Type"] = [f"{offence}: {risk}" for offence, risk in risks]
+
+    def record_answer(self, question: str, value) -> None:
+        """Records one question and the user's answer."""
+        self.respond["user-context"].extend(
+            [f"Q: {question}", f"A: {format_answer(value)}"])
+
+    def to_respond(self) -> dict:
+        """Returns the submission payload."""
+        return self.respond
+
+    def to_json(self) -> str:
+        """Serialises the submission payload."""
+        return json.dumps(self.respond)
@@ -0,0 +1,355 @@
+"""Per-turn tracing of the agents, stream handlers and plan service calls, with pluggable sinks.
+
+A turn trace collects span durations and metrics such as time to first token,
+stream time, UI parse time, retries, token counts and plan service latency,
+and is emitted to every sink when the turn ends. Only a sampled fraction of
+turns is recorded; code deeper in the call stack reaches the active turn
+through `current_turn()`, which is a no-op trace outside a sampled turn.
+
+Configured from the environment:
+TRACE_SINKS      comma-separated sinks: "memory", "jsonl:<path>", "prometheus:<port>"
+TRACE_SAMPLE_RATE fraction of turns to record, 0 to 1 (default 1)
+"""
+import contextvars
+import json
+import logging
+import os
+import random
+import threading
+import time
+import uuid
+from bisect import bisect_left
+from collections import deque
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List
+
+from langchain.callbacks.base import BaseCallbackHandler
+
+from llm_utils.memory import count_message_tokens, count_tokens
+
+logger = logging.getLogger(__name__)
+
+_current_turn = contextvars.ContextVar("current_turn", default=None)
+
+# Upper bounds in seconds of the latency histogram buckets; the last bucket is unbounded.
+LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+
+
+class TurnTrace:
+    """Spans and metrics of one session turn; records nothing unless sampled."""
+
+    def __init__(self, kind, sampled=True, **attributes):
+        self.kind = kind
+        self.sampled = sampled
+        self.turn_id = uuid.uuid4().hex
+        self.attributes = attributes
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = {}
+        self.metrics = {}
+        self.lock = threading.Lock()
+
+    @contextmanager
+    def span(self, name):
+        """Times the enclosed block, adding to earlier spans of the same name."""
+        if not self.sampled:
+            yield
+            return
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            with self.lock:
+                self.spans[name] = self.spans.get(name, 0.0) + elapsed
+
+    def record(self, name, value):
+        """Sets a metric."""
+        if self.sampled:
+            with self.lock:
+                self.metrics[name] = value
+
+    def increment(self, name, amount=1):
+        """Adds to a metric."""
+        if self.sampled:
+            with self.lock:
+                self.metrics[name] = self.metrics.get(name, 0) + amount
+
+    def callbacks(self, agent):
+        """Returns the LangChain callbacks that trace an agent's model calls."""
+        return [TracingCallbackHandler(self, agent)] if self.sampled else []
+
+    def to_dict(self):
+        """Returns the trace as a JSON-serialisable dict."""
+        with self.lock:
+            return {"turn_id": self.turn_id, "kind": self.kind, "timestamp": self.timestamp,
+                    "duration": self.duration, "attributes": dict(self.attributes),
+                    "spans": dict(self.spans), "metrics": dict(self.metrics)}
+
+
+NULL_TURN = TurnTrace("none", sampled=False)
+
+
+def current_turn():
+    """Returns the active turn trace, or a no-op trace outside a turn."""
+    return _current_turn.get() or NULL_TURN
+
+
+class TracingCallbackHandler(BaseCallbackHandler):
+    """Records time to first token, model time and token counts of an agent's model calls."""
+
+    run_inline = True
+
+    def __init__(self, trace, agent):
+        self.trace = trace
+        self.agent = agent
+        self.start = None
+        self.first_token = None
+        self.streamed_tokens = 0
+
+    def on_chat_model_start(self, serialized: Dict[str, Any],
+                            messages: List[List[Any]], **kwargs: Any) -> None:
+        """Starts timing a chat model call and counts its prompt tokens."""
+        self.begin(sum(count_message_tokens(batch) for batch in messages))
+
+    def on_llm_start(self, serialized: Dict[str, Any], prompts: List[str],
+                     **kwargs: Any) -> None:
+        """Starts timing a completion model call and counts its prompt tokens."""
+        self.begin(sum(count_tokens(prompt) for prompt in prompts))
+
+    def begin(self, prompt_tokens):
+        self.start = time.perf_counter()
+        self.first_token = None
+        self.streamed_tokens = 0
+        self.trace.increment(f"{self.agent}_prompt_tokens", prompt_tokens)
+
+    def on_llm_new_token(self, token: str, **kwargs: Any) -> None:
+        """Records the time to the first streamed token."""
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+            self.trace.record(f"{self.agent}_time_to_first_token", self.first_token - self.start)
+        self.streamed_tokens += 1
+
+    def on_llm_end(self, response, **kwargs: Any) -> None:
+        """Records the model time, the stream time and the completion tokens."""
+        end = time.perf_counter()
+        self.trace.increment(f"{self.agent}_llm_time", end - self.start)
+        if self.first_token is not None:
+            self.trace.increment(f"{self.agent}_stream_time", end - self.first_token)
+        usage = (response.llm_output or {}).get("token_usage") or {}
+        completion_tokens = usage.get("completion_tokens")
+        if completion_tokens is None:
+            completion_tokens = self.streamed_tokens or sum(
+                count_tokens(generation.text)
+                for generations in response.generations for generation in generations)
+        self.trace.increment(f"{self.agent}_completion_tokens", completion_tokens)
+
+    def on_llm_error(self, error: BaseException, **kwargs: Any) -> None:
+        """Counts failed model calls."""
+        self.trace.increment(f"{self.agent}_errors")
+
+
+class RingBufferSink:
+    """Keeps the most recent traces in memory."""
+
+    def __init__(self, maxlen=1000):
+        self.traces = deque(maxlen=maxlen)
+
+    def emit(self, trace):
+        self.traces.append(trace)
+
+    def recent(self, count=None):
+        """Returns the latest traces, oldest first."""
+        traces = list(self.traces)
+        return traces if count is None else traces[-count:]
+
+
+class JsonlSink:
+    """Appends each trace as a JSON line to a file."""
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.Lock()
+
+    def emit(self, trace):
+        line = json.dumps(trace) + "\n"
+        with self.lock, open(self.path, "a", encoding="utf-8") as trace_file:
+            trace_file.write(line)
+
+
+class LatencyHistogram:
+    """Thread-safe bucketed latency histogram."""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.lock = threading.Lock()
+
+    def observe(self, seconds):
+        """Records one latency in seconds."""
+        with self.lock:
+            self.counts[bisect_left(self.buckets, seconds)] += 1
+            self.total += seconds
+
+    def snapshot(self):
+        """Returns the bucket counts, the number of observations and their sum."""
+        with self.lock:
+            labels = [str(bound) for bound in self.buckets] + ["+Inf"]
+            return {"buckets": dict(zip(labels, self.counts)),
+                    "count": sum(self.counts), "sum": self.total}
+
+
+class PrometheusSink:
+    """
+    Aggregates traces into Prometheus histograms and counters.
+
+    Span durations and metrics ending in "_time" or "_latency" become
+    histograms in seconds; other numeric metrics become counters.
+    """
+
+    def __init__(self, prefix="wiseneighbourhood"):
+        self.histogram_class = LatencyHistogram
+        self.prefix = prefix
+        self.histograms = {}
+        self.counters = {}
+        self.lock = threading.Lock()
+
+    def emit(self, trace):
+        kind = trace["kind"]
+        durations = dict(trace["spans"])
+        durations["turn"] = trace["duration"]
+        counters = {"turns": 1}
+        for name, value in trace["metrics"].items():
+            if isinstance(value, bool) or not isinstance(value, (int, float)):
+                continue
+            if name.endswith(("_time", "_latency", "_time_to_first_token")):
+                durations[name] = value
+            else:
+                counters[name] = value
+        with self.lock:
+            for name, seconds in durations.items():
+                histogram = self.histograms.get((kind, name))
+                if histogram is None:
+                    histogram = self.histograms[(kind, name)] = self.histogram_class()
+                histogram.observe(seconds)
+            for name, value in counters.items():
+                self.counters[(kind, name)] = self.counters.get((kind, name), 0) + value
+
+    def render(self):
+        """Returns the metrics in the Prometheus text exposition format."""
+        seconds = f"{self.prefix}_turn_seconds"
+        total = f"{self.prefix}_turn_total"
+        lines = [f"# TYPE {seconds} histogram"]
+        with self.lock:
+            histograms = {key: histogram.snapshot() for key, histogram in self.histograms.items()}
+            counters = dict(self.counters)
+        for (kind, name), snapshot in sorted(histograms.items()):
+            labels = f'kind="{kind}",name="{name}"'
+            cumulative = 0
+            for bound, count in snapshot["buckets"].items():
+                cumulative += count
+                lines.append(f'{seconds}_bucket{{{labels},le="{bound}"}} {cumulative}')
+            lines.append(f"{seconds}_sum{{{labels}}} {snapshot['sum']}")
+            lines.append(f"{seconds}_count{{{labels}}} {snapshot['count']}")
+        lines.append(f"# TYPE {total} counter")
+        for (kind, name), value in sorted(counters.items()):
+            lines.append(f'{total}{{kind="{kind}",name="{name}"}} {value}')
+        return "\n".join(lines) + "\n"
+
+    def serve(self, port, host="0.0.0.0"):
+        """Serves the metrics on http://host:port/metrics from a daemon thread."""
+        sink = self
+
+        class MetricsHandler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path != "/metrics":
+                    self.send_error(404)
+                    return
+                body = sink.render().encode("utf-8")
+                self.send_response(200)
+                self.send_header("Content-Type", "text/plain; version=0.0.4")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        server = ThreadingHTTPServer((host, port), MetricsHandler)
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        return server
+
+
+class Tracer:
+    """Starts sampled turn traces and emits the finished ones to the sinks."""
+
+    def __init__(self, sinks=(), sample_rate=1.0, sampler=random.random):
+        self.sinks = list(sinks)
+        self.sample_rate = sample_rate
+        self.sampler = sampler
+
+    @contextmanager
+    def turn(self, kind, **attributes):
+        """Traces the enclosed block as one turn, or joins the turn already active."""
+        active = _current_turn.get()
+        if active is not None:
+            active.attributes.update(attributes)
+            yield active
+            return
+        sampled = bool(self.sinks) and self.sampler() < self.sample_rate
+        trace = TurnTrace(kind, sampled=sampled, **attributes)
+        token = _current_turn.set(trace)
+        try:
+            yield trace
+        finally:
+            _current_turn.reset(token)
+            if sampled:
+                trace.duration = time.perf_counter() - trace.start
+                self.emit(trace.to_dict())
+
+    def emit(self, trace):
+        for sink in self.sinks:
+            try:
+                sink.emit(trace)
+            except Exception:  # a broken sink must not fail the user's turn
+                logger.exception("Trace sink %r failed", sink)
+
+    def sink(self, sink_class):
+        """Returns the first sink of a class, or None."""
+        return next((sink for sink in self.sinks if isinstance(sink, sink_class)), None)
+
+
+def sinks_from_spec(spec):
+    """Builds the sinks of a TRACE_SINKS value."""
+    sinks = []
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        name, _, argument = item.partition(":")
+        if name == "memory":
+            sinks.append(RingBufferSink(int(argument or 1000)))
+        elif name == "jsonl":
+            sinks.append(JsonlSink(argument or "traces.jsonl"))
+        elif name == "prometheus":
+            sink = PrometheusSink()
+            if argument:
+                sink.serve(int(argument))
+            sinks.append(sink)
+        else:
+            raise ValueError(f"Unknown trace sink: {item}")
+    return sinks
+
+
+_tracer = None
+_tracer_lock = threading.Lock()
+
+
+def get_tracer():
+    """Returns the process-wide tracer configured from the environment."""
+    global _tracer
+    with _tracer_lock:
+        if _tracer is None:
+            _tracer = Tracer(sinks_from_spec(os.environ.get("TRACE_SINKS", "memory")),
+                             float(os.environ.get("TRACE_SAMPLE_RATE", "1")))
+        return _tracer
@@ -0,0 +1,205 @@
+"""Tolerant parsing of UI agent responses, salvaging the valid parts of malformed JSON.
+
+The parser accepts code fences, text around the JSON, trailing commas, single
+quotes and truncated input. Values cut off by truncation are returned as
+Partial* instances so callers can tell them apart from complete ones.
+"""
+import json
+
+from llm_utils.pydantic_models import Checkbox, MultiSelect, RadioButtons, Slider
+
+ELEMENT_CLASSES = {
+    "RadioButtons": RadioButtons,
+    "Slider": Slider,
+    "MultiSelect": MultiSelect,
+    "Checkbox": Checkbox,
+}
+LITERALS = {"true": True, "false": False, "null": None}
+ESCAPES = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f"}
+
+
+class PartialDict(dict):
+    """An object whose closing brace was never reached."""
+
+
+class PartialList(list):
+    """An array whose closing bracket was never reached."""
+
+
+class PartialStr(str):
+    """A string whose closing quote was never reached."""
+
+
+def is_complete(value):
+    """Returns True if a parsed value was not cut off by truncation."""
+    return not isinstance(value, (PartialDict, PartialList, PartialStr))
+
+
+class TolerantJSONParser:
+    """Recursive-descent JSON parser that returns what it can of a malformed document."""
+
+    def __init__(self, text):
+        self.text = text
+        self.position = 0
+
+    def parse(self):
+        """Parses the first object or array in the text, or returns None if there is none."""
+        starts = [index for index in (self.text.find("{"), self.text.find("[")) if index >= 0]
+        if not starts:
+            return None
+        self.position = min(starts)
+        return self.value()
+
+    def at_end(self):
+        return self.position >= len(self.text)
+
+    def skip_whitespace(self):
+        while not self.at_end() and self.text[self.position] in " \t\r\n":
+            self.position += 1
+
+    def value(self):
+        self.skip_whitespace()
+        if self.at_end():
+            return PartialStr("")
+        char = self.text[self.position]
+        if char == "{":
+            return self.object()
+        if char == "[":
+            return self.array()
+        if char in "\"'":
+            return self.string()
+        return self.scalar()
+
+    def object(self):
+        self.position += 1
+        result = {}
+        while True:
+            self.skip_whitespace()
+            if self.at_end():
+                return PartialDict(result)
+            char = self.text[self.position]
+            if char == "}":
+                self.position += 1
+                return result
+            if char == ",":
+                self.position += 1
+                continue
+            key = self.string() if char in "\"'" else self.scalar()
+            self.skip_whitespace()
+            if not is_complete(key) or self.at_end() or self.text[self.position] != ":":
+                return PartialDict(result)
+            self.position += 1
+            value = self.value()
+            result[str(key)] = value
+            if not is_complete(value):
+                return PartialDict(result)
+
+    def array(self):
+        self.position += 1
+        result = []
+        while True:
+            self.skip_whitespace()
+            if self.at_end():
+                return PartialList(result)
+            char = self.text[self.position]
+            if char == "]":
+                self.position += 1
+                return result
+            if char == ",":
+                self.position += 1
+                continue
+            value = self.value()
+            result.append(value)
+            if not is_complete(value):
+                return PartialList(result)
+
+    def string(self):
+        quote = self.text[self.position]
+        self.position += 1
+        chunks = []
+        while not self.at_end():
+            char = self.text[self.position]
+            if char == "\\":
+                escape = self.text[self.position + 1:self.position + 2]
+                if not escape:
+                    break
+                if escape == "u":
+                    digits = self.text[self.position + 2:self.position + 6]
+                    if len(digits) < 4:
+                        break
+                    try:
+                        chunks.append(chr(int(digits, 16)))
+                    except ValueError:
+                        chunks.append(digits)
+                    self.position += 6
+                else:
+                    chunks.append(ESCAPES.get(escape, escape))
+                    self.position += 2
+                continue
+            self.position += 1
+            if char == quote:
+                return "".join(chunks)
+            chunks.append(char)
+        return PartialStr("".join(chunks))
+
+    def scalar(self):
+        start = self.position
+        while not self.at_end() and self.text[self.position] not in ",:]}\r\n":
+            self.position += 1
+        token = self.text[start:self.position].strip()
+        if token in LITERALS:
+            return LITERALS[token]
+        try:
+            return json.loads(token)
+        except ValueError:
+            if self.at_end():
+                return PartialStr(token)
+            return token
+
+
+def tolerant_loads(text):
+    """Parses as much of a JSON document as possible, or returns None if there is none."""
+    return TolerantJSONParser(text).parse()
+
+
+def validate_element(element):
+    """Returns a UI element validated against its model, or None if it is unusable."""
+    if not isinstance(element, dict) or not is_complete(element):
+        return None
+    element_class = ELEMENT_CLASSES.get(element.get("type"))
+    if element_class is None:
+        return None
+    try:
+        return element_class(**element).dict()
+    except (TypeError, ValueError):
+        return None
+
+
+def salvage_output(text):
+    """
+    Salvages the title and valid UI elements of a UI agent response.
+
+    Returns (output, missing) where output has the salvaged "title" and
+    "ui_elements" and missing lists what could not be recovered: "title", and
+    "ui_elements" when an element was invalid or cut off, or none were found.
+    """
+    data = tolerant_loads(text)
+    if isinstance(data, list):
+        data = {"ui_elements": data}
+    if not isinstance(data, dict):
+        data = {}
+
+    title = data.get("title")
+    raw_elements = data.get("ui_elements")
+    if not isinstance(raw_elements, list):
+        raw_elements = []
+    elements = [element for element in map(validate_element, raw_elements) if element]
+
+    missing = []
+    if not isinstance(title, str) or not is_complete(title) or not title.strip():
+        missing.append("title")
+        title = ""
+    # A list cut off between elements is accepted; a cut-off element is dropped and counted.
+    if not elements or len(elements) < len(raw_elements):
+        missing.append("ui_elements")
+    return {"title": title, "ui_elements": elements}, missing
@@ -1,25 +1,35 @@
 """Streamlit app module for interactive chat management and display."""
-import json
-import random
+import contextvars
+import logging
 import threading
 import time
 import uuid
 from typing import Optional
 
-import geopandas as gpd
-import matplotlib.pyplot as plt
-import pandas as pd
 import requests
-import seaborn as sns
 import streamlit as st
 from langchain_core.messages import AIMessage, HumanMessage
 
+from llm_utils.async_runtime import run_coroutine
 from llm_utils.conversation import Conversation
-from llm_utils.maps import neighbourhood_select
-from llm_utils.prompt_assembly import prompt_assembly
+from llm_utils.neighbourhood_resolver import get_resolver
+from llm_utils.plan_client import get_plan_client
+from llm_utils.prompt_assembly import intake_prompt, prompt_assembly
+from llm_utils.risk_index import get_risk_index
+from llm_utils.risk_maps import risk_map_path
 from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
+from llm_utils.survey_record import SurveyRecord
+from llm_utils.tracing import get_tracer
+from streamlit_utils.async_turn import LatestText, await_turn
 from streamlit_utils.initialization import initialize_session
-from streamlit_utils.ui_creator import display_ui_from_response
+from streamlit_utils.ui_creator import display_ui_from_response, parse_ui_spec
+
+logger = logging.getLogger(__name__)
+
+# Plan generation wait settings (seconds)
+PLAN_EXPECTED_SECONDS = 80
+PLAN_DEADLINE_SECONDS = 180
+PROGRESS_TICK_SECONDS = 0.25
 
 # Page configuration
 st.set_page_config(
@@ -85,108 +95,80 @@ st.markdown("""
 """, unsafe_allow_html=True)
 
 # Function to send plan request to Node.js server
-def send_plan_request(inputData, id):
-    # Replace 'your-nodejs-server-address' with your actual server address or IP
-    url = 'https://api.ai-fundamentals.live/api2/plan'
-    payload = {
-        'inputData': inputData,
-        'id': id
-    }
-    headers = {'Content-Type': 'application/json'}
+def send_plan_request(inputData, id, deadline=None):
+    """Send the plan request; returns (response, None), or (None, error) if it failed."""
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()  # Raise an error for bad status codes
-        return response.json()
+        return get_plan_client().send_plan(inputData, id, deadline), None
     except requests.exceptions.RequestException as e:
-        st.error(f"Error sending plan request: {e}")
-        return None
+        return None, e
 
 # Function to get plan from Node.js server
-def get_plan(id):
-    url = 'https://api.ai-fundamentals.live/api2/getPlan'
-    payload = {'id': id}
-    headers = {'Content-Type': 'application/json'}
+def get_plan(id, deadline=None):
+    """Retrieve the plan; returns (response, None), or (None, error) if it failed."""
     try:
-        response = requests.post(url, json=payload, headers=headers)
-        response.raise_for_status()
-        return response.json()
+        return get_plan_client().get_plan(id, deadline), None
     except requests.exceptions.RequestException as e:
-        st.error(f"Error retrieving plan: {e}")
-        return None
+        return None, e
 
 
-def get_survey_respond(info):
-    # Initialize the response dictionary
-    response = {
-        "Neighbourhood": "",
-        "Crime Type": [],
-        "user-context": []
-    }
-    
-    # Parse the first message to get neighbourhood and crime data
-    first_message = info[0].content
-    if "Neighbourhood:" in first_message:
-        # Extract neighbourhood name and ID
-        neighbourhood_part = first_message.split(" - ")[0]
-        response["Neighbourhood"] = neighbourhood_part.replace("Neighbourhood: ", "")
-        
-        # Extract crime types and levels
-        crime_part = first_message.split(" - ")[1]
-        crime_items = crime_part.split(", ")
-        crime_data = []
-        for item in crime_items:
-            crime_type, level = item.strip().split(": ")
-            if level.rstrip(";"):  # Remove trailing semicolon if present
-                crime_data.append(f"{crime_type}: {level}")
-        response["Crime Type"] = crime_data
-    
-    # Parse user response (third message in the list) and AI response (fourth message)
-    if len(info) >= 4:
-        user_response = info[2].content
-        ai_response = info[3].content
-        
-        # Extract Q&A pairs
-        user_selections = user_response.strip().split(";\n")
-        for selection in user_selections:
-            if selection:  # Skip empty strings
-                q, a = selection.split(": ")
-                response["user-context"].extend([f"Q: {q}", f"A: {a.rstrip(';')}"]) 
+def poll_plan(id, deadline, wait, initial_delay=1.0, max_delay=8.0):
+    """
+    Poll get_plan with exponential backoff until the plan is ready or the deadline passes.
+
+    Each get_plan call is also bounded by the deadline. `wait(seconds)` is used
+    between attempts so the caller can keep its progress display updated.
+    Returns the last response from get_plan and the error of the last attempt, if any.
+    """
+    delay = initial_delay
+    while True:
+        plan_response, error = get_plan(id, deadline)
+        if plan_response and plan_response.get('success'):
+            return plan_response, error
+        if time.monotonic() >= deadline:
+            return plan_response, error
+        wait(delay)
+        delay = min(delay * 2, max_delay)
 
-    return response
 
 def get_conversation() -> Optional[Conversation]:
     """Retrieve the current conversation instance from Streamlit's session state."""
     return st.session_state.get("conversation", None)
 
 def neighbourhoods():
-    nb = './Assets/Safety Risks by Neighbourhood & Offence.csv'
-    regions = pd.read_csv(nb)
-    return regions['Neighbourhood']
+    """Return the sorted, unique neighbourhood names from the shared risk index."""
+    return get_risk_index().names
+
+def neighbourhood_from_coordinates(text):
+    """Resolve a "latitude, longitude" string to a neighbourhood name, or None."""
+    try:
+        lat, lon = (float(part) for part in text.split(","))
+    except ValueError:
+        return None
+    resolver = get_resolver()
+    match = resolver.resolve(lat, lon) if resolver is not None else None
+    return match["AREA_DE8"] if match else None
 
 def get_offence_risk(region):
-    nb = './Assets/Safety Risks by Neighbourhood & Offence.csv'
-    
-    # Read the CSV file into a DataFrame
-    df = pd.read_csv(nb)
-    
-    # Filter the DataFrame for the specified region
-    df_region = df[df['Neighbourhood'] == region]
-    
-    # Create a list of offences and their corresponding safety risks
-    offences_list = df_region[['Offence Group', 'Safety Risk']].values.tolist()
-    
-    # Format the offences and risks into a string
-    offences_str = ', '.join([f"{offence}: {risk}" for offence, risk in offences_list])
-    
-    # Construct the final result string
-    result = f"Neighbourhood: {region} - {offences_str}"
-    return result
+    """Format the offence risks and profile of a neighbourhood as the intake prompt."""
+    return intake_prompt(region)
 
 
 def handle_submission():
     """Process and submit user input, updating conversation history."""
+    with get_tracer().turn("survey", session=st.session_state.user_id,
+                           turn=len(st.session_state.messages) // 2):
+        submit_turn()
+
+
+def submit_turn():
+    """Assemble the user's answers, run the conversation and store both responses."""
     user_input = st.session_state.input_text
-    user_prompt = prompt_assembly(st.session_state.user_inputs, user_input)
+    survey_record = st.session_state.survey_record
+    if not st.session_state.messages:
+        neighbourhood = st.session_state.neighbourhood
+        survey_record.record_intake(neighbourhood, get_risk_index().get(neighbourhood))
+    user_prompt = prompt_assembly(
+        st.session_state.user_inputs, user_input, survey_record)
     user_message = HumanMessage(role="user", content=user_prompt)
     st.session_state.messages.append(user_message)
     st.session_state.conv_history.append(user_message)
@@ -194,17 +176,22 @@ def handle_submission():
     conversation_instance = get_conversation()
 
     with st.chat_message("assistant"):
-        stream_handler = StreamUntilSpecialTokenHandler(st.empty())
+        # The turn runs on the shared event loop; this thread only renders its stream.
+        latest = LatestText()
+        stream_handler = StreamUntilSpecialTokenHandler(
+            latest, flush_interval=0.1, flush_tokens=20)
+        future = run_coroutine(conversation_instance.acall(user_message, stream_handler))
 
-        textual_response, json_response = conversation_instance(
-            user_message, stream_handler)
+        textual_response, json_response = await_turn(
+            future, st.empty(), latest, conversation_instance.cancel)
 
         st.session_state.conv_history.append(AIMessage(
             role="assistant", content=textual_response))
         st.session_state.conv_history.append(
             AIMessage(role="assistant", content=json_response))
         st.session_state.messages.append(AIMessage(
-            role="assistant", content=json_response))
+            role="assistant", content=json_response,
+            additional_kwargs={"ui_spec": parse_ui_spec(json_response)}))
 
     st.session_state.input_text = ""
 
@@ -247,17 +234,20 @@ def final_submission():
     if "user_id" not in st.session_state:
         st.session_state["user_id"] = str(uuid.uuid4())
 
+    with get_tracer().turn("plan", session=st.session_state["user_id"]) as trace:
+        request_plan(trace)
+
+
+def request_plan(trace):
+    """Send the survey to the plan service and display the plan once it is ready."""
+    # The last turn's answers were never submitted as a turn; record them first.
+    prompt_assembly(st.session_state.user_inputs, "", st.session_state.survey_record)
+    st.session_state.user_inputs = {}
+
     # Prepare the input data
-    respond = get_survey_respond(st.session_state.messages)
-    inputData = json.dumps(respond)
+    inputData = st.session_state.survey_record.to_json()
     id = st.session_state["user_id"]
 
-    # Function to send plan request in a separate thread
-    def send_request():
-        # Send the plan request to the Node.js server
-        send_response = send_plan_request(inputData, id)
-        st.session_state['send_response'] = send_response
-
     # Start the progress bar immediately
     progress_bar = st.progress(0)
     status_text = st.empty()
@@ -266,22 +256,50 @@ def final_submission():
     # Display a message about the expected time
     st.write("⏳ This process might take some time, up to 2 minutes.")
 
-    # Start the send_request function in a separate thread
-    send_thread = threading.Thread(target=send_request)
+    start = time.monotonic()
+    deadline = start + PLAN_DEADLINE_SECONDS
+
+    def wait_with_progress(seconds):
+        # Sleep in short slices so the progress bar keeps moving; it never claims
+        # completion before the plan has actually arrived.
+        until = min(time.monotonic() + seconds, deadline)
+        while True:
+            elapsed = time.monotonic() - start
+            progress = min(elapsed / PLAN_EXPECTED_SECONDS, 0.95)
+            progress_bar.progress(progress)
+            status_text.text(f"Generating your plan... {int(progress * 100)}%")
+            remaining = until - time.monotonic()
+            if remaining <= 0:
+                return
+            time.sleep(min(PROGRESS_TICK_SECONDS, remaining))
+
+    # Send the plan request in a separate thread and finish waiting as soon as it returns
+    result = {}
+    context = contextvars.copy_context()
+    send_thread = threading.Thread(target=lambda: context.run(
+        lambda: result.update(send_response=send_plan_request(inputData, id, deadline))))
     send_thread.start()
+    while send_thread.is_alive() and time.monotonic() < deadline:
+        send_thread.join(timeout=PROGRESS_TICK_SECONDS)
+        wait_with_progress(0)
+    request_time = time.monotonic() - start
+    # The thread is still running only if the deadline passed first.
+    send_response, send_error = result.get('send_response', (None, None))
+    st.session_state['send_response'] = send_response
+
+    if send_response is None:
+        # The service never accepted the request, so polling for the plan cannot succeed.
+        status_text.empty()
+        st.error(f"Error sending plan request: {send_error or 'no response before the deadline'}")
+        trace.record("plan_request_time", request_time)
+        trace.record("plan_ready", False)
+        return
+
+    plan_response, plan_error = poll_plan(id, deadline, wait_with_progress)
+    ready_time = time.monotonic() - start
+    progress_bar.progress(1.0)
+    status_text.text("Generating your plan... 100%")
 
-    second = random.randint(70,90)
-    # Display the progress bar for 1.5 minutes (90 seconds)
-    for percent_complete in range(second):
-        time.sleep(1)  # Sleep for 1 second
-        progress = (percent_complete + 1) / second
-        progress_bar.progress(progress)
-        status_text.text(f"Generating your plan... {int(progress * 100)}%")
-
-    # Wait for the send_request thread to finish
-    send_thread.join()
-
-    plan_response = get_plan(id)
     if plan_response and plan_response.get('success'):
         plan_text = plan_response.get('plan')
         # Display the plan to the user
@@ -289,9 +307,21 @@ def final_submission():
         st.write("## Your Safety Plan:")
         st.write(plan_text)
         st.session_state.plan_displayed = True
+    elif plan_error is not None:
+        st.error(f"Error retrieving plan: {plan_error}")
     else:
         st.error("Failed to retrieve the plan.")
 
+    st.session_state.plan_wait_timings = {
+        "request": request_time,
+        "ready": ready_time,
+        "displayed": time.monotonic() - start,
+    }
+    for name, seconds in st.session_state.plan_wait_timings.items():
+        trace.record(f"plan_{name}_time", seconds)
+    trace.record("plan_ready", bool(plan_response and plan_response.get('success')))
+    logger.debug("Plan wait timings: %s", st.session_state.plan_wait_timings)
+
 
 def main():
     """Main function to initialize and run the Streamlit application."""
@@ -329,23 +359,40 @@ def main():
             if msg.role == "assistant":
                 with chat_container.chat_message("assistant"):
                     display_ui_from_response(
-                        msg.content, index, len(st.session_state.messages) - 1)
+                        msg, index, len(st.session_state.messages) - 1)
             else:
                 chat_container.chat_message(msg.role).write(msg.content)
 
         if len(st.session_state.messages) == 0:
+            names = neighbourhoods()
+            coordinates = st.text_input(
+                'Or enter your coordinates (latitude, longitude)',
+                placeholder='43.6426, -79.3871',
+            )
+            located = neighbourhood_from_coordinates(coordinates) if coordinates else None
+            if coordinates and located not in names:
+                st.warning("No neighbourhood with safety data was found at these coordinates.")
             neighbourhood = st.selectbox(
                 'Choose a Neighbourhood',
-                neighbourhoods().sort_values().unique().tolist(),
-                index=0,
+                names,
+                index=names.index(located) if located in names else 0,
                 placeholder='start typing...',
             )
             intake_output = get_offence_risk(neighbourhood)
+            with st.expander("Safety risk maps"):
+                offences = [offence for offence, _ in get_risk_index().get(neighbourhood)]
+                for tab, offence in zip(st.tabs(offences), offences):
+                    map_path = risk_map_path(offence)
+                    if map_path:
+                        tab.image(str(map_path))
+                    else:
+                        tab.caption("The risk map is being prepared, please check back shortly.")
             ##print(intake_output)
             st.caption("If you don't know your neighbourhood, you can look it up here: [Find Your Neighbourhood](https://www.toronto.ca/city-government/data-research-maps/neighbourhoods-communities/neighbourhood-profiles/find-your-neighbourhood/#location=&lat=&lng=&zoom=)") 
             st.session_state.input_text = intake_output
+            st.session_state.neighbourhood = neighbourhood
         else:
-            print(len(st.session_state.messages))
+            logger.debug("Rendering %d messages", len(st.session_state.messages))
             ##print(st.session_state.messages)
 
         col1, col2 = chat_container.columns(2)
@@ -366,8 +413,12 @@ def main():
         # - The user has not submitted yet (before clicking Submit)
         if st.session_state.plan_displayed or not st.session_state.submitted:
             if col2.button("Restart Session", use_container_width=True):
+                conversation_instance = get_conversation()
+                if conversation_instance is not None:
+                    conversation_instance.reset()
                 st.session_state.messages = []
                 st.session_state.user_inputs = {}
+                st.session_state.survey_record = SurveyRecord()
                 st.session_state.input_text = ''
                 st.session_state.submitted = False
                 st.session_state.plan_displayed = False
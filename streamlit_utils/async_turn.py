@@ -0,0 +1,79 @@
+"""Waiting on conversation turns that run on the shared event loop from the Streamlit script thread."""
+import concurrent.futures
+import threading
+import time
+
+POLL_SECONDS = 0.1
+# While the text is unchanged, e.g. during the UI agent call, re-render this often
+# so a rerun or stop can still interrupt the wait.
+IDLE_RENDER_SECONDS = 1.0
+
+
+class LatestText:
+    """
+    Stand-in for a Streamlit container that keeps the latest streamed text.
+
+    Stream handlers running on the event loop render into it; the script
+    thread copies the text to the real placeholder while it waits. Each
+    render bumps `version`, so the script thread can skip unchanged text.
+    """
+
+    def __init__(self):
+        self.text = ""
+        self.version = 0
+        self.lock = threading.Lock()
+
+    def markdown(self, text):
+        with self.lock:
+            self.text = text
+            self.version += 1
+
+    def get(self):
+        with self.lock:
+            return self.text
+
+    def changed_since(self, version):
+        """Returns (version, text), with text None if nothing was rendered since `version`."""
+        with self.lock:
+            if self.version == version:
+                return version, None
+            return self.version, self.text
+
+
+def await_turn(future, placeholder, latest, on_interrupt, poll_seconds=POLL_SECONDS,
+               idle_render_seconds=IDLE_RENDER_SECONDS, clock=time.monotonic):
+    """
+    Wait for a turn's future, rendering its streamed text to the placeholder.
+
+    The placeholder is only re-rendered when the text changed, or every
+    `idle_render_seconds` while it is unchanged. Every render is a Streamlit
+    yield point, so a rerun or stop (e.g. the Restart Session button)
+    interrupts the wait; `on_interrupt` is then called to cancel the turn
+    before the interruption propagates. `clock` times the idle interval.
+    """
+    rendered_version = 0
+    rendered_at = clock()
+
+    def render(force=False):
+        nonlocal rendered_version, rendered_at
+        version, text = latest.changed_since(rendered_version)
+        if text is None and force:
+            text = latest.get()
+        if text is not None:
+            placeholder.markdown(text)
+            rendered_version = version
+            rendered_at = clock()
+
+    try:
+        while True:
+            try:
+                result = future.result(timeout=poll_seconds)
+            except concurrent.futures.TimeoutError:
+                render(force=clock() - rendered_at >= idle_render_seconds)
+                continue
+            render()
+            return result
+    except BaseException:
+        if not future.done():
+            on_interrupt()
+        raise
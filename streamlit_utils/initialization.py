@@ -1,7 +1,12 @@
 """Initialization of the session state and models."""
+import os
+import uuid
+
 import streamlit as st
 
 from llm_utils.conversation import Conversation
+from llm_utils.response_cache import default_response_cache
+from llm_utils.survey_record import SurveyRecord
 
 
 def get_api_key(provider):
@@ -34,6 +39,13 @@ def initialize_models():
     st.session_state["sel_model_conversation"] = st.session_state["supp_models_conversation"][1]
     st.session_state["sel_model_ui"] = st.session_state["supp_models_ui"][1]
 
+    # FAKE_MODELS=fake (or replay) serves both agents from the hermetic provider for load tests.
+    fake_model = os.environ.get("FAKE_MODELS")
+    if fake_model:
+        for agent in ("conversation", "ui"):
+            st.session_state[f"supp_models_{agent}"].append(fake_model)
+            st.session_state[f"sel_model_{agent}"] = fake_model
+
 
 def initialize_session():
     """Set default values in the session state if not already initialized."""
@@ -46,14 +58,22 @@ def initialize_session():
         api_keys[provider] = get_api_key(provider)
 
     if "conversation" not in st.session_state:
-        st.session_state["conversation"] = Conversation(api_keys)
+        st.session_state["conversation"] = Conversation(
+            api_keys,
+            model_name_conv=st.session_state["sel_model_conversation"],
+            model_name_ui=st.session_state["sel_model_ui"],
+            response_cache=default_response_cache())
 
+    if "user_id" not in st.session_state:
+        st.session_state["user_id"] = str(uuid.uuid4())
     if "messages" not in st.session_state:
         st.session_state["messages"] = []
     if "conv_history" not in st.session_state:
         st.session_state["conv_history"] = []
     if "user_inputs" not in st.session_state:
         st.session_state["user_inputs"] = {}
+    if "survey_record" not in st.session_state:
+        st.session_state["survey_record"] = SurveyRecord()
 
     if 'input_text' not in st.session_state:
         st.session_state.input_text = ""
@@ -1,22 +1,66 @@
-import datetime
 import json
+import logging
+from functools import lru_cache
+from typing import NamedTuple, Optional, Tuple
 
 import streamlit as st
 
+logger = logging.getLogger(__name__)
 
-def display_ui_from_response(response, message_index, last_message_index):
-    data = json.loads(response)
+
+class UIElement(NamedTuple):
+    """Immutable UI element parsed from an assistant response."""
+    type: str
+    label: str
+    options: Tuple[str, ...] = ()
+    range: Optional[Tuple[int, int]] = None
+
+
+class UISpec(NamedTuple):
+    """Immutable, pre-parsed assistant response: title, text and UI elements."""
+    title: str
+    text: str
+    elements: Tuple[UIElement, ...]
+
+
+@lru_cache(maxsize=1024)
+def parse_ui_spec(response: str) -> Optional[UISpec]:
+    """Parses an assistant JSON response once into a UISpec, or None if it is not JSON."""
     try:
         data = json.loads(response)
-        print(f"\n {datetime.datetime.now()} - Parsed JSON:", data)
-        display_markdown(data["title"])
-        display_markdown(data["text"])
-        if "ui_elements" in data:
-            for index, element in enumerate(data["ui_elements"]):
-                display_ui_element(element, message_index,
-                                   index, last_message_index)
     except json.JSONDecodeError:
-        display_markdown(response)
+        return None
+    elements = tuple(
+        UIElement(
+            type=element["type"],
+            label=element.get("label", ""),
+            options=tuple(element.get("options", ())),
+            range=tuple(element["range"]) if element.get("range") else None,
+        )
+        for element in data.get("ui_elements", ())
+    )
+    return UISpec(data.get("title", ""), data.get("text", ""), elements)
+
+
+def message_ui_spec(message) -> Optional[UISpec]:
+    """Returns the UISpec stored on a message, parsing (and memoising) its content otherwise."""
+    spec = message.additional_kwargs.get("ui_spec")
+    if spec is None:
+        spec = parse_ui_spec(message.content)
+    return spec
+
+
+def display_ui_from_response(message, message_index, last_message_index):
+    """Renders an assistant message from its pre-parsed UI spec."""
+    spec = message_ui_spec(message)
+    if spec is None:
+        display_markdown(message.content)
+        return
+    logger.debug("Rendering message %s with %d UI elements", message_index, len(spec.elements))
+    display_markdown(spec.title)
+    display_markdown(spec.text)
+    for index, element in enumerate(spec.elements):
+        display_ui_element(element, message_index, index, last_message_index)
 
 
 def display_markdown(markdown_part):
@@ -26,21 +70,21 @@ def display_markdown(markdown_part):
 
 def display_ui_element(element, message_index, index, last_message_index):
     """Displays a single UI element based on its type and attributes."""
-    label = element.get('label', '')
-    key = f"{element['type']}_{label}_{message_index}_{index}"
+    label = element.label
+    key = f"{element.type}_{label}_{message_index}_{index}"
 
-    print(f"\n Displaying UI element: {element['type']} - {key}")
+    logger.debug("Displaying UI element: %s - %s", element.type, key)
     value = None
 
-    if element['type'] == 'Slider':
+    if element.type == 'Slider':
         value = display_slider(element, label, key)
-    elif element['type'] == 'RadioButtons':
+    elif element.type == 'RadioButtons':
         value = display_radio_buttons(element, label, key)
-    elif element['type'] == 'MultiSelect':
+    elif element.type == 'MultiSelect':
         value = display_multiselect(element, label, key)
-    elif element['type'] == 'TextInput':
+    elif element.type == 'TextInput':
         value = display_text_input(label, key)
-    elif element['type'] == 'Checkbox':
+    elif element.type == 'Checkbox':
         value = display_check_box(label, key)
 
     if message_index == last_message_index:
@@ -50,22 +94,21 @@ def display_ui_element(element, message_index, index, last_message_index):
 
 def display_slider(element, label, key):
     """Displays a slider UI element."""
-    min_value, max_value = element.get('range', [0, 100])
+    min_value, max_value = element.range or (0, 100)
     slider_value = st.slider(label, min_value, max_value, key=key)
     return slider_value
 
 
 def display_radio_buttons(element, label, key):
     """Displays radio buttons UI element."""
-    options = element.get('options', [])
-    options.append("None")
+    options = list(element.options) + ["None"]
     selected_option = st.radio(label, options, key=key)
     return selected_option
 
 
 def display_multiselect(element, label, key):
     """Displays a multi-select UI element."""
-    options = element.get('options', [])
+    options = list(element.options)
     selected_options = st.multiselect(label, options, key=key)
     return selected_options
 
@@ -0,0 +1,104 @@
+"""Tests for rendering a turn's stream from the Streamlit script thread."""
+import concurrent.futures
+
+import pytest
+
+from streamlit_utils.async_turn import LatestText, await_turn
+
+
+class RecordingPlaceholder:
+
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, text):
+        self.renders.append(text)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class ScriptedFuture:
+    """
+    A future whose `result` calls run a script instead of waiting.
+
+    Each timed-out poll runs the next step with the poll's timeout, then
+    advances the clock by it; the result is returned once the steps run out.
+    """
+
+    def __init__(self, clock, steps, result="done"):
+        self.clock = clock
+        self.steps = list(steps)
+        self.value = result
+
+    def result(self, timeout=None):
+        if not self.steps:
+            return self.value
+        self.steps.pop(0)()
+        self.clock.now += timeout
+        raise concurrent.futures.TimeoutError
+
+    def done(self):
+        return not self.steps
+
+
+def test_renders_only_changed_text():
+    clock, latest, placeholder = FakeClock(), LatestText(), RecordingPlaceholder()
+    steps = [lambda: latest.markdown("Hello"), lambda: latest.markdown("Hello there"),
+             lambda: None, lambda: None]
+    assert await_turn(ScriptedFuture(clock, steps), placeholder, latest, None,
+                      poll_seconds=0.1, idle_render_seconds=10, clock=clock) == "done"
+    assert placeholder.renders == ["Hello", "Hello there"]
+
+
+def test_text_changed_twice_between_polls_is_rendered_once():
+    clock, latest, placeholder = FakeClock(), LatestText(), RecordingPlaceholder()
+
+    def stream():
+        latest.markdown("Hello")
+        latest.markdown("Hello there")
+
+    await_turn(ScriptedFuture(clock, [stream]), placeholder, latest, None,
+               poll_seconds=0.1, idle_render_seconds=10, clock=clock)
+    assert placeholder.renders == ["Hello there"]
+
+
+def test_text_rendered_after_the_last_poll_is_rendered_on_completion():
+    clock, latest, placeholder = FakeClock(), LatestText(), RecordingPlaceholder()
+    future = ScriptedFuture(clock, [lambda: None])
+    latest.markdown("Hello")
+    await_turn(future, placeholder, latest, None, poll_seconds=0.1, clock=clock)
+    assert placeholder.renders == ["Hello"]
+
+
+def test_unchanged_text_is_re_rendered_at_the_idle_interval():
+    clock, latest, placeholder = FakeClock(), LatestText(), RecordingPlaceholder()
+    latest.markdown("Hello")
+    # Polls end at 1, 2, ..., 10 seconds; the idle interval is 3 seconds.
+    future = ScriptedFuture(clock, [lambda: None] * 10)
+    await_turn(future, placeholder, latest, None, poll_seconds=1, idle_render_seconds=3,
+               clock=clock)
+    # The first poll renders the new text, then every third unchanged poll re-renders it.
+    assert placeholder.renders == ["Hello"] * 4
+
+
+def test_interrupted_wait_cancels_the_turn():
+    clock, cancelled = FakeClock(), []
+
+    class InterruptingPlaceholder:
+        def markdown(self, text):
+            raise KeyboardInterrupt
+
+    latest = LatestText()
+    latest.markdown("Hello")
+    future = ScriptedFuture(clock, [lambda: None] * 2)
+    with pytest.raises(KeyboardInterrupt):
+        await_turn(future, InterruptingPlaceholder(), latest, lambda: cancelled.append(True),
+                   poll_seconds=0.1, clock=clock)
+    assert cancelled == [True]
@@ -0,0 +1,70 @@
+"""Tests for the process-wide config and example registry."""
+import copy
+import json
+
+import pytest
+
+from llm_utils.config_loader import (REGISTRY, file_read_count, freeze, shared_config,
+                                     shared_examples)
+
+EXAMPLE_FILES = ('configs/few_shot_examples.json', 'configs/acting_examples.json',
+                 'configs/reasoning_examples.json')
+
+
+def test_freeze_rejects_nested_mutation():
+    config = freeze({"rate_limits": {"fake": {"requests_per_minute": 60}}, "k": [1, 2]})
+    with pytest.raises(TypeError):
+        config["rate_limits"]["fake"]["requests_per_minute"] = 1
+    with pytest.raises(TypeError):
+        config["rate_limits"].update(extra={})
+    with pytest.raises(TypeError):
+        config["k"].append(3)
+
+
+def test_frozen_data_formats_like_the_loaded_json():
+    data = {"output": {"title": "Home", "ui_elements": [{"type": "Checkbox"}]}}
+    frozen = freeze(data)
+    assert str(frozen) == str(data)
+    assert json.dumps(frozen) == json.dumps(data)
+    thawed = copy.deepcopy(frozen)
+    thawed["output"]["ui_elements"].append({})
+    assert len(frozen["output"]["ui_elements"]) == 1
+
+
+def test_shared_config_is_frozen_at_every_level():
+    config = shared_config()
+    with pytest.raises(TypeError):
+        config["fake_model"]["token_latency"] = 0
+    with pytest.raises(TypeError):
+        config["rate_limits"]["gpt-4-turbo"]["tokens_per_minute"] = 0
+    with pytest.raises(TypeError):
+        shared_examples(*EXAMPLE_FILES)[0]["output"]["ui_elements"].clear()
+
+
+def test_warm_registry_reads_no_files():
+    REGISTRY.clear()
+    shared_config()
+    shared_examples(*EXAMPLE_FILES)
+    reads = file_read_count()
+    assert shared_config() is shared_config()
+    shared_examples(*EXAMPLE_FILES)
+    assert file_read_count() == reads
+
+
+def test_second_session_reads_no_files():
+    pytest.importorskip("langchain")
+    from llm_utils.conversation import Conversation
+
+    Conversation({}, "fake", "fake")
+    reads = file_read_count()
+    Conversation({}, "fake", "fake")
+    assert file_read_count() == reads
+
+
+def test_example_index_is_built_once():
+    pytest.importorskip("langchain_core")
+    from llm_utils.config_loader import shared_example_index
+
+    index = shared_example_index(*EXAMPLE_FILES)
+    assert shared_example_index(*EXAMPLE_FILES) is index
+    assert len(index.examples) == len(shared_examples(*EXAMPLE_FILES))
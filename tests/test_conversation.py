@@ -0,0 +1,128 @@
+"""Tests for running survey turns through Conversation with the fake model provider."""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import HumanMessage
+
+from llm_utils.conversation import Conversation
+from llm_utils.response_cache import InMemoryResponseCache
+from llm_utils.stream_handler import StreamUntilSpecialTokenHandler
+from llm_utils.tracing import RingBufferSink, Tracer
+
+INTAKE = "Neighbourhood: Agincourt North (129) - Assault: Low, Auto Theft: Medium"
+NO_LATENCY = {"first_token_latency": 0.0, "token_latency": 0.0}
+
+
+class RecordingPlaceholder:
+
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, text):
+        self.renders.append(text)
+
+
+def record_ui_inputs(conversation):
+    """Wraps the UI agent so the messages it is given are kept in the returned list."""
+    inputs = []
+    ui_agent = conversation.ui_agent
+    call, ainvoke = ui_agent.__call__, ui_agent.ainvoke
+
+    class RecordingUIAgent:
+        system_prompt = ui_agent.system_prompt
+
+        def __call__(self, message):
+            inputs.append(message)
+            return call(message)
+
+        async def ainvoke(self, message):
+            inputs.append(message)
+            return await ainvoke(message)
+
+    conversation.ui_agent = RecordingUIAgent()
+    return inputs
+
+
+@pytest.mark.parametrize("pipeline_ui", [False, True])
+def test_ui_agent_is_given_only_the_suffix(pipeline_ui):
+    conversation = Conversation({}, "fake", "fake", fake_model_options=NO_LATENCY,
+                                pipeline_ui=pipeline_ui)
+    inputs = record_ui_inputs(conversation)
+    handler = StreamUntilSpecialTokenHandler(RecordingPlaceholder())
+
+    textual_response, json_response = conversation(HumanMessage(content=INTAKE), handler)
+
+    prefix, suffix = textual_response.split("␃", 1)
+    assert inputs == [f"␃{suffix}"]
+    assert json.loads(json_response)["text"] == prefix
+    assert conversation.last_timings["pipelined"] is pipeline_ui
+    assert set(conversation.last_timings) >= {"conversational", "ui", "total", "saved"}
+
+
+def test_pipelined_async_turn_matches_the_sequential_one():
+    responses = []
+    for pipeline_ui in (False, True):
+        conversation = Conversation({}, "fake", "fake", fake_model_options=NO_LATENCY,
+                                    pipeline_ui=pipeline_ui)
+        handler = StreamUntilSpecialTokenHandler(RecordingPlaceholder())
+        responses.append(asyncio.run(conversation.acall(HumanMessage(content=INTAKE), handler)))
+        assert conversation.last_timings["pipelined"] is pipeline_ui
+        assert not conversation.tasks
+    assert responses[0] == responses[1]
+
+
+def test_suffix_hook_runs_once_after_the_stream():
+    suffixes = []
+    handler = StreamUntilSpecialTokenHandler(RecordingPlaceholder())
+    handler.on_suffix_ready = suffixes.append
+    for token in ["Risks are low. ", "␃", " Which", " crime types?"]:
+        handler.on_llm_new_token(token)
+    assert suffixes == []
+    handler.on_llm_end(None)
+    handler.on_llm_end(None)
+    assert suffixes == [" Which crime types?"]
+
+
+def test_cached_intake_turn_skips_both_agents():
+    cache = InMemoryResponseCache()
+    first = Conversation({}, "fake", "fake", response_cache=cache, fake_model_options=NO_LATENCY)
+    expected = first(HumanMessage(content=INTAKE),
+                     StreamUntilSpecialTokenHandler(RecordingPlaceholder()))
+    assert cache.stats() == {"hits": 0, "misses": 1}
+
+    conversation = Conversation({}, "fake", "fake", response_cache=cache,
+                                fake_model_options=NO_LATENCY)
+
+    def unexpected_call(*args, **kwargs):
+        raise AssertionError("a cached turn must not call an agent")
+
+    conversation.conversational_agent.chain = unexpected_call
+    conversation.ui_agent = unexpected_call
+    placeholder = RecordingPlaceholder()
+    handler = StreamUntilSpecialTokenHandler(placeholder)
+    tracer = Tracer([RingBufferSink()])
+    with tracer.turn("survey") as trace:
+        assert conversation(HumanMessage(content=INTAKE), handler) == tuple(expected)
+
+    assert cache.stats() == {"hits": 1, "misses": 1}
+    assert trace.metrics["cache_hit"] is True
+    assert conversation.last_timings["cached"] is True
+    assert placeholder.renders[-1] == expected[0].split("␃")[0]
+    # The cached turn is remembered, so the next turn is not served from the cache.
+    assert [message.content for message in conversation.conversational_agent.memory] == [
+        INTAKE, expected[0]]
+    assert conversation.first_turn_cache_key(HumanMessage(content=INTAKE)) is None
+
+
+def test_later_turns_are_not_cached():
+    cache = InMemoryResponseCache()
+    conversation = Conversation({}, "fake", "fake", response_cache=cache,
+                                fake_model_options=NO_LATENCY)
+    for content in (INTAKE, "I mostly walk."):
+        conversation(HumanMessage(content=content),
+                     StreamUntilSpecialTokenHandler(RecordingPlaceholder()))
+    assert len(cache.entries) == 1
@@ -0,0 +1,28 @@
+"""Tests for resolving coordinates to neighbourhood polygons."""
+import pytest
+
+shapely = pytest.importorskip("shapely")
+
+from llm_utils.neighbourhood_resolver import NeighbourhoodResolver  # noqa: E402
+
+
+def make_resolver():
+    # Three neighbouring squares; x is the longitude and y the latitude.
+    boxes = [shapely.box(0, 0, 1, 1), shapely.box(1, 0, 2, 1), shapely.box(0, 1, 2, 2)]
+    return NeighbourhoodResolver(boxes, ["West (1)", "East (2)", "North (3)"], [1, 2, 3])
+
+
+def test_resolves_points_inside_and_outside():
+    resolver = make_resolver()
+    assert resolver.resolve(0.5, 1.5) == {"AREA_DE8": "East (2)", "AREA_ID": 2}
+    assert resolver.resolve(5, 5) is None
+
+
+def test_border_points_resolve_to_the_lowest_polygon_index():
+    resolver = make_resolver()
+    lats = [0.5, 1.0, 1.0, 0.5] * 50
+    lons = [1.0, 1.0, 0.5, 0.2] * 50
+    assert resolver.resolve_indices(lats, lons).tolist() == [0, 0, 0, 0] * 50
+    names, area_ids = resolver.resolve_many([1.0, 3.0], [1.5, 1.5])
+    assert names.tolist() == ["East (2)", None]
+    assert area_ids.tolist() == [2, -1]
@@ -0,0 +1,42 @@
+"""Tests for the staleness checks and soft failures of the offline-built stores."""
+import os
+
+import pytest
+
+from llm_utils.offline_store import StoreUnavailable, source_is_current, source_stamp
+
+
+def test_unchanged_source_is_not_hashed(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"data")
+    meta = {"source_hash": "built", "source_stamp": source_stamp([source])}
+    assert source_is_current(meta, [source], lambda: pytest.fail("hashed an unchanged source"))
+
+
+def test_touched_source_falls_back_to_the_hash(tmp_path):
+    source = tmp_path / "source.bin"
+    source.write_bytes(b"data")
+    meta = {"source_hash": "built", "source_stamp": source_stamp([source])}
+    os.utime(source, ns=(0, 0))
+    assert source_is_current(meta, [source], lambda: "built")
+    assert not source_is_current(meta, [source], lambda: "changed")
+
+
+def test_store_without_its_source_is_trusted(tmp_path):
+    assert source_is_current({}, [tmp_path / "missing.bin"], lambda: "changed")
+
+
+def test_missing_geometry_cache_is_unavailable(tmp_path):
+    pytest.importorskip("numpy")
+    from llm_utils.geometry_cache import GeometryCache
+
+    with pytest.raises(StoreUnavailable):
+        GeometryCache(tmp_path)
+
+
+def test_missing_profile_store_is_unavailable(tmp_path):
+    pytest.importorskip("numpy")
+    from llm_utils.neighbourhood_profiles import NeighbourhoodProfiles
+
+    with pytest.raises(StoreUnavailable):
+        NeighbourhoodProfiles(tmp_path)
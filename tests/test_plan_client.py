@@ -0,0 +1,125 @@
+"""Tests for the plan service client against a local stub server."""
+import json
+import threading
+import time
+from collections import defaultdict, deque
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+requests = pytest.importorskip("requests")
+
+from llm_utils.plan_client import PlanServiceClient  # noqa: E402
+
+
+class StubPlanService(ThreadingHTTPServer):
+    """Serves scripted (status, body, delay) responses per endpoint and counts the requests."""
+
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StubHandler)
+        self.scripts = defaultdict(deque)
+        self.requests = defaultdict(int)
+
+    def script(self, endpoint, *responses):
+        self.scripts[endpoint].extend(responses)
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server_address[1]}"
+
+
+class StubHandler(BaseHTTPRequestHandler):
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers.get("Content-Length", 0)))
+        endpoint = self.path.strip("/")
+        self.server.requests[endpoint] += 1
+        script = self.server.scripts[endpoint]
+        status, body, delay = script.popleft() if len(script) > 1 else script[0]
+        time.sleep(delay)
+        data = json.dumps(body).encode("utf-8")
+        try:
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+        except OSError:
+            pass  # the client gave up on this request
+
+    def log_message(self, *args):
+        pass
+
+
+@pytest.fixture
+def service():
+    server = StubPlanService()
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server
+    server.shutdown()
+    server.server_close()
+
+
+def make_client(service, **options):
+    options = {"retries": 2, "backoff": 0.01, "max_backoff": 0.02, **options}
+    return PlanServiceClient(service.url, **options)
+
+
+def test_retries_server_errors_until_success(service):
+    service.script("getPlan", (500, {}, 0), (502, {}, 0), (200, {"success": True}, 0))
+    assert make_client(service).get_plan("id") == {"success": True}
+    assert service.requests["getPlan"] == 3
+
+
+def test_retries_rate_limited_plan_request(service):
+    service.script("plan", (429, {}, 0), (200, {"success": True}, 0))
+    assert make_client(service).send_plan({}, "id") == {"success": True}
+    assert service.requests["plan"] == 2
+
+
+def test_gives_up_when_retries_run_out(service):
+    service.script("getPlan", (503, {}, 0))
+    with pytest.raises(requests.exceptions.HTTPError):
+        make_client(service).get_plan("id")
+    assert service.requests["getPlan"] == 3
+
+
+def test_gives_up_at_the_deadline(service):
+    service.script("getPlan", (200, {"success": True}, 1.0))
+    client = make_client(service, read_timeout=30)
+    start = time.monotonic()
+    with pytest.raises(requests.exceptions.Timeout):
+        client.get_plan("id", deadline=start + 0.3)
+    assert time.monotonic() - start < 0.8
+
+
+def test_no_call_after_the_deadline(service):
+    service.script("getPlan", (200, {"success": True}, 0))
+    with pytest.raises(requests.exceptions.Timeout):
+        make_client(service).get_plan("id", deadline=time.monotonic() - 1)
+    assert service.requests["getPlan"] == 0
+
+
+def test_plan_request_not_repeated_after_read_timeout(service):
+    service.script("plan", (200, {"success": True}, 0.5))
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        make_client(service, read_timeout=0.1).send_plan({}, "id")
+    time.sleep(0.6)
+    assert service.requests["plan"] == 1
+
+
+def test_plan_request_not_repeated_after_server_error(service):
+    service.script("plan", (500, {}, 0), (200, {"success": True}, 0))
+    with pytest.raises(requests.exceptions.HTTPError):
+        make_client(service).send_plan({}, "id")
+    assert service.requests["plan"] == 1
+
+
+def test_retries_refused_connections():
+    client = PlanServiceClient("http://127.0.0.1:9", retries=1, backoff=0.01)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        client.send_plan({}, "id")
+    assert client.latency_stats()["plan"]["count"] == 2
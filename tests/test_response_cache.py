@@ -0,0 +1,92 @@
+"""Tests for the first-turn response cache backends."""
+import pytest
+
+from llm_utils.response_cache import (InMemoryResponseCache, ResponseCache,
+                                      SQLiteResponseCache, make_cache_key)
+
+
+class FakeClock:
+
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def make_cache(request, tmp_path):
+    def make(**options):
+        if request.param == "memory":
+            return InMemoryResponseCache(**options)
+        return SQLiteResponseCache(str(tmp_path / "responses.db"), **options)
+    return make
+
+
+def test_round_trips_values_and_counts_hits_and_misses(make_cache):
+    cache = make_cache()
+    assert cache.get("key") is None
+    cache.set("key", ["text", '{"title": "Home"}'])
+    assert cache.get("key") == ["text", '{"title": "Home"}']
+    assert cache.get("other") is None
+    assert cache.stats() == {"hits": 1, "misses": 2}
+
+
+def test_entries_expire_after_the_ttl(make_cache):
+    clock = FakeClock()
+    cache = make_cache(ttl=60, clock=clock)
+    cache.set("key", "value")
+    clock.now += 60
+    assert cache.get("key") == "value"
+    clock.now += 1
+    assert cache.get("key") is None
+    assert cache.stats() == {"hits": 1, "misses": 1}
+
+
+def test_setting_a_key_again_restarts_its_ttl(make_cache):
+    clock = FakeClock()
+    cache = make_cache(ttl=60, clock=clock)
+    cache.set("key", "old")
+    clock.now += 50
+    cache.set("key", "new")
+    clock.now += 50
+    assert cache.get("key") == "new"
+
+
+def test_sqlite_cache_persists_across_instances(tmp_path):
+    path = str(tmp_path / "responses.db")
+    SQLiteResponseCache(path).set("key", {"title": "Home"})
+    assert SQLiteResponseCache(path).get("key") == {"title": "Home"}
+
+
+def test_least_recently_used_entry_is_evicted():
+    cache = InMemoryResponseCache(maxsize=2)
+    cache.set("a", 1)
+    cache.set("b", 2)
+    assert cache.get("a") == 1
+    cache.set("c", 3)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1
+    assert cache.get("c") == 3
+
+
+def test_expired_entry_is_dropped_from_memory():
+    clock = FakeClock()
+    cache = InMemoryResponseCache(ttl=1, clock=clock)
+    cache.set("key", "value")
+    clock.now += 2
+    cache.get("key")
+    assert "key" not in cache.entries
+
+
+def test_base_class_needs_a_backend():
+    with pytest.raises(TypeError):
+        ResponseCache()
+
+
+def test_cache_key_depends_on_every_part():
+    key = make_cache_key("gpt-4-turbo/gpt-4-turbo", "hash", "Agincourt North")
+    assert key == make_cache_key("gpt-4-turbo/gpt-4-turbo", "hash", "Agincourt North")
+    assert key != make_cache_key("gpt-4-turbo/gpt-4-turbo", "other", "Agincourt North")
+    assert key != make_cache_key("gpt-4-turbo/gpt-4-turbo", "hash", "Agincourt South")
+    assert key != make_cache_key("fake/fake", "hash", "Agincourt North")
@@ -0,0 +1,33 @@
+"""Tests for the shared neighbourhood risk index."""
+import os
+
+from llm_utils.risk_index import get_risk_index
+
+HEADER = "Neighbourhood,Offence Group,Safety Risk\n"
+
+
+def write_csv(path, rows, mtime):
+    path.write_text(HEADER + "".join(f"{row}\n" for row in rows), encoding="utf-8")
+    os.utime(path, (mtime, mtime))
+    return path
+
+
+def test_files_with_the_same_mtime_get_their_own_index(tmp_path):
+    first = write_csv(tmp_path / "first.csv", ["Agincourt North,Assault,Low"], 1_000_000)
+    second = write_csv(tmp_path / "second.csv", ["Bayview Village,Robbery,High"], 1_000_000)
+    assert get_risk_index(first).names == ["Agincourt North"]
+    assert get_risk_index(second).names == ["Bayview Village"]
+    assert get_risk_index(first).get("Agincourt North") == (("Assault", "Low"),)
+
+
+def test_index_is_shared_until_the_mtime_changes(tmp_path):
+    path = write_csv(tmp_path / "risks.csv", ["Agincourt North,Assault,Low"], 1_000_000)
+    index = get_risk_index(path)
+    assert get_risk_index(str(path)) is index
+
+    write_csv(path, ["Agincourt North,Assault,High", "Agincourt North,Robbery,Low"], 1_000_001)
+    rebuilt = get_risk_index(path)
+    assert rebuilt is not index
+    assert rebuilt.get("Agincourt North") == (("Assault", "High"), ("Robbery", "Low"))
+    assert rebuilt.describe("Agincourt North") == (
+        "Neighbourhood: Agincourt North - Assault: High, Robbery: Low")
@@ -0,0 +1,46 @@
+"""Tests for the background rendering of the risk maps."""
+import pytest
+
+from llm_utils import risk_maps
+
+
+@pytest.fixture
+def failing_render(monkeypatch):
+    calls = []
+
+    def render(cache_dir, version):
+        calls.append(version)
+        raise RuntimeError("no matplotlib")
+
+    monkeypatch.setattr(risk_maps, "get_geometry_cache", lambda: object())
+    monkeypatch.setattr(risk_maps, "data_version", lambda geometry: "v1")
+    monkeypatch.setattr(risk_maps, "render_risk_maps", render)
+    for name, value in (("_version", None), ("_render_thread", None),
+                        ("_render_failures", 0), ("_render_retry_at", 0.0)):
+        monkeypatch.setattr(risk_maps, name, value)
+    return calls
+
+
+def render_and_wait(offence, cache_dir):
+    path = risk_maps.risk_map_path(offence, cache_dir)
+    if risk_maps._render_thread is not None:
+        risk_maps._render_thread.join()
+    return path
+
+
+def test_failed_render_shows_the_fallback_until_the_back_off_ends(failing_render, tmp_path):
+    assert render_and_wait("Assault", tmp_path) is None
+    for _ in range(5):
+        assert render_and_wait("Assault", tmp_path) == risk_maps.FALLBACK_MAP
+    assert failing_render == ["v1"]
+
+    risk_maps._render_retry_at = 0.0
+    assert render_and_wait("Assault", tmp_path) is None
+    assert len(failing_render) == 2
+    assert risk_maps._render_failures == 2
+
+
+def test_missing_geometry_shows_the_fallback(monkeypatch, tmp_path):
+    monkeypatch.setattr(risk_maps, "get_geometry_cache", lambda: None)
+    assert risk_maps.risk_map_path("Assault", tmp_path) == risk_maps.FALLBACK_MAP
+    assert risk_maps.FALLBACK_MAP.exists()
@@ -0,0 +1,106 @@
+"""Tests for the model call scheduler's rate limits and priorities."""
+import asyncio
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from langchain_core.messages import HumanMessage
+
+from llm_utils.fake_models import FakeChatModel
+from llm_utils.memory import count_message_tokens
+from llm_utils.scheduler import (BACKGROUND, DEFAULT_COMPLETION_TOKENS, INTERACTIVE, FakeClock,
+                                 RequestScheduler, ScheduledChatModel, TokenBucket,
+                                 busiest_minute)
+
+LIMITS = {"requests_per_minute": 30, "tokens_per_minute": 6000}
+
+
+def run_backlog(calls, tokens):
+    """Grants a backlog of calls as soon as the buckets allow; returns their (start, tokens)."""
+    clock = FakeClock()
+    scheduler = RequestScheduler({"model": LIMITS}, {"model": calls}, clock)
+    tickets = [scheduler.submit("model", tokens) for _ in range(calls)]
+    while any(ticket.granted is None for ticket in tickets):
+        clock.now += min(ticket.retry_after for ticket in tickets
+                         if ticket.granted is None and ticket.retry_after)
+        scheduler.dispatch()
+    return [(ticket.granted, ticket.tokens) for ticket in tickets]
+
+
+@pytest.mark.parametrize("tokens", [50, 400, 1000])
+def test_no_minute_exceeds_the_limits(tokens):
+    requests, used = busiest_minute(run_backlog(60, tokens))
+    assert requests <= LIMITS["requests_per_minute"]
+    assert used <= LIMITS["tokens_per_minute"]
+
+
+def test_full_bucket_and_a_minute_of_refill_make_the_limit():
+    bucket = TokenBucket(600, FakeClock())
+    assert bucket.capacity + bucket.rate * 60 == pytest.approx(600)
+
+
+def test_rejects_a_burst_of_a_whole_minute():
+    with pytest.raises(ValueError):
+        TokenBucket(600, FakeClock(), burst_seconds=60)
+
+
+def test_interactive_calls_are_granted_before_background_calls():
+    scheduler = RequestScheduler(concurrency={"fake": 1}, clock=FakeClock())
+    running = scheduler.submit("fake", 10, BACKGROUND)
+    queued = [scheduler.submit("fake", 10, priority)
+              for priority in (BACKGROUND, INTERACTIVE, BACKGROUND, INTERACTIVE)]
+    assert running.granted is not None
+    assert all(ticket.granted is None for ticket in queued)
+
+    order = []
+    current = running
+    for _ in queued:
+        scheduler.release(current)
+        (current,) = [ticket for ticket in queued
+                      if ticket.granted is not None and ticket not in order]
+        order.append(current)
+    assert [ticket.priority for ticket in order] == [
+        INTERACTIVE, INTERACTIVE, BACKGROUND, BACKGROUND]
+    # First come first served within a priority.
+    assert order == [queued[1], queued[3], queued[0], queued[2]]
+
+
+def test_scheduled_model_charges_the_tokens_it_used():
+    clock = FakeClock()
+    scheduler = RequestScheduler({"fake": {"tokens_per_minute": 6000}}, {"fake": 1}, clock)
+    messages = [HumanMessage(content="How safe is my street?")]
+    model = ScheduledChatModel(model=FakeChatModel(responses=["Quite safe."]),
+                               model_name="fake", scheduler=scheduler)
+
+    assert model.invoke(messages).content == "Quite safe."
+
+    token_bucket = scheduler.model_buckets("fake")[1]
+    estimated = count_message_tokens(messages) + DEFAULT_COMPLETION_TOKENS
+    used = ScheduledChatModel.used_tokens(messages, "Quite safe.")
+    assert used < estimated
+    # The estimate was taken up front and the unused part given back on release.
+    assert token_bucket.level == pytest.approx(token_bucket.capacity - used)
+    assert scheduler.running["fake"] == 0
+    assert scheduler.snapshot()["waits"]["interactive"]["count"] == 1
+
+
+def test_scheduled_model_waits_for_its_priority():
+    scheduler = RequestScheduler(concurrency={"fake": 1})
+    stub = FakeChatModel(responses=["ok"], first_token_latency=0.01)
+    models = {priority: ScheduledChatModel(model=stub, model_name="fake", priority=priority,
+                                           scheduler=scheduler)
+              for priority in (INTERACTIVE, BACKGROUND)}
+    finished = []
+
+    async def call(priority):
+        await models[priority].ainvoke([HumanMessage(content="hi")])
+        finished.append(priority)
+
+    async def run():
+        # The first background call takes the slot; the rest queue behind it.
+        await asyncio.gather(*[call(BACKGROUND) for _ in range(3)],
+                             *[call(INTERACTIVE) for _ in range(3)])
+
+    asyncio.run(run())
+    assert finished == [BACKGROUND] + [INTERACTIVE] * 3 + [BACKGROUND] * 2
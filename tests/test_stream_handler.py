@@ -0,0 +1,63 @@
+"""Tests for finding the special token in streamed chunks."""
+import pytest
+
+pytest.importorskip("langchain")
+
+from llm_utils.stream_handler import SpecialTokenScanner, StreamUntilSpecialTokenHandler
+
+
+class RecordingPlaceholder:
+
+    def __init__(self):
+        self.renders = []
+
+    def markdown(self, text):
+        self.renders.append(text)
+
+
+def scan(chunks, special_token="␃"):
+    scanner = SpecialTokenScanner(special_token)
+    emitted = [scanner.feed(chunk) for chunk in chunks]
+    emitted.append(scanner.finish())
+    return scanner, "".join(emitted)
+
+
+def test_token_split_across_chunks():
+    scanner, emitted = scan(["ab<E", "N", "D>tail"], special_token="<END>")
+    assert scanner.found
+    assert scanner.prefix_text == "ab" == emitted
+    assert scanner.suffix_text == "tail"
+
+
+def test_token_merged_with_text():
+    scanner, emitted = scan(["Hello wor", "ld ␃", "{...}"])
+    assert scanner.found
+    assert scanner.prefix_text == "Hello world " == emitted
+    assert scanner.suffix_text == "{...}"
+
+
+def test_partial_match_is_held_back_until_ruled_out():
+    scanner = SpecialTokenScanner("<END>")
+    assert scanner.feed("ab<E") == "ab"
+    assert scanner.feed("X") == "<EX"
+    assert scanner.finish() == ""
+    assert not scanner.found
+    assert scanner.prefix_text == "ab<EX"
+
+
+def test_held_back_text_is_released_when_the_stream_ends():
+    scanner, emitted = scan(["ab<EN"], special_token="<END>")
+    assert not scanner.found
+    assert emitted == scanner.prefix_text == "ab<EN"
+    assert scanner.suffix_text == ""
+
+
+def test_handler_streams_only_the_text_before_the_token():
+    placeholder = RecordingPlaceholder()
+    handler = StreamUntilSpecialTokenHandler(placeholder)
+    for token in ["Hello wor", "ld ␃", "{...}"]:
+        handler.on_llm_new_token(token)
+    handler.on_llm_end(None)
+    assert placeholder.renders[-1] == "Hello world "
+    assert all("␃" not in text and "{" not in text for text in placeholder.renders)
+    assert handler.get_split_response() == ("Hello world ", "{...}")
@@ -0,0 +1,99 @@
+"""Tests for repairing and re-querying UI agent responses with a stub model."""
+import asyncio
+import json
+
+import pytest
+
+pytest.importorskip("langchain_core")
+
+from llm_utils.agents import UIAgent
+from llm_utils.fake_models import FakeChatModel
+from llm_utils.tracing import RingBufferSink, Tracer
+
+SUFFIX = "␃ How do you usually travel around your neighbourhood?"
+CHECKBOX = {"type": "Checkbox", "label": "Do you walk at night?"}
+RADIO = {"type": "RadioButtons", "label": "Commute", "options": ["Car", "Transit"]}
+VALID = json.dumps({"title": "Commute", "ui_elements": [CHECKBOX, RADIO]})
+
+
+class RecordingModel(FakeChatModel):
+    """FakeChatModel that keeps the prompt of every call."""
+
+    prompts: list = []
+
+    def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+        self.prompts.append(messages[-1].content)
+        return super()._generate(messages, stop, run_manager, **kwargs)
+
+
+def run_turn(responses):
+    """Runs the UI agent on the suffix; returns its output, stats, prompts and trace metrics."""
+    model = RecordingModel(responses=responses, prompts=[])
+    agent = UIAgent(model)
+    tracer = Tracer([RingBufferSink()])
+    with tracer.turn("survey") as trace:
+        output = agent(SUFFIX)
+    return output, agent.last_stats, model.prompts, trace.metrics
+
+
+def test_valid_response_needs_one_call():
+    output, stats, prompts, metrics = run_turn([VALID])
+    assert output == json.loads(VALID)
+    assert len(prompts) == 1
+    assert not stats["strict_parse_failed"]
+    assert "ui_round_trips_saved" not in metrics
+
+
+def test_repairable_response_is_not_requeried():
+    fenced = f"```json\n{VALID[:-1]},\n```"
+    output, stats, prompts, metrics = run_turn([fenced])
+    assert output == json.loads(VALID)
+    assert len(prompts) == 1
+    assert metrics["ui_round_trips_saved"] == 1
+    assert metrics["ui_partial_requeries"] == 0
+    assert metrics["ui_retries"] == 0
+
+
+def test_missing_elements_are_requeried_with_the_elements_prompt():
+    truncated = VALID[:VALID.index('{"type": "RadioButtons"') + 10]
+    output, stats, prompts, metrics = run_turn([truncated, json.dumps([CHECKBOX, RADIO])])
+    assert output == {"title": "Commute", "ui_elements": [CHECKBOX, RADIO]}
+    assert len(prompts) == 2
+    # Only the elements prompt is sent again, naming what already exists.
+    assert prompts[1].startswith("Convert only the text after ␃ into UI elements.")
+    assert 'Checkbox "Do you walk at night?"' in prompts[1]
+    assert stats["partial_requeries"] == 1 and stats["full_retries"] == 0
+    assert metrics["ui_partial_requeries"] == 1
+    assert metrics["ui_round_trips_saved"] == 0
+
+
+def test_missing_title_is_requeried_with_the_title_prompt():
+    no_title = json.dumps({"ui_elements": [CHECKBOX, RADIO]})
+    output, stats, prompts, metrics = run_turn([no_title, "Getting around safely"])
+    assert output == {"title": "Getting around safely", "ui_elements": [CHECKBOX, RADIO]}
+    assert len(prompts) == 2
+    assert prompts[1].startswith("Write a short title")
+    assert metrics["ui_partial_requeries"] == 1
+
+
+def test_response_with_nothing_to_salvage_is_retried_in_full():
+    output, stats, prompts, metrics = run_turn(["Sorry, I cannot help with that.", VALID])
+    assert output == json.loads(VALID)
+    assert len(prompts) == 2
+    assert prompts[1] == prompts[0]
+    assert stats["full_retries"] == 1 and stats["partial_requeries"] == 0
+    assert metrics["ui_retries"] == 1
+    assert metrics["ui_round_trips_saved"] == 0
+
+
+def test_requeries_are_bounded():
+    output, stats, prompts, metrics = run_turn(["No JSON here."])
+    assert output == {"title": "", "ui_elements": []}
+    assert len(prompts) == 1 + UIAgent.max_requeries
+
+
+def test_async_path_takes_the_same_steps():
+    model = RecordingModel(responses=[json.dumps({"ui_elements": [CHECKBOX]}), "Night walks"],
+                           prompts=[])
+    output = asyncio.run(UIAgent(model).ainvoke(SUFFIX))
+    assert output == {"title": "Night walks", "ui_elements": [CHECKBOX]}
@@ -0,0 +1,85 @@
+"""Tests for salvaging UI agent responses from malformed JSON."""
+import json
+
+import pytest
+
+pytest.importorskip("pydantic")
+
+from llm_utils.ui_repair import (PartialDict, PartialList, PartialStr, is_complete,
+                                 salvage_output, tolerant_loads, validate_element)
+
+CHECKBOX = {"type": "Checkbox", "label": "Do you walk at night?"}
+RADIO = {"type": "RadioButtons", "label": "Commute", "options": ["Car", "Transit"]}
+
+
+def test_parses_fenced_json_with_surrounding_text():
+    text = 'Here is the UI:\n```json\n{"title": "Home", "ui_elements": []}\n```\nDone.'
+    assert tolerant_loads(text) == {"title": "Home", "ui_elements": []}
+
+
+def test_accepts_trailing_commas():
+    assert tolerant_loads('{"options": ["Car", "Transit",], "n": 1,}') == {
+        "options": ["Car", "Transit"], "n": 1}
+
+
+def test_accepts_single_quotes():
+    assert tolerant_loads("{'title': 'It\\'s late', 'ok': true}") == {
+        "title": "It's late", "ok": True}
+
+
+def test_marks_truncated_values_as_partial():
+    data = tolerant_loads('{"title": "Home", "ui_elements": [{"type": "Checkbox", "label": "Do yo')
+    assert isinstance(data, PartialDict)
+    assert data["title"] == "Home" and is_complete(data["title"])
+    elements = data["ui_elements"]
+    assert isinstance(elements, PartialList)
+    assert isinstance(elements[0]["label"], PartialStr)
+    assert not is_complete(elements[0])
+
+
+def test_returns_none_without_json():
+    assert tolerant_loads("No UI this time.") is None
+
+
+@pytest.mark.parametrize("element", [
+    None,
+    "Checkbox",
+    {"type": "TextInput", "label": "Name"},
+    {"type": "RadioButtons", "label": "Commute", "options": ["Car"]},
+    {"type": "Slider", "label": "Rate", "range": [1]},
+    PartialDict(CHECKBOX),
+])
+def test_rejects_invalid_elements(element):
+    assert validate_element(element) is None
+
+
+def test_keeps_valid_elements():
+    assert validate_element(dict(RADIO)) == RADIO
+
+
+def test_salvage_drops_invalid_elements_and_reports_them_missing():
+    invalid = {"type": "RadioButtons", "label": "Only one", "options": ["Car"]}
+    text = json.dumps({"title": "Commute", "ui_elements": [CHECKBOX, invalid, RADIO]})
+    output, missing = salvage_output(text)
+    assert output == {"title": "Commute", "ui_elements": [CHECKBOX, RADIO]}
+    assert missing == ["ui_elements"]
+
+
+def test_salvage_of_a_truncated_response_keeps_the_complete_elements():
+    text = '{"title": "Commute", "ui_elements": [{"type": "Checkbox", "label": "Do you walk at night?"}, {"type": "Rad'
+    output, missing = salvage_output(text)
+    assert output == {"title": "Commute", "ui_elements": [CHECKBOX]}
+    assert missing == ["ui_elements"]
+
+
+def test_salvage_of_a_list_cut_off_between_elements_is_complete():
+    output, missing = salvage_output('{"title": "Commute", "ui_elements": [{"type": "Checkbox", '
+                                     '"label": "Do you walk at night?"}, ')
+    assert output["ui_elements"] == [CHECKBOX]
+    assert missing == []
+
+
+def test_salvage_reports_a_missing_title():
+    output, missing = salvage_output('[{"type": "Checkbox", "label": "Do you walk at night?"}]')
+    assert output == {"title": "", "ui_elements": [CHECKBOX]}
+    assert missing == ["title"]